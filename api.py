@@ -0,0 +1,329 @@
+"""
+JSON API (version 1) of the MovieWeb application for the SPA and mobile clients.
+Built on the same data manager operations as the HTML pages. Reads of users, movie
+lists, statistics and movies get ETags and are served from the page cache while the
+collection is unchanged (see app.conditional_page). ?fields=title,year selects the movie
+fields, so plot and comment are neither loaded nor serialized unless a client asks for
+them. Title autocompletion is served from memory (see autocomplete).
+Bulk created movies are saved at once and enriched from OMDb in the background, a
+request never waits for OMDb. Batches of rating/comment changes and deletes are applied
+with set based statements, one transaction for the updates and one for the deletes.
+orjson is used for serialization if it is installed.
+"""
+
+import json
+import math
+
+from flask import abort, Blueprint, current_app, request
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library is used instead
+    orjson = None
+
+from app import (conditional_page, get_autocomplete, get_data_manager, get_enrichment_worker,
+                 limit_requests)
+from autocomplete import MAX_SUGGESTIONS
+from bulk_import import clean_row, ENRICHABLE_FIELDS
+from data_manager.sqlalchemy_data_manager import title_key
+from models import ALL_USERS
+from rate_limit import RateLimited
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MOVIE_FIELDS = ('id', 'user_id', 'title', 'director', 'writer', 'actors', 'year', 'rating',
+                'genre', 'runtime', 'plot', 'comment', 'enrichment')
+# lists skip the long text fields unless they are asked for
+LIST_FIELDS = tuple(name for name in MOVIE_FIELDS if name not in ('plot', 'comment'))
+MAX_BULK_MOVIES = 1000
+# updates and deletes of one batch request
+MAX_BATCH_CHANGES = 1000
+MAX_SIMILAR_TITLES = 20
+
+
+def dumps(payload):
+    """Serialize a response payload to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status,
+                                      mimetype='application/json')
+
+
+def requested_fields(default):
+    """Movie fields of ?fields=a,b,c, default if the parameter is missing.
+        Raises: 400 for unknown field names
+    """
+    value = request.args.get('fields')
+    if not value:
+        return default
+    fields = tuple(name.strip() for name in value.split(',') if name.strip())
+    unknown = [name for name in fields if name not in MOVIE_FIELDS]
+    if unknown or not fields:
+        abort(400, description=f"Unknown fields: {', '.join(unknown) or value}. "
+                               f"Available: {', '.join(MOVIE_FIELDS)}")
+    return fields
+
+
+def column_fields(fields):
+    """The fields that are database columns of a movie (for load_only)."""
+    return [name for name in fields if name != 'enrichment']
+
+
+def serialize_movie(movie, fields):
+    data = {}
+    for name in fields:
+        if name == 'enrichment':
+            data[name] = movie.enrichment.status if movie.enrichment else None
+        else:
+            data[name] = getattr(movie, name)
+    return data
+
+
+def serialize_user(user):
+    return {'id': user.id, 'username': user.username}
+
+
+@api.errorhandler(HTTPException)
+def api_error(e):
+    """Errors of the API are JSON as well."""
+    return json_response({'error': e.name, 'message': e.description}, status=e.code)
+
+
+@api.errorhandler(RateLimited)
+def api_rate_limited(e):
+    """The 429 of a rate limit as JSON, with Retry-After like the pages."""
+    retry_after = math.ceil(e.retry_after)
+    response = json_response({'error': "Too Many Requests", 'message': str(e)}, status=429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+# handlers for a status code win over the HTML error pages of the app (404)
+for code in (400, 404, 409, 413):
+    api.register_error_handler(code, api_error)
+
+
+@api.route("/users")
+def users():
+    """All users ordered by username, one page at a time."""
+    data_manager = get_data_manager()
+
+    def render():
+        try:
+            page = data_manager.get_users_page(cursor=request.args.get('cursor'),
+                                               page_size=request.args.get('per_page',
+                                                                          type=int))
+        except ValueError as e:
+            abort(400, description=str(e))
+        return json_response({'users': [serialize_user(user) for user in page],
+                              'next_cursor': page.next_cursor,
+                              'prev_cursor': page.prev_cursor})
+
+    return conditional_page(data_manager.get_collection_version(ALL_USERS), render)
+
+
+@api.route("/users/<int:user_id>/movies")
+def user_movies(user_id):
+    """The movies of a user, one sorted page at a time."""
+    data_manager = get_data_manager()
+    fields = requested_fields(LIST_FIELDS)
+
+    def render():
+        if not data_manager.get_user_by_id(user_id):
+            abort(404, description=f"User {user_id} not found")
+        try:
+            page = data_manager.get_user_movies_page(
+                user_id,
+                sort=request.args.get('sort', 'title'),
+                cursor=request.args.get('cursor'),
+                page_size=request.args.get('per_page', type=int),
+                fields=column_fields(fields))
+        except ValueError as e:
+            abort(400, description=str(e))
+        return json_response({'movies': [serialize_movie(movie, fields) for movie in page],
+                              'sort': page.sort,
+                              'next_cursor': page.next_cursor,
+                              'prev_cursor': page.prev_cursor})
+
+    return conditional_page(data_manager.get_collection_version(user_id), render)
+
+
+@api.route("/users/<int:user_id>/stats")
+def user_stats(user_id):
+    """Precomputed statistics of a user's collection."""
+    data_manager = get_data_manager()
+
+    def render():
+        stats = data_manager.get_collection_stats(user_id, top=request.args.get('top', 10,
+                                                                                type=int))
+        if not stats:
+            abort(404, description=f"User {user_id} not found")
+        for kind in ('genres', 'decades', 'directors'):
+            stats[kind] = [{'name': name, 'movie_count': count} for name, count in stats[kind]]
+        return json_response(stats)
+
+    return conditional_page(data_manager.get_collection_version(user_id), render)
+
+
+@api.route("/movies/<int:movie_id>")
+def movie(movie_id):
+    """One movie with all (or the selected) fields."""
+    data_manager = get_data_manager()
+    fields = requested_fields(MOVIE_FIELDS)
+
+    def render():
+        movie = data_manager.get_movie_with_user(movie_id)
+        if not movie:
+            abort(404, description=f"Movie {movie_id} not found")
+        return json_response(serialize_movie(movie, fields))
+
+    return conditional_page(data_manager.get_movie_collection_version(movie_id), render)
+
+
+@api.route("/search")
+def search():
+    """Full-text search over all movies or the collection of one user (?user_id=)."""
+    fields = requested_fields(LIST_FIELDS)
+    results = get_data_manager().search_movies(request.args.get('q', '').strip(),
+                                               user_id=request.args.get('user_id', type=int),
+                                               page=request.args.get('page', 1, type=int),
+                                               page_size=request.args.get('per_page', type=int))
+    return json_response({'movies': [serialize_movie(movie, fields) for movie in results],
+                          'next_page': results.next_cursor,
+                          'prev_page': results.prev_cursor})
+
+
+@api.route("/autocomplete")
+def autocomplete():
+    """Titles starting with ?q=, the most popular first. Served from the in-memory
+    title index (see autocomplete), fast enough to be asked on every keystroke."""
+    limit = min(max(request.args.get('limit', 8, type=int), 1), MAX_SUGGESTIONS)
+    response = json_response({'titles': get_autocomplete().suggest(request.args.get('q', ''),
+                                                                   limit=limit)})
+    response.cache_control.max_age = 60  # the browser asks again after a backspace
+    return response
+
+
+@api.route("/titles/similar")
+def similar_titles():
+    """Catalog titles similar to ?q=, the hints of the add movie form. With ?user_id=
+    the titles that user already has are marked (in_collection)."""
+    limit = min(max(request.args.get('limit', 5, type=int), 1), MAX_SIMILAR_TITLES)
+    titles = get_data_manager().find_similar_titles(request.args.get('q', '').strip(),
+                                                    user_id=request.args.get('user_id',
+                                                                             type=int),
+                                                    limit=limit)
+    return json_response({'titles': titles})
+
+
+@api.route("/users/<int:user_id>/movies", methods=["POST"])
+def create_movies(user_id):
+    """Add many movies at once. The body is a list of movie objects (or
+    {"movies": [...], "enrich": true}). With enrich, empty fields are filled from OMDb
+    in the background and the answer is 202, every movie to enrich takes a token of the
+    enrich rate limits.
+    Returns: created movies, titles the user already has and invalid entries
+    """
+    data_manager = get_data_manager()
+    if not data_manager.get_user_by_id(user_id):
+        abort(404, description=f"User {user_id} not found")
+    body = request.get_json(silent=True)
+    enrich = request.args.get('enrich', type=int) == 1
+    if isinstance(body, dict):
+        enrich = enrich or body.get('enrich') is True
+        body = body.get('movies')
+    if not isinstance(body, list):
+        abort(400, description="Expected a list of movies")
+    if len(body) > MAX_BULK_MOVIES:
+        abort(413, description=f"At most {MAX_BULK_MOVIES} movies per request")
+
+    movies, duplicates, errors = {}, [], []
+    for index, raw in enumerate(body):
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError("expected a JSON object")
+            row = clean_row(raw)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        key = title_key(row['title'])
+        if key in movies:
+            duplicates.append(row['title'])
+        else:
+            movies[key] = dict(row, user_id=user_id)
+    existing = data_manager.get_existing_titles(user_id, [m['title'] for m in movies.values()])
+    duplicates += [movie['title'] for key, movie in movies.items() if key in existing]
+    new_movies = [movie for key, movie in movies.items() if key not in existing]
+    if enrich:
+        lookups = sum(1 for movie in new_movies
+                      if any(movie[field] is None for field in ENRICHABLE_FIELDS))
+        if lookups:
+            # before anything is written, so a rejected request can simply be repeated
+            limit_requests('enrich', user_id=user_id, cost=lookups)
+
+    try:
+        rows = data_manager.add_movies_bulk(new_movies, returning=True)
+    except IntegrityError:
+        abort(409, description="Some of the titles were added meanwhile, please retry")
+
+    created = []
+    by_title = {movie['title']: movie for movie in new_movies}
+    for movie_id, title in rows:
+        status = None
+        if enrich and any(by_title[title][field] is None for field in ENRICHABLE_FIELDS):
+            get_enrichment_worker().submit(movie_id, title)
+            status = "pending"
+        created.append({'id': movie_id, 'title': title, 'enrichment': status})
+    if any(movie['enrichment'] for movie in created):
+        status_code = 202
+    else:
+        status_code = 201 if created else 200
+    return json_response({'created': created, 'duplicates': duplicates, 'errors': errors},
+                         status=status_code)
+
+
+@api.route("/users/<int:user_id>/movies/batch", methods=["POST"])
+def batch_movies(user_id):
+    """Change or delete many movies of a user at once. The body is
+    {"update": [{"id": 1, "rating": 8.5, "comment": "..."}, ...], "delete": [2, 3]}, only
+    rating and comment can be changed (see bulk_update_movies).
+    Returns: the result of every movie ("updated", "deleted", "not found" or why its
+             changes are invalid) and the invalid entries
+    """
+    data_manager = get_data_manager()
+    if not data_manager.get_user_by_id(user_id):
+        abort(404, description=f"User {user_id} not found")
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, description='Expected {"update": [...], "delete": [...]}')
+    changes, deletes = body.get('update') or [], body.get('delete') or []
+    if not isinstance(changes, list) or not isinstance(deletes, list):
+        abort(400, description="update and delete must be lists")
+    if len(changes) + len(deletes) > MAX_BATCH_CHANGES:
+        abort(413, description=f"At most {MAX_BATCH_CHANGES} changes per request")
+
+    updates, movie_ids, errors = {}, [], []
+    for index, item in enumerate(changes):
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+            errors.append({'update': index, 'error': "expected an object with an id"})
+            continue
+        updates[item['id']] = {field: value for field, value in item.items() if field != 'id'}
+    for index, movie_id in enumerate(deletes):
+        if not isinstance(movie_id, int):
+            errors.append({'delete': index, 'error': "expected a movie id"})
+            continue
+        movie_ids.append(movie_id)
+
+    updated = data_manager.bulk_update_movies(updates, user_id=user_id)
+    deleted = data_manager.bulk_delete_movies(movie_ids, user_id=user_id)
+    return json_response({
+        'updated': [{'id': movie_id, 'result': result} for movie_id, result in updated.items()],
+        'deleted': [{'id': movie_id, 'result': result} for movie_id, result in deleted.items()],
+        'errors': errors})
@@ -1,55 +1,566 @@
 """
 This is the Flask Backend  of my MovieWeb Application. A web based movie database with
 OMDB API and the integration of a deepseek AI movie funfact generator
+
+create_app() builds the application. The database, the OMDb cache, the HTTP session
+and the background pools are only created when a request (or CLI command) needs them,
+and every process creates its own, so forked gunicorn workers never share connections.
 """
 
 
-from flask import abort, flash, Flask, render_template, redirect, url_for, request
+from flask import (abort, Blueprint, current_app, flash, Flask, has_app_context,
+                   make_response, render_template, redirect, url_for, request, Response,
+                   session, stream_with_context)
+from autocomplete import Autocomplete
+import click
+from contextlib import nullcontext
+from bulk_import import detect_format, FORMATS, import_movies
+from data_manager.postgres_data_manager import PostgresDataManager
+from data_manager.sqlalchemy_data_manager import title_key
 from data_manager.sqlite_data_manager import SQLiteDataManager
+from data_manager.sqlite_engine import parse_pragmas
 from dotenv import load_dotenv
+import export
+from functools import partial
+import hmac
+import json
+import logging
+import math
+import metrics
+from models import ALL_USERS, CATALOG_FIELDS
+import page_cache
+from enrichment import EnrichmentWorker, OMDbError
+from funfact_pool import DEEPSEEK_URL, DeepSeekFactGenerator, FunFactPool, LocalFactGenerator
+import http_client
+from omdb_cache import is_negative_response, OMDbCache
 import os
 import random
+from rate_limit import AdmissionGate, Overloaded, parse_rate, RateLimited, RateLimiter
+from recommendations import Recommender
 import requests
+from sqlalchemy.engine import make_url
+import threading
+from titles import split_year
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+
+bp = Blueprint('main', __name__, cli_group=None)
+omdb_logger = logging.getLogger('movieweb.omdb')
+
+#  Definition for the themes the AI uses for funfact generation
+themes = {
+    'technology': "Groundbreaking film technologies and their first uses",
+    'controversies': "Movie controversies, scandals and censorship battles",
+    'bloopers': "Funny on-set accidents and unscripted moments",
+    'paranormal': "Unexplained deaths and supernatural occurrences during productions",
+    'actor_facts': "Extreme actor transformations for roles",
+    'props': "Craziest movie props ever used",
+    'mistakes': "Famous continuity errors and movie mistakes",
+    'oscars': "Shocking Oscar wins and snubs",
+    'budgets': "Insane movie budget facts",
+    'locations': "Fascinating filming location stories"
+}
+
+
+def config_from_env():
+    """Default configuration of the app, read from the environment (and .env).
+        Returns: dict: Flask config values
+    """
+    return {
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'fallback-key-für-development'),
+        # sqlite:///... or postgresql+psycopg://... picks the data manager
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DATABASE_URL', 'sqlite:///data/movies.db'),
+        # a ready data manager (e.g. from a test) is used instead of the URI
+        'DATA_MANAGER': None,
+        # overrides of the SQLite engine profile, e.g. "cache_size=-64000,mmap_size=0"
+        'SQLITE_PRAGMAS': parse_pragmas(os.getenv('SQLITE_PRAGMAS')),
+        'SQLITE_POOL_SIZE': int(os.getenv('SQLITE_POOL_SIZE', 5)),
+        'SQLITE_LOCK_RETRIES': int(os.getenv('SQLITE_LOCK_RETRIES', 5)),
+        # connections per process, i.e. per gunicorn worker on every app node
+        'POSTGRES_POOL_SIZE': int(os.getenv('POSTGRES_POOL_SIZE', 5)),
+        'POSTGRES_MAX_OVERFLOW': int(os.getenv('POSTGRES_MAX_OVERFLOW', 10)),
+        'ADMIN_TOKEN': os.getenv('ADMIN_TOKEN'),
+        # rendered collection pages kept per process (keyed by ETag), 0 turns it off
+        'PAGE_CACHE_SIZE': int(os.getenv('PAGE_CACHE_SIZE', 256)),
+        # outbound calls to OMDb and DeepSeek (see http_client), timeouts in seconds
+        'HTTP_POOL_SIZE': int(os.getenv('HTTP_POOL_SIZE', 10)),
+        'HTTP_MAX_CONCURRENCY': int(os.getenv('HTTP_MAX_CONCURRENCY', 8)),
+        'HTTP_CONNECT_TIMEOUT': float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)),
+        'HTTP_READ_TIMEOUT': float(os.getenv('HTTP_READ_TIMEOUT', 5)),
+        'HTTP_RETRIES': int(os.getenv('HTTP_RETRIES', 2)),
+        'HTTP_BREAKER_THRESHOLD': int(os.getenv('HTTP_BREAKER_THRESHOLD', 5)),
+        'HTTP_BREAKER_RESET': float(os.getenv('HTTP_BREAKER_RESET', 30)),
+        'OMDB_API_KEY': os.getenv('OMDB_API_KEY'),
+        'OMDB_API_URL': os.getenv('OMDB_API_URL', 'http://www.omdbapi.com/'),
+        # OMDb answers are cached in memory and in a small SQLite file next to movies.db
+        'OMDB_CACHE_PATH': os.getenv('OMDB_CACHE_PATH', os.path.join('data', 'omdb_cache.db')),
+        'OMDB_CACHE_TTL': int(os.getenv('OMDB_CACHE_TTL', 7 * 24 * 60 * 60)),
+        'OMDB_CACHE_NEGATIVE_TTL': int(os.getenv('OMDB_CACHE_NEGATIVE_TTL', 24 * 60 * 60)),
+        'OMDB_CACHE_MEMORY_SIZE': int(os.getenv('OMDB_CACHE_MEMORY_SIZE', 512)),
+        'OMDB_CACHE_DB_SIZE': int(os.getenv('OMDB_CACHE_DB_SIZE', 50000)),
+        # 'sync' fetches OMDb data before saving a movie, 'async' saves the movie at once
+        # and lets a background worker pool fill in the missing fields
+        'OMDB_ENRICHMENT_MODE': os.getenv('OMDB_ENRICHMENT_MODE', 'sync'),
+        'OMDB_ENRICHMENT_WORKERS': int(os.getenv('OMDB_ENRICHMENT_WORKERS', 2)),
+        'OMDB_ENRICHMENT_ATTEMPTS': int(os.getenv('OMDB_ENRICHMENT_ATTEMPTS', 3)),
+        # seconds a job of a process that stopped stays claimed before another takes it
+        'OMDB_ENRICHMENT_LEASE': float(os.getenv('OMDB_ENRICHMENT_LEASE', 60)),
+        # Only a fraction of the OMDb answers is logged (as JSON), 0 turns the log off
+        'OMDB_LOG_SAMPLE_RATE': float(os.getenv('OMDB_LOG_SAMPLE_RATE', 0.01)),
+        'IMPORT_OMDB_CONCURRENCY': int(os.getenv('IMPORT_OMDB_CONCURRENCY', 4)),
+        'DEEPSEEK_API_KEY': os.getenv('DEEPSEEK_API_KEY'),
+        'DEEPSEEK_API_URL': os.getenv('DEEPSEEK_API_URL', DEEPSEEK_URL),
+        # 'local' uses an offline stand-in instead of DeepSeek
+        'FUNFACT_GENERATOR': os.getenv('FUNFACT_GENERATOR',
+                                       'deepseek' if os.getenv('DEEPSEEK_API_KEY') else 'local'),
+        'FUNFACT_POOL_SIZE': int(os.getenv('FUNFACT_POOL_SIZE', 10)),
+        'FUNFACT_LOW_WATERMARK': int(os.getenv('FUNFACT_LOW_WATERMARK', 3)),
+        'FUNFACT_REFILL_CONCURRENCY': int(os.getenv('FUNFACT_REFILL_CONCURRENCY', 2)),
+        # a theme without pre-generated facts shows the page at once and streams a
+        # fresh fact into it (Server-Sent Events), otherwise an already shown fact
+        'FUNFACT_STREAMING': os.getenv('FUNFACT_STREAMING', 'true').lower() in ('1', 'true',
+                                                                                'yes'),
+        # memory mapped similarity index, rebuilt in the background after changes
+        'RECOMMENDATIONS_PATH': os.getenv('RECOMMENDATIONS_PATH',
+                                          os.path.join('data', 'recommendations.idx')),
+        'RECOMMENDATIONS_REFRESH_INTERVAL': int(os.getenv('RECOMMENDATIONS_REFRESH_INTERVAL',
+                                                          600)),
+        'RECOMMENDATIONS_NEIGHBORS': int(os.getenv('RECOMMENDATIONS_NEIGHBORS', 50)),
+        'RECOMMENDATIONS_MAX_PAIRS': int(os.getenv('RECOMMENDATIONS_MAX_PAIRS', 5_000_000)),
+        # token buckets of the routes that can cost upstream calls, shared by the
+        # processes in a small SQLite file; a limit is "30/minute", empty turns it off
+        'RATE_LIMIT_PATH': os.getenv('RATE_LIMIT_PATH', os.path.join('data', 'rate_limits.db')),
+        'RATE_LIMIT_FUNFACT_IP': os.getenv('RATE_LIMIT_FUNFACT_IP', '60/minute'),
+        'RATE_LIMIT_ADD_MOVIE_IP': os.getenv('RATE_LIMIT_ADD_MOVIE_IP', '30/minute'),
+        'RATE_LIMIT_ADD_MOVIE_USER': os.getenv('RATE_LIMIT_ADD_MOVIE_USER', '20/minute'),
+        # OMDb lookups of the bulk API and the file import, every enriched row takes a token
+        'RATE_LIMIT_ENRICH_IP': os.getenv('RATE_LIMIT_ENRICH_IP', '1000/day'),
+        'RATE_LIMIT_ENRICH_USER': os.getenv('RATE_LIMIT_ENRICH_USER', '1000/day'),
+        # reverse proxies in front of the app (e.g. 1 for nginx), the client IP of the
+        # per-IP limits is then taken from that many X-Forwarded-For entries. Keep it 0
+        # without a proxy, clients could pick their IP otherwise.
+        'TRUSTED_PROXIES': int(os.getenv('TRUSTED_PROXIES', 0)),
+        # upstream calls a process makes for requests at the same time (0 no cap), more
+        # wait in a queue of UPSTREAM_MAX_QUEUE for UPSTREAM_QUEUE_TIMEOUT seconds or get 503
+        'UPSTREAM_MAX_IN_FLIGHT': int(os.getenv('UPSTREAM_MAX_IN_FLIGHT', 8)),
+        'UPSTREAM_MAX_QUEUE': int(os.getenv('UPSTREAM_MAX_QUEUE', 16)),
+        'UPSTREAM_QUEUE_TIMEOUT': float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 2)),
+        # in-memory title index of the autocompletion, 0 disables the background refresh
+        'AUTOCOMPLETE_REFRESH_INTERVAL': int(os.getenv('AUTOCOMPLETE_REFRESH_INTERVAL', 5)),
+        'AUTOCOMPLETE_REBUILD_INTERVAL': int(os.getenv('AUTOCOMPLETE_REBUILD_INTERVAL', 3600)),
+    }
+
+
+def create_app(config=None):
+    """Build the Flask app. Nothing is connected or started here, see Services.
+        Args: config (dict, optional): Overrides of config_from_env(), e.g.
+              {'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'OMDB_API_URL': ...}
+        Returns: Flask: The configured app
+    """
+    load_dotenv()
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    app.config.update(config or {})
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    app.extensions['movieweb'] = Services(app)
+    app.register_blueprint(bp)
+    # imported here, the API uses the services and helpers of this module
+    from api import api
+    app.register_blueprint(api)
+    app.teardown_appcontext(remove_db_session)
+
+    # Latency of routes, data manager methods, SQL statements and outbound calls,
+    # scraped from /metrics, the state of the services is read by the gauges below
+    metrics.instrument_app(app)
+    return app
+
+
+class Services:
+    """The lazily created services of one app: data manager, OMDb cache, HTTP session,
+    enrichment worker and fun fact pool. They are built on first use in every process,
+    a worker forked after the parent built them starts over with its own."""
+    def __init__(self, app):
+        self.app = app
+        self._services = {}
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+
+    def get(self, name, factory):
+        """Get a service, factory(app) builds it on the first call in this process."""
+        if self._pid == os.getpid():
+            service = self._services.get(name)
+            if service is not None:
+                return service
+        with self._lock:
+            if self._pid != os.getpid():
+                self._after_fork()
+            service = self._services.get(name)
+            if service is None:
+                service = self._services[name] = factory(self.app)
+            return service
+
+    def peek(self, name):
+        """Get a service only if it was already built in this process."""
+        return self._services.get(name) if self._pid == os.getpid() else None
+
+    def _after_fork(self):
+        # connections and threads of the parent process must not be used here
+        data_manager = self._services.get('data_manager')
+        if data_manager is not None:
+            data_manager.engine.dispose(close=False)
+        self._services = {}
+        self._pid = os.getpid()
+
+
+def build_data_manager(app):
+    db_url = app.config['SQLALCHEMY_DATABASE_URI']
+    backend = make_url(db_url).get_backend_name()
+    if backend == 'postgresql':
+        data_manager = PostgresDataManager(db_url,
+                                           pool_size=app.config['POSTGRES_POOL_SIZE'],
+                                           max_overflow=app.config['POSTGRES_MAX_OVERFLOW'])
+    elif backend == 'sqlite':
+        data_manager = SQLiteDataManager(db_url,
+                                         pragmas=app.config['SQLITE_PRAGMAS'],
+                                         pool_size=app.config['SQLITE_POOL_SIZE'],
+                                         lock_retries=app.config['SQLITE_LOCK_RETRIES'])
+    else:
+        raise ValueError(f"Unsupported database: {db_url!r} (use sqlite or postgresql)")
+    metrics.instrument_engine(data_manager.engine)
+    metrics.instrument_data_manager(data_manager)
+    return data_manager
+
+
+def build_omdb_cache(app):
+    return OMDbCache(app.config['OMDB_CACHE_PATH'],
+                     ttl=app.config['OMDB_CACHE_TTL'],
+                     negative_ttl=app.config['OMDB_CACHE_NEGATIVE_TTL'],
+                     max_memory_entries=app.config['OMDB_CACHE_MEMORY_SIZE'],
+                     max_db_entries=app.config['OMDB_CACHE_DB_SIZE'])
+
+
+def build_http_client(app):
+    return http_client.HTTPClient(pool_maxsize=app.config['HTTP_POOL_SIZE'],
+                                  max_concurrency=app.config['HTTP_MAX_CONCURRENCY'],
+                                  connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+                                  read_timeout=app.config['HTTP_READ_TIMEOUT'],
+                                  retries=app.config['HTTP_RETRIES'],
+                                  failure_threshold=app.config['HTTP_BREAKER_THRESHOLD'],
+                                  reset_timeout=app.config['HTTP_BREAKER_RESET'])
+
+
+def build_page_cache(app):
+    return page_cache.PageCache(page_cache.templates_digest(app),
+                                max_entries=app.config['PAGE_CACHE_SIZE'])
+
+
+def build_enrichment_worker(app):
+    worker = EnrichmentWorker(get_data_manager(app), partial(lookup_omdb_data, app=app),
+                              max_workers=app.config['OMDB_ENRICHMENT_WORKERS'],
+                              max_attempts=app.config['OMDB_ENRICHMENT_ATTEMPTS'],
+                              lease=app.config['OMDB_ENRICHMENT_LEASE'])
+    # jobs of a process that stopped (e.g. a restart), the processes claim each of them
+    # so only one runs it
+    worker.resume_unfinished()
+    return worker
+
+
+def build_funfact_pool(app):
+    # Fun facts are pre-generated by a background refiller, the routes never wait for the AI.
+    if app.config['FUNFACT_GENERATOR'] == 'local':
+        generator = LocalFactGenerator()
+    else:
+        generator = DeepSeekFactGenerator(app.config['DEEPSEEK_API_KEY'],
+                                          url=app.config['DEEPSEEK_API_URL'],
+                                          client=get_http_client(app))
+    return FunFactPool(get_data_manager(app), themes, generator,
+                       size=app.config['FUNFACT_POOL_SIZE'],
+                       low_watermark=app.config['FUNFACT_LOW_WATERMARK'],
+                       concurrency=app.config['FUNFACT_REFILL_CONCURRENCY'])
+
+
+def build_recommender(app):
+    recommender = Recommender(get_data_manager(app), app.config['RECOMMENDATIONS_PATH'],
+                              refresh_interval=app.config['RECOMMENDATIONS_REFRESH_INTERVAL'],
+                              neighbors=app.config['RECOMMENDATIONS_NEIGHBORS'],
+                              max_pairs=app.config['RECOMMENDATIONS_MAX_PAIRS'])
+    if recommender.refresh_interval > 0:
+        recommender.start()
+    return recommender
+
+
+def build_autocomplete(app):
+    autocomplete = Autocomplete(get_data_manager(app), get_omdb_cache(app),
+                                refresh_interval=app.config['AUTOCOMPLETE_REFRESH_INTERVAL'],
+                                rebuild_interval=app.config['AUTOCOMPLETE_REBUILD_INTERVAL'])
+    if autocomplete.refresh_interval > 0:
+        autocomplete.start()
+    return autocomplete
+
+
+def build_rate_limiter(app):
+    rules = {rule: parse_rate(app.config[f'RATE_LIMIT_{rule.upper()}'])
+             for rule in ('funfact_ip', 'add_movie_ip', 'add_movie_user', 'enrich_ip',
+                          'enrich_user')}
+    return RateLimiter(app.config['RATE_LIMIT_PATH'], rules)
+
+
+def build_admission_gate(app):
+    return AdmissionGate(max_in_flight=app.config['UPSTREAM_MAX_IN_FLIGHT'],
+                         max_queue=app.config['UPSTREAM_MAX_QUEUE'],
+                         queue_timeout=app.config['UPSTREAM_QUEUE_TIMEOUT'])
+
+
+def get_data_manager(app=None):
+    """Data manager of the (current) app. config['DATA_MANAGER'] wins if it is set."""
+    app = app or current_app
+    data_manager = app.config.get('DATA_MANAGER')
+    if data_manager is not None:
+        return data_manager
+    return app.extensions['movieweb'].get('data_manager', build_data_manager)
 
-# load the environment variables
-load_dotenv()
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'fallback-key-für-development')
-OMDB_API_KEY = os.getenv('OMDB_API_KEY')
-DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
 
-# Initialize the Database
-data_manager = SQLiteDataManager('sqlite:///data/movies.db')
+def get_omdb_cache(app=None):
+    return (app or current_app).extensions['movieweb'].get('omdb_cache', build_omdb_cache)
+
+
+def get_page_cache(app=None):
+    return (app or current_app).extensions['movieweb'].get('page_cache', build_page_cache)
+
+
+def get_http_client(app=None):
+    """Outbound HTTP client of the (current) app, keeps connections to the APIs open."""
+    return (app or current_app).extensions['movieweb'].get('http_client', build_http_client)
+
+
+def get_enrichment_worker(app=None):
+    return (app or current_app).extensions['movieweb'].get('enrichment_worker',
+                                                           build_enrichment_worker)
+
+
+def get_funfact_pool(app=None):
+    return (app or current_app).extensions['movieweb'].get('funfact_pool',
+                                                           build_funfact_pool)
+
+
+def get_recommender(app=None):
+    return (app or current_app).extensions['movieweb'].get('recommender', build_recommender)
+
+
+def get_autocomplete(app=None):
+    return (app or current_app).extensions['movieweb'].get('autocomplete', build_autocomplete)
+
+
+def get_rate_limiter(app=None):
+    return (app or current_app).extensions['movieweb'].get('rate_limiter', build_rate_limiter)
+
+
+def get_admission_gate(app=None):
+    return (app or current_app).extensions['movieweb'].get('admission_gate',
+                                                           build_admission_gate)
+
+
+def limit_requests(route, user_id=None, cost=1):
+    """Take tokens from the buckets of the client IP (and the user) for a route.
+    Behind a reverse proxy the client IP is only right with TRUSTED_PROXIES set.
+        Args: route (str): Prefix of the rules, e.g. 'add_movie'
+              user_id (int, optional): User the request is for
+              cost (int): Tokens the request takes, e.g. one per OMDb lookup
+        Raises: RateLimited, answered with 429 (see too_many_requests)
+    """
+    limiter = get_rate_limiter()
+    limiter.hit(f"{route}_ip", request.remote_addr, cost=cost)
+    if user_id is not None:
+        limiter.hit(f"{route}_user", user_id, cost=cost)
+
+
+def scraped_service(name):
+    """A service of the app serving /metrics, None outside of a request or while the
+    service wasn't used yet in this process."""
+    if not has_app_context():
+        return None
+    return current_app.extensions['movieweb'].peek(name)
+
+
+def omdb_cache_stat(counter):
+    """Counter of the OMDb cache for /metrics, 0 while the cache isn't used yet."""
+    omdb_cache = scraped_service('omdb_cache')
+    return omdb_cache.stats()[counter] if omdb_cache else 0
+
+
+def http_client_stat(upstream, key):
+    """State of an upstream for /metrics, 0 while it wasn't called yet."""
+    client = scraped_service('http_client')
+    stats = client.stats().get(upstream) if client else None
+    if stats is None:
+        return 0
+    return http_client.CIRCUIT_STATES[stats[key]] if key == 'circuit' else stats[key]
+
+
+def admission_stat(state):
+    """Upstream calls in flight or queued for /metrics, 0 while none was made."""
+    gate = scraped_service('admission_gate')
+    return gate.stats()[state] if gate else 0
+
+
+def page_cache_stat(counter):
+    """Counter of the page cache for /metrics, 0 while the cache isn't used yet."""
+    cache = scraped_service('page_cache')
+    return cache.stats()[counter] if cache else 0
+
+
+# The gauges are registered once per process and read the services of the app that
+# serves the scrape, so an app never stays referenced by the global registry.
+omdb_cache_lookups = metrics.REGISTRY.gauge(
+    "movieweb_omdb_cache_lookups", "OMDb cache lookups by result", ("result",))
+for _counter in ('memory_hits', 'disk_hits', 'misses'):
+    omdb_cache_lookups.set_function(partial(omdb_cache_stat, _counter), result=_counter)
+upstream_gauges = {
+    'in_flight': metrics.REGISTRY.gauge(
+        "movieweb_upstream_in_flight", "Outbound calls in progress", ("upstream",)),
+    'circuit': metrics.REGISTRY.gauge(
+        "movieweb_upstream_circuit_state",
+        "Circuit breaker state (0 closed, 1 half open, 2 open)", ("upstream",)),
+    'idle_connections': metrics.REGISTRY.gauge(
+        "movieweb_upstream_idle_connections", "Kept-alive connections in the pool",
+        ("upstream",)),
+}
+for _upstream in ('omdb', 'deepseek'):
+    for _key, _gauge in upstream_gauges.items():
+        _gauge.set_function(partial(http_client_stat, _upstream, _key), upstream=_upstream)
+admission_gauge = metrics.REGISTRY.gauge(
+    "movieweb_admission_upstream_calls", "Upstream calls of requests by state", ("state",))
+for _state in ('in_flight', 'queued'):
+    admission_gauge.set_function(partial(admission_stat, _state), state=_state)
+page_cache_lookups = metrics.REGISTRY.gauge(
+    "movieweb_page_cache_lookups", "Rendered page cache lookups by result", ("result",))
+for _counter in ('hits', 'misses'):
+    page_cache_lookups.set_function(partial(page_cache_stat, _counter), result=_counter)
+
+
+def conditional_page(version, render):
+    """Answer a GET of a collection page (HTML or JSON) with ETag and Last-Modified.
+    A client that has the current page gets a 304, other clients get the cached page
+    if another request rendered it already. Only a miss calls render.
+        Args: version (tuple): (version, modified_at) of the collection shown on the
+              page, None (e.g. unknown user) renders without caching
+              render (callable): Builds the page
+        Returns: Response
+    """
+    if version is None or '_flashes' in session:
+        # flashed messages are part of the page and must be shown once
+        return render()
+    cache = get_page_cache()
+    etag = cache.etag(version[0], request.full_path)
+    modified = page_cache.last_modified(version[1])
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (request.if_modified_since is not None
+                        and request.if_modified_since >= modified)
+
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        page = cache.get(etag)
+        if page is None:
+            response = make_response(render())
+            if response.status_code != 200:
+                return response
+            cache.set(etag, (response.get_data(), response.mimetype))
+        else:
+            response = current_app.response_class(page[0], mimetype=page[1])
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.no_cache = True  # always revalidate, it's cheap
+    return response
+
+
+def request_omdb_data(title, app=None, admission=None):
+    """ Get the raw OMDb payload for a title. Answers (also 'Movie not found!') are
+        cached, so a title is only requested once per cache TTL.
+        Args: title (str): Movie title you can search for, a year at its end
+                  ("Heat (1995)") is asked for separately
+              app (Flask, optional): App to use outside of an app context
+              admission (AdmissionGate, optional): Gate a call to OMDb has to pass,
+                  for the calls a request waits for
+        Returns: dict: raw OMDb JSON answer
+        Raises: requests.exceptions.RequestException, ValueError, Overloaded
+    """
+    app = app or current_app
+    omdb_cache = get_omdb_cache(app)
+    data = omdb_cache.get(title)
+    if data is None:
+        search_title, year = split_year(title)
+        params = {'apikey': app.config['OMDB_API_KEY'], 't': search_title, 'plot': 'full'}
+        if year is not None:
+            params['y'] = year
+        with admission.admit() if admission is not None else nullcontext():
+            response = get_http_client(app).get(app.config['OMDB_API_URL'], upstream="omdb",
+                                                params=params)
+        data = response.json()
+        metrics.log_sampled(omdb_logger, app.config['OMDB_LOG_SAMPLE_RATE'], "omdb_response",
+                            title=title, status=response.status_code,
+                            response=data.get('Response'), imdb_id=data.get('imdbID'),
+                            error=data.get('Error'))
+        omdb_cache.set(title, data)
+    return data
+
+
+def convert_omdb_data(data):
+    """Map a successful OMDb payload to the fields of our movie model.
+        Args: data (dict): raw OMDb JSON answer
+        Returns: dict: sanitized movie data
+    """
+    raw_data = {
+        'title': data.get('Title'),
+        'director': data.get('Director'),
+        'writer': data.get('Writer'),
+        'actors': data.get('Actors'),
+        'year': data.get('Year'),
+        'rating': data.get('imdbRating'),
+        'runtime': data.get('Runtime'),
+        'genre': data.get('Genre'),
+        'plot': data.get('Plot'),
+        'imdb_id': data.get('imdbID')
+    }
+    return sanitize_omdb_data(raw_data)
+
+
+def catalog_movie_data(title, app=None):
+    """Movie data of a title from the shared catalog, so OMDb is asked only once per
+    title, no matter how many users add the movie.
+        Args: title (str): Movie title
+              app (Flask, optional): App to use outside of an app context
+        Returns: dict: movie data like convert_omdb_data or None if no user has the movie
+    """
+    entry = get_data_manager(app).find_catalog_entry(title)
+    if entry is None:
+        return None
+    data = {field: getattr(entry, field) for field in CATALOG_FIELDS}
+    data.update(title=entry.title, imdb_id=entry.imdb_id, rating=entry.imdb_rating)
+    return {key: value for key, value in data.items() if value is not None}
 
 
 def fetch_omdb_data(title):
-    """ Fetch movie data from OMDb API.
+    """ Fetch movie data from OMDb API and flash a message if that is not possible.
         Args: title (str): Movie title you can search for
         Returns: a sanitized dict with movie data or None if error occurs.
+        Raises: Overloaded if too many requests wait for upstream calls (503)
     """
     try:
-        url = f"http://www.omdbapi.com/?apikey={OMDB_API_KEY}&t={title}&plot=full"
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        print("OMDB RAW RESPONSE:", data)
+        catalog_data = catalog_movie_data(title)
+        if catalog_data:
+            return catalog_data
+        data = request_omdb_data(title, admission=get_admission_gate())
 
         if data.get('Response') == 'False':
             error_msg = data.get('Error', 'API error')
             flash(f"OMDb API: {error_msg}", "warning")
             return None
 
-        raw_data = {
-            'title': data.get('Title'),
-            'director': data.get('Director'),
-            'writer': data.get('Writer'),
-            'actors': data.get('Actors'),
-            'year': data.get('Year'),
-            'rating': data.get('imdbRating'),
-            'runtime': data.get('Runtime'),
-            'genre': data.get('Genre'),
-            'plot': data.get('Plot')
-        }
-        return sanitize_omdb_data(raw_data)
+        return convert_omdb_data(data)
 
     except requests.exceptions.RequestException as e:
         flash("Could not connect to OMDb API. Using manual input only.", "warning")
@@ -59,6 +570,36 @@ def fetch_omdb_data(title):
         return None
 
 
+def lookup_omdb_data(title, app=None, admission=None):
+    """ Fetch movie data for the background enrichment worker. Does not flash, but
+        raises on errors that are worth a retry.
+        Args: title (str): Movie title you can search for
+              app (Flask, optional): App to use in threads without an app context
+              admission (AdmissionGate, optional): Gate a call to OMDb has to pass
+        Returns: dict: sanitized movie data or None if OMDb does not know the movie
+        Raises: requests.exceptions.RequestException, ValueError, OMDbError, Overloaded
+    """
+    catalog_data = catalog_movie_data(title, app=app)
+    if catalog_data:
+        return catalog_data
+    data = request_omdb_data(title, app=app, admission=admission)
+    if data.get('Response') == 'False':
+        if is_negative_response(data):
+            return None
+        raise OMDbError(data.get('Error', 'API error'))
+    return convert_omdb_data(data)
+
+
+def import_lookup(app, limiter, client_ip, user_id, title):
+    """lookup_omdb_data for a row of an upload. Every row takes a token from the enrich
+    buckets of the client and the user, and the call has to pass the admission gate.
+        Raises: RateLimited, the row is then imported without OMDb data
+    """
+    limiter.hit('enrich_ip', client_ip)
+    limiter.hit('enrich_user', user_id)
+    return lookup_omdb_data(title, app=app, admission=get_admission_gate(app))
+
+
 def sanitize_omdb_data(omdb_data):
     """Clean and validate data from OMDb API response.
         Args: omdb_data (dict): Raw API response data
@@ -68,7 +609,7 @@ def sanitize_omdb_data(omdb_data):
         return {}
 
     allowed_fields = {'title', 'director', 'year', 'rating', 'genre', 'plot', 'writer',
-                      'actors', 'runtime'}
+                      'actors', 'runtime', 'imdb_id'}
     sanitized = {k: v for k, v in omdb_data.items() if k in allowed_fields and v is not None}
 
     if 'year' in sanitized:
@@ -86,88 +627,168 @@ def sanitize_omdb_data(omdb_data):
     return sanitized
 
 
-@app.route("/")
+@bp.before_app_request
+def start_enrichment_worker():
+    """In async mode every process starts its enrichment worker with its first request,
+    so the jobs left unfinished by a restart are resumed without waiting for a new movie"""
+    if current_app.config['OMDB_ENRICHMENT_MODE'] == 'async':
+        get_enrichment_worker()
+
+
+@bp.route("/")
 def home():
     """Generates the homepage with links to user and database management and a fun fact"""
+    limit_requests('funfact')
     random_theme = random.choice(list(themes.keys()))
-
-    # Generate a fun fact
-    prompt = f"""Tell ONE surprising fact about movies. Focus on: {themes[random_theme]}.
-       - Be specific (mention movie titles/years)
-       - Maximum 1 sentence
-       - Make it unexpected"""
-
-    response = requests.post(
-        "https://api.deepseek.com/v1/chat/completions",
-        headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
-        json={
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.8
-        }
-    )
-
-    fact = response.json()["choices"][0]["message"]["content"]
+    fact = get_funfact_pool().take(random_theme)
 
     return render_template('home.html',
                            funfact=fact,
                            current_theme=random_theme)
 
 
-@app.route("/users")
+@bp.route("/users")
 def list_users():
-    """Displays a list of the users in the Database"""
-    users = data_manager.get_all_users()
-    return render_template("user_select.html", users=users)
+    """Displays a list of the users in the Database, one page at a time"""
+    data_manager = get_data_manager()
 
+    def render():
+        try:
+            page = data_manager.get_users_page(cursor=request.args.get('cursor'),
+                                               page_size=request.args.get('per_page',
+                                                                          type=int))
+        except ValueError:
+            abort(400)
+        return render_template("user_select.html", users=page, page=page)
 
-@app.route("/user/<int:user_id>")
+    return conditional_page(data_manager.get_collection_version(ALL_USERS), render)
+
+
+@bp.route("/user/<int:user_id>")
 def user_movies(user_id):
-    """Displays the movies a specific user has safed."""
-    user = data_manager.get_user_by_id(user_id)
-    if not user:
-        flash("User not found!", "error")
-        return redirect(url_for('list_users'))
+    """Displays the movies a specific user has safed, one sorted page at a time."""
+    data_manager = get_data_manager()
+
+    def render():
+        user = data_manager.get_user_by_id(user_id)
+        if not user:
+            flash("User not found!", "error")
+            return redirect(url_for('main.list_users'))
+
+        try:
+            page = data_manager.get_user_movies_page(
+                user_id,
+                sort=request.args.get('sort', 'title'),
+                cursor=request.args.get('cursor'),
+                page_size=request.args.get('per_page', type=int))
+        except ValueError:
+            abort(400)
+        return render_template("movie_list.html",
+                               user=user,
+                               movies=page,
+                               page=page,
+                               user_id=user_id)
+
+    return conditional_page(data_manager.get_collection_version(user_id), render)
+
+
+@bp.route("/user/<int:user_id>/stats")
+def user_stats(user_id):
+    """Statistics of a user's collection, read from the precomputed tables."""
+    data_manager = get_data_manager()
+
+    def render():
+        user = data_manager.get_user_by_id(user_id)
+        stats = data_manager.get_collection_stats(user_id) if user else None
+        if not stats:
+            flash("User not found!", "error")
+            return redirect(url_for('main.list_users'))
+        return render_template("stats.html", user=user, stats=stats, user_id=user_id)
+
+    return conditional_page(data_manager.get_collection_version(user_id), render)
 
-    movies = data_manager.get_user_movies(user_id)
-    return render_template("movie_list.html",
-                           user=user,
-                           movies=movies,
-                           user_id=user_id)
 
+@bp.route("/user/<int:user_id>/recommendations")
+def user_recommendations(user_id):
+    """Movies of other collections that are similar to the ones of a user."""
+    data_manager = get_data_manager()
+    recommender = get_recommender()
+    index = recommender.index()
+    version = data_manager.get_collection_version(user_id)
+    if version is not None and index is not None:
+        # the page changes with the collection and with every rebuild of the index
+        version = (f"{version[0]}-{index.built_at}", max(version[1], index.built_at))
 
-@app.route("/add_user", methods=["GET", "POST"])
+    def render():
+        user = data_manager.get_user_by_id(user_id)
+        if not user:
+            flash("User not found!", "error")
+            return redirect(url_for('main.list_users'))
+        recommended = dict(recommender.recommend(user_id, k=20))
+        entries = data_manager.get_catalog_entries(list(recommended))
+        # the user may have the movie under an entry of their own
+        owned = data_manager.get_existing_titles(user_id, [entry.title for entry in entries])
+        movies = [entry for entry in entries if title_key(entry.title) not in owned][:10]
+        return render_template("recommendations.html", user=user, user_id=user_id,
+                               movies=movies, ready=index is not None)
+
+    return conditional_page(version if index is not None else None, render)
+
+
+@bp.route("/search")
+def search():
+    """Full-text search over all movies or the collection of one user."""
+    query = request.args.get('q', '').strip()
+    user_id = request.args.get('user_id', type=int)
+    results = get_data_manager().search_movies(query,
+                                         user_id=user_id,
+                                         page=request.args.get('page', 1, type=int),
+                                         page_size=request.args.get('per_page', type=int))
+    return render_template("search.html",
+                           query=query,
+                           user_id=user_id,
+                           results=results)
+
+
+@bp.route("/add_user", methods=["GET", "POST"])
 def add_user():
     """Creates a new user in the database"""
     if request.method == "POST":
         username = request.form["username"].strip()
         # Checks if user already exists, before writing a duplicate
+        data_manager = get_data_manager()
         existing_user = data_manager.get_user_by_username(username)
         if existing_user:
             flash(f"Username '{username}' is already taken!", "error")
-            return redirect(url_for('add_user'))
+            return redirect(url_for('main.add_user'))
 
         data_manager.add_user(username)
         return redirect("/")
     return render_template("user_form.html")
 
 
-@app.route('/add_movie/<int:user_id>', methods=['GET', 'POST'])
+@bp.route('/add_movie/<int:user_id>', methods=['GET', 'POST'])
 def add_movie(user_id):
     """Ads a new movie to the collection of a certain user."""
     if request.method == 'POST':
+        limit_requests('add_movie', user_id=user_id)
         title = request.form.get('title', '').strip()
 
         if not title:
             flash("Title cannot be empty!", "error")
-            return redirect(url_for('add_movie', user_id=user_id))
+            return redirect(url_for('main.add_movie', user_id=user_id))
 
-        # Check for existing movie before writing a duplicate
-        if data_manager.movie_exists(user_id, title):
+        # Check for existing movie before writing a duplicate (or asking OMDb for it)
+        data_manager = get_data_manager()
+        if data_manager.movie_exists(user_id, title, year=request.form.get('year', type=int)):
             flash(f"You already have '{title}' in your collection!", "error")
-            return redirect(url_for('add_movie', user_id=user_id))
+            return redirect(url_for('main.add_movie', user_id=user_id))
 
-        omdb_data = fetch_omdb_data(title) or {}
+        if current_app.config['OMDB_ENRICHMENT_MODE'] == 'async':
+            # Save what the user typed now, OMDb fills the empty fields later
+            omdb_data = {}
+        else:
+            omdb_data = fetch_omdb_data(title) or {}
         movie_data = {
             'title': title,
             'director': request.form.get('director') or omdb_data.get('director'),
@@ -181,15 +802,161 @@ def add_movie(user_id):
             'comment': request.form.get('comment', ''),
             'user_id': user_id,
         }
+        if not any(request.form.get(field) for field in CATALOG_FIELDS):
+            # nothing typed in, the movie shares the catalog entry of the OMDb data
+            movie_data['imdb_id'] = omdb_data.get('imdb_id')
+            movie_data['imdb_rating'] = omdb_data.get('rating')
 
         movie_data = {k: v for k, v in movie_data.items() if v is not None}
-        data_manager.add_movie(**movie_data)
-        return redirect(url_for('user_movies', user_id=user_id))
+        movie_id = data_manager.add_movie(**movie_data)
+        if movie_id and current_app.config['OMDB_ENRICHMENT_MODE'] == 'async':
+            get_enrichment_worker().submit(movie_id, title)
+        return redirect(url_for('main.user_movies', user_id=user_id))
 
     return render_template('add_movie.html', user_id=user_id)
 
 
-@app.route('/user/<int:user_id>/update_movie/<int:movie_id>', methods=['GET', 'POST'])
+@bp.route('/user/<int:user_id>/import', methods=['GET', 'POST'])
+def import_user_movies(user_id):
+    """Imports a CSV or JSON Lines file of movies into the collection of a user."""
+    user = get_data_manager().get_user_by_id(user_id)
+    if not user:
+        flash("User not found!", "error")
+        return redirect(url_for('main.list_users'))
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        file_format = request.form.get('format') or detect_format(upload and upload.filename)
+        if not upload or file_format not in FORMATS:
+            flash("Please choose a .csv or .jsonl file!", "error")
+            return redirect(url_for('main.import_user_movies', user_id=user_id))
+
+        # the import threads have no app or request context, so the lookup gets passed
+        # what it needs of them
+        fetch = (partial(import_lookup, current_app._get_current_object(),
+                         get_rate_limiter(), request.remote_addr, user_id)
+                 if request.form.get('enrich') else None)
+        report = import_movies(get_data_manager(), user_id, upload.stream, file_format,
+                               fetch=fetch,
+                               concurrency=current_app.config['IMPORT_OMDB_CONCURRENCY'])
+        flash(f"Import finished: {report.summary()}",
+              "success" if not report.failed else "warning")
+        for error in report.errors:
+            flash(error, "warning")
+        return redirect(url_for('main.user_movies', user_id=user_id))
+
+    return render_template('import_movies.html', user=user, user_id=user_id)
+
+
+@bp.cli.command("import-movies")
+@click.argument("user_id", type=int)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(FORMATS),
+              help="File format, default: guessed from the file name")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per transaction")
+@click.option("--enrich/--no-enrich", default=False, help="Fill missing fields from OMDb")
+@click.option("--concurrency", default=4, show_default=True,
+              help="Maximum number of concurrent OMDb requests")
+def import_movies_command(user_id, path, file_format, batch_size, enrich, concurrency):
+    """Import a CSV or JSON Lines file of movies into the collection of a user."""
+    file_format = file_format or detect_format(path)
+    if file_format not in FORMATS:
+        raise click.UsageError("Can't guess the format, please use --format")
+    data_manager = get_data_manager()
+    if not data_manager.get_user_by_id(user_id):
+        raise click.UsageError(f"User {user_id} does not exist")
+
+    fetch = partial(lookup_omdb_data, app=current_app._get_current_object()) if enrich else None
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = import_movies(data_manager, user_id, stream, file_format, fetch=fetch,
+                               batch_size=batch_size, concurrency=concurrency)
+    click.echo(report.summary())
+    for error in report.errors:
+        click.echo(error, err=True)
+
+
+def export_response(file_format, filename, user_id=None):
+    """Streams movies as a download, never holding the whole result in memory."""
+    rows = get_data_manager().iter_movies(export.EXPORT_FIELDS, user_id=user_id)
+    try:
+        chunks = export.export_movies(rows, file_format)
+    except export.ExportError as e:
+        abort(400, description=str(e))
+    return Response(stream_with_context(chunks),
+                    mimetype=export.CONTENT_TYPES[file_format],
+                    headers={'Content-Disposition':
+                             f'attachment; filename="{filename}.{file_format}"'})
+
+
+@bp.route('/user/<int:user_id>/export')
+def export_user_movies(user_id):
+    """Downloads the collection of a user as csv, jsonl or parquet file."""
+    if not get_data_manager().get_user_by_id(user_id):
+        abort(404)
+    return export_response(request.args.get('format', 'csv'), f"movies_user_{user_id}",
+                           user_id=user_id)
+
+
+@bp.route('/export')
+def export_all_movies():
+    """Downloads all movies of all users. Admins only: needs the ADMIN_TOKEN as
+    X-Admin-Token header."""
+    admin_token = current_app.config['ADMIN_TOKEN']
+    given_token = request.headers.get('X-Admin-Token', '')
+    if not admin_token or not hmac.compare_digest(given_token, admin_token):
+        abort(403)
+    return export_response(request.args.get('format', 'csv'), "movies_all")
+
+
+@bp.cli.command("export-movies")
+@click.option("--user-id", type=int, help="Only export this user, default: all users")
+@click.option("--format", "file_format", type=click.Choice(export.FORMATS), default="csv",
+              show_default=True)
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True),
+              help="Output file, default: stdout")
+def export_movies_command(user_id, file_format, output):
+    """Export the movies of one or all users as csv, jsonl or parquet."""
+    rows = get_data_manager().iter_movies(export.EXPORT_FIELDS, user_id=user_id)
+    try:
+        chunks = export.export_movies(rows, file_format)
+    except export.ExportError as e:
+        raise click.UsageError(str(e))
+
+    binary = file_format == 'parquet'
+    if output:
+        stream = open(output, 'wb' if binary else 'w', encoding=None if binary else 'utf-8',
+                      newline=None if binary else '')
+    else:
+        stream = click.get_binary_stream('stdout') if binary else click.get_text_stream('stdout')
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+
+
+@bp.cli.command("build-recommendations")
+def build_recommendations_command():
+    """Rebuild the recommendation index now, e.g. from cron instead of the app."""
+    recommender = Recommender(get_data_manager(), current_app.config['RECOMMENDATIONS_PATH'],
+                              neighbors=current_app.config['RECOMMENDATIONS_NEIGHBORS'],
+                              max_pairs=current_app.config['RECOMMENDATIONS_MAX_PAIRS'])
+    if recommender.refresh(force=True):
+        click.echo(f"Built the recommendation index of {len(recommender.index())} movies")
+    else:
+        click.echo("Another process is building the index right now")
+
+
+@bp.cli.command("rebuild-stats")
+@click.option("--user-id", type=int, help="Only rebuild this user, default: all users")
+def rebuild_stats_command(user_id):
+    """Recompute the collection statistics from the movies (backfills, repairs)."""
+    count = get_data_manager().rebuild_collection_stats(user_id=user_id)
+    click.echo(f"Rebuilt the statistics of {count} collection(s)")
+
+
+@bp.route('/user/<int:user_id>/update_movie/<int:movie_id>', methods=['GET', 'POST'])
 def update_movie(user_id, movie_id):
     """Enables user to update movie details manually. For example adding a comment, change
     the rating or remove typos.
@@ -206,102 +973,173 @@ def update_movie(user_id, movie_id):
         }
         updated_data = {k: v for k, v in updated_data.items() if v is not None}
 
-        success = data_manager.update_user_movie(movie_id, updated_data)
+        success = get_data_manager().update_user_movie(movie_id, updated_data)
         if not success:
             flash("Movie not found!", "error")
         else:
             flash("Movie updated successfully!", "success")
 
-        return redirect(url_for('user_movies', user_id=user_id))
+        return redirect(url_for('main.user_movies', user_id=user_id))
 
-    movie = data_manager.get_movie_by_id(movie_id)
+    movie = get_data_manager().get_movie_by_id(movie_id)
     if not movie:
         flash("Movie not found!", "error")
-        return redirect(url_for('user_movies', user_id=user_id))
+        return redirect(url_for('main.user_movies', user_id=user_id))
 
     return render_template('edit_movie.html', user_id=user_id, movie=movie)
 
 
-@app.route('/user/<int:user_id>/delete_movie/<int:movie_id>', methods=['POST'])
+@bp.route('/user/<int:user_id>/delete_movie/<int:movie_id>', methods=['POST'])
 def delete_movie(user_id, movie_id):
     """deletes a movie from the collection of a certain user only."""
-    success = data_manager.delete_movie(movie_id)
+    success = get_data_manager().delete_movie(movie_id)
     if success:
         flash("Movie deleted successfully!", "success")
     else:
         flash("Movie not found!", "error")
-    return redirect(url_for('user_movies', user_id=user_id))
+    return redirect(url_for('main.user_movies', user_id=user_id))
 
 
-@app.route('/movie/<int:movie_id>')
+@bp.route('/user/<int:user_id>/movies/batch', methods=['POST'])
+def batch_edit_movies(user_id):
+    """Rates or deletes the movies selected on the collection page in one transaction."""
+    movie_ids = request.form.getlist("movie_id", type=int)
+    action = request.form.get("action")
+    if not movie_ids:
+        flash("No movies selected!", "error")
+    elif action == "delete":
+        results = get_data_manager().bulk_delete_movies(movie_ids, user_id=user_id)
+        deleted = sum(result == "deleted" for result in results.values())
+        flash(f"{deleted} movies deleted.", "success")
+    elif action == "rate":
+        rating = request.form.get("rating", "").strip() or None
+        results = get_data_manager().bulk_update_movies(
+            {movie_id: {'rating': rating} for movie_id in movie_ids}, user_id=user_id)
+        updated = sum(result == "updated" for result in results.values())
+        errors = {result for result in results.values() if result not in ("updated", "not found")}
+        if errors:
+            flash(f"Movies not updated: {', '.join(sorted(errors))}", "error")
+        else:
+            flash(f"{updated} movies rated.", "success")
+    else:
+        abort(400)
+    return redirect(url_for('main.user_movies', user_id=user_id))
+
+
+@bp.route('/movie/<int:movie_id>')
 def movie_details(movie_id):
     """shows more details for the movie you clicked on."""
-    movie = data_manager.get_movie_with_user(movie_id)  # Nutze die neue Methode
-    if not movie:
-        flash("Movie not found!", "error")
-        return redirect(url_for('home'))
+    data_manager = get_data_manager()
 
-    return render_template('movie_details.html',
-                           movie=movie,
-                           user=movie.user)  # Jetzt sollte user verfügbar sein
+    def render():
+        movie = data_manager.get_movie_with_user(movie_id)  # Nutze die neue Methode
+        if not movie:
+            flash("Movie not found!", "error")
+            return redirect(url_for('main.home'))
 
-#  Definition for the themes the AI uses for funfact generation
-themes = {
-    'technology': "Groundbreaking film technologies and their first uses",
-    'controversies': "Movie controversies, scandals and censorship battles",
-    'bloopers': "Funny on-set accidents and unscripted moments",
-    'paranormal': "Unexplained deaths and supernatural occurrences during productions",
-    'actor_facts': "Extreme actor transformations for roles",
-    'props': "Craziest movie props ever used",
-    'mistakes': "Famous continuity errors and movie mistakes",
-    'oscars': "Shocking Oscar wins and snubs",
-    'budgets': "Insane movie budget facts",
-    'locations': "Fascinating filming location stories"
-}
+        return render_template('movie_details.html',
+                               movie=movie,
+                               user=movie.user)  # Jetzt sollte user verfügbar sein
 
+    return conditional_page(data_manager.get_movie_collection_version(movie_id), render)
 
-@app.route('/funfact/<theme>')
+
+@bp.route('/funfact/<theme>')
 def themed_funfact(theme):
-    """Generates themed movie related fun facts using deepseek AI"""
+    """Shows a themed movie related fun fact from the pool generated by deepseek AI"""
     if theme not in themes:
         abort(404)
+    limit_requests('funfact')
 
-    prompt = f"""Tell ONE surprising fact about: {themes[theme]}.
-    -Focus on a single specific example 
-    -Be specific (mention movie titles/years)
-    - Maximum 1 sentences
-    -No lists or multiple examples
-    - Make it unexpected
-    Example: "In 'The Wizard of Oz' (1939), asbestos was used as fake snow"
-    """
-
-    response = requests.post(
-        "https://api.deepseek.com/v1/chat/completions",
-        headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
-        json={
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.8  # More creative facts
-        }
-    )
-
-    fact = response.json()["choices"][0]["message"]["content"]
+    streaming = current_app.config['FUNFACT_STREAMING']
+    fact = get_funfact_pool().take(theme, fallback=not streaming)
+    if fact is None:
+        # nothing pre-generated left: the page comes at once, the fact follows
+        return render_template('funfact.html',
+                               funfact=None,
+                               stream_url=url_for('main.funfact_stream', theme=theme),
+                               current_theme=theme)
     return render_template('funfact.html',
                            funfact=fact,
                            current_theme=theme)
 
 
-@app.errorhandler(404)
+def sse_event(payload, event=None):
+    """One Server-Sent Event with a JSON payload (JSON keeps newlines out of data:)."""
+    data = json.dumps(payload, ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n" if event else f"data: {data}\n\n"
+
+
+@bp.route('/funfact/<theme>/stream')
+def funfact_stream(theme):
+    """Streams a freshly generated fun fact as Server-Sent Events: one message per piece
+    of text ({"text": ...}), then a "done" event. If the fact can't be generated, an
+    "error" event brings an already shown fact instead."""
+    if theme not in themes:
+        abort(404)
+    limit_requests('funfact')
+    pool = get_funfact_pool()
+    gate = get_admission_gate()
+
+    def events():
+        try:
+            with gate.admit():
+                for piece in pool.stream(theme):
+                    yield sse_event({'text': piece})
+            yield sse_event({}, event="done")
+        except Exception as e:
+            logging.warning("Could not stream a fun fact for '%s': %s", theme, e)
+            yield sse_event({'fact': pool.take(theme)}, event="error")
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})  # no proxy buffering
+
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def remove_db_session(exception=None):
+    """Closes the request scoped database session (if this request created one)"""
+    data_manager = current_app.config.get('DATA_MANAGER') \
+        or current_app.extensions['movieweb'].peek('data_manager')
+    if data_manager is not None:
+        data_manager.remove_session()
+
+
+@bp.app_errorhandler(404)
 def page_not_found(e):
     """handles 404 errors"""
     return render_template('404.html'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(RateLimited)
+def too_many_requests(e):
+    """A client exceeded a rate limit, tells it when to come back"""
+    response = make_response(render_template('busy.html', retry_after=math.ceil(e.retry_after),
+                                             reason="You sent too many requests."), 429)
+    response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+    return response
+
+
+@bp.app_errorhandler(Overloaded)
+def overloaded(e):
+    """Too many requests wait for the upstream APIs, the request is shed"""
+    response = make_response(render_template('busy.html', retry_after=math.ceil(e.retry_after),
+                                             reason="We are very busy right now."), 503)
+    response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+    return response
+
+
+@bp.app_errorhandler(500)
 def internal_error(e):
     """handles server errors"""
     return render_template('500.html'), 500
 
 
 if __name__ == "__main__":
+    app = create_app()
     app.run(debug=True, port=5002)
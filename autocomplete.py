@@ -0,0 +1,234 @@
+"""
+Title autocompletion for the add movie form of the MovieWeb application.
+All titles of the catalog and of the cached OMDb answers are kept in memory, sorted by
+their normalized form (see titles.normalize_title), so the titles starting with what
+is typed are one binary search away and "the matr" finds "The Matrix". They are ranked
+by popularity, the number of collections a title is in. The best titles of a prefix
+are kept once computed (for the one and two character prefixes when the index is
+built), a lookup doesn't touch the database or the network.
+The Autocomplete service adds the movies and OMDb answers that are new since the last
+refresh every few seconds in a background thread. Deleted movies and changed titles
+are picked up by the full rebuild, which runs much less often.
+"""
+
+from bisect import bisect_left
+import heapq
+import logging
+import threading
+import time
+
+from titles import normalize_title
+
+
+MAX_SUGGESTIONS = 10
+# prefixes whose best titles are computed when the index is built, longer ones when
+# they are looked up the first time
+EAGER_PREFIX = 2
+# lazily computed prefixes kept, the eager ones always stay
+MAX_CACHED_PREFIXES = 50000
+# sorts after every character a title can continue a prefix with
+LAST_CHARACTER = "\U0010ffff"
+
+
+class TitleIndex:
+    """Normalized titles in sorted order with their popularity. Thread safe."""
+    def __init__(self, titles=()):
+        """
+        Args: titles: Iterable of (title, year, popularity, canonical) rows, canonical
+                  titles (e.g. from OMDb) are shown instead of others of the same movie
+        """
+        self._lock = threading.Lock()
+        self._entries = {}  # (normalized, year or 0) -> [popularity, title, year]
+        for title, year, popularity, canonical in titles:
+            self._merge(title, year, popularity, canonical)
+        self._keys = sorted(self._entries)
+        # the popularity in the order of the keys, so ranking a range is one C call
+        self._popularity = [self._entries[key][0] for key in self._keys]
+        self._best = {}  # prefix -> keys of the best titles, at most MAX_SUGGESTIONS
+        for length in range(1, EAGER_PREFIX + 1):
+            self._compute_prefixes(length)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _rank(self, key):
+        # like _top: the most popular first, then in the order of the keys
+        return -self._entries[key][0], key
+
+    def _merge(self, title, year, popularity, canonical):
+        """Add a title to the entries.
+            Returns: tuple: Its key, None if it has no normalized form
+        """
+        normalized = normalize_title(title)
+        if not normalized:
+            return None
+        key = (normalized, year or 0)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [popularity, title, year]
+        else:
+            entry[0] += popularity
+            if canonical:
+                entry[1] = title
+        return key
+
+    def _compute_prefixes(self, length):
+        """Best titles of every prefix of a length, one pass over the sorted keys."""
+        start = 0
+        while start < len(self._keys):
+            prefix = self._keys[start][0][:length]
+            if len(prefix) < length:
+                start += 1  # a shorter title, it sorts before the longer ones
+                continue
+            end = self._range(prefix)[1]
+            self._best[prefix] = self._top(start, end)
+            start = end
+
+    def _range(self, prefix):
+        return (bisect_left(self._keys, (prefix,)),
+                bisect_left(self._keys, (prefix + LAST_CHARACTER,)))
+
+    def _top(self, start, end):
+        """Keys of the best titles between two positions (the earlier one of a tie)."""
+        positions = heapq.nlargest(MAX_SUGGESTIONS, range(start, end),
+                                   key=self._popularity.__getitem__)
+        return [self._keys[position] for position in positions]
+
+    def add(self, title, year=None, popularity=1, canonical=False):
+        """Add a title or the new collections of a known one.
+            Args: title (str): Title as shown
+                  year (int, optional): Release year, titles differ by it
+                  popularity (int): Collections the title was added to
+                  canonical (bool): Show this title for the movie, e.g. the OMDb title
+        """
+        with self._lock:
+            count = len(self._entries)
+            key = self._merge(title, year, popularity, canonical)
+            if key is None:
+                return
+            position = bisect_left(self._keys, key)
+            if len(self._entries) > count:
+                self._keys.insert(position, key)
+                self._popularity.insert(position, popularity)
+            else:
+                self._popularity[position] += popularity
+            # popularity only grows until the next rebuild, so the best titles of a
+            # prefix only have to consider this title
+            normalized = key[0]
+            for length in range(1, len(normalized) + 1):
+                best = self._best.get(normalized[:length])
+                if best is not None:
+                    if key not in best:
+                        best.append(key)
+                    best.sort(key=self._rank)
+                    del best[MAX_SUGGESTIONS:]
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        """Titles starting with what is typed, the most popular first.
+            Args: query (str): Title typed so far
+                  limit (int): Number of titles, at most MAX_SUGGESTIONS
+            Returns: List[dict]: title, year and popularity
+        """
+        prefix = normalize_title(query)
+        if not prefix:
+            return []
+        with self._lock:
+            best = self._best.get(prefix)
+            if best is None:
+                best = self._top(*self._range(prefix))
+                if len(self._best) >= MAX_CACHED_PREFIXES:
+                    self._best = {cached: keys for cached, keys in self._best.items()
+                                  if len(cached) <= EAGER_PREFIX}
+                self._best[prefix] = best
+            entries = [self._entries[key] for key in best[:limit]]
+        return [{'title': title, 'year': year, 'popularity': popularity}
+                for popularity, title, year in entries]
+
+
+class Autocomplete:
+    """Serves suggestions from a TitleIndex of the catalog and the OMDb cache and keeps
+    it up to date in the background."""
+    def __init__(self, data_manager, omdb_cache=None, refresh_interval=5,
+                 rebuild_interval=3600):
+        """
+        Args:
+            data_manager: Data manager the catalog is read from
+            omdb_cache (OMDbCache, optional): Cache whose answers are suggested as well
+            refresh_interval (int): Seconds between adding what is new
+            rebuild_interval (int): Seconds between full rebuilds
+        """
+        self.data_manager = data_manager
+        self.omdb_cache = omdb_cache
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._index = None
+        self._built_at = 0.0
+        self._last_movie_id = 0
+        self._last_cached = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def index(self):
+        """The index, built on first use."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._rebuild()
+        return self._index
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        """See TitleIndex.suggest."""
+        return self.index().suggest(query, limit=min(limit, MAX_SUGGESTIONS))
+
+    def _rebuild(self):
+        started = time.monotonic()
+        rows = self.data_manager.get_title_counts()
+        titles = [(row.title, row.year, row.movie_count, row.imdb_id is not None)
+                  for row in rows]
+        last_movie_id = max((row.last_movie_id or 0 for row in rows), default=0)
+        cached = self.omdb_cache.titles() if self.omdb_cache is not None else []
+        titles += [(title, year, 0, True) for title, year, _ in cached]
+        self._index = TitleIndex(titles)
+        self._built_at = time.monotonic()
+        self._last_movie_id = last_movie_id
+        self._last_cached = max((expires_at for _, _, expires_at in cached),
+                                default=self._last_cached)
+        logging.info("Built the autocomplete index of %d titles in %.1fs",
+                     len(self._index), self._built_at - started)
+
+    def refresh(self):
+        """Add the movies and OMDb answers that are new since the last refresh, or
+        rebuild the index after rebuild_interval."""
+        with self._lock:
+            if (self._index is None
+                    or time.monotonic() - self._built_at >= self.rebuild_interval):
+                self._rebuild()
+                return
+            index = self._index
+            for row in self.data_manager.get_title_counts(after_movie_id=self._last_movie_id):
+                index.add(row.title, row.year, row.movie_count,
+                          canonical=row.imdb_id is not None)
+                self._last_movie_id = max(self._last_movie_id, row.last_movie_id)
+            if self.omdb_cache is not None:
+                for title, year, expires_at in self.omdb_cache.titles(after=self._last_cached):
+                    index.add(title, year, popularity=0, canonical=True)
+                    self._last_cached = max(self._last_cached, expires_at)
+
+    def start(self):
+        """Start the background refresher (once per process)."""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._refresh_loop,
+                                                    name="autocomplete", daemon=True)
+                    self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error("Autocomplete refresh failed: %s", e)
+            finally:
+                self.data_manager.remove_session()
+            time.sleep(self.refresh_interval)
@@ -0,0 +1,6 @@
+"""
+Load tests and micro benchmarks for the MovieWeb application.
+    python -m benchmarks.run --movies 100000 --output results.json
+    python -m benchmarks.compare baseline.json results.json
+See benchmarks/run.py for all options.
+"""
@@ -0,0 +1,76 @@
+"""
+Compares two benchmark result files and flags regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.2
+
+Exits with status 1 if any scenario got slower than the threshold allows, so it can
+gate a CI job.
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, metric='p95', threshold=0.2, min_delta=0.001):
+    """Find the scenarios that got slower.
+        Args:
+            baseline (dict): Results of the reference run
+            current (dict): Results of the new run
+            metric (str): Latency to compare ('p50', 'p95', 'p99' or 'mean')
+            threshold (float): Allowed relative slowdown, 0.2 = 20%
+            min_delta (float): Slowdowns below this many seconds are noise
+        Returns: List[dict]: One row per scenario in both runs, with 'regression' set
+    """
+    rows = []
+    for section in ('startup', 'routes', 'data_manager'):
+        for name, before in baseline.get(section, {}).items():
+            after = current.get(section, {}).get(name)
+            if after is None or before.get(metric) is None or after.get(metric) is None:
+                continue
+            delta = after[metric] - before[metric]
+            ratio = after[metric] / before[metric] if before[metric] else None
+            rows.append({
+                'section': section,
+                'name': name,
+                'before': before[metric],
+                'after': after[metric],
+                'ratio': ratio,
+                'regression': delta > min_delta and (ratio is None or ratio > 1 + threshold),
+                'new_errors': after.get('errors', 0) > before.get('errors', 0),
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--metric", default="p95", choices=("p50", "p95", "p99", "mean"))
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative slowdown (default 0.2 = 20%%)")
+    parser.add_argument("--min-delta", type=float, default=0.001,
+                        help="Ignore slowdowns below this many seconds")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as baseline_file, \
+            open(args.current, encoding="utf-8") as current_file:
+        rows = compare(json.load(baseline_file), json.load(current_file),
+                       args.metric, args.threshold, args.min_delta)
+
+    failed = False
+    for row in rows:
+        flag = ""
+        if row['regression']:
+            flag = "REGRESSION"
+        elif row['new_errors']:
+            flag = "NEW ERRORS"
+        failed = failed or bool(flag)
+        ratio = f"{row['ratio']:6.2f}x" if row['ratio'] is not None else "    n/a"
+        print(f"{row['section']:12} {row['name']:32} {row['before'] * 1000:9.2f} ms -> "
+              f"{row['after'] * 1000:9.2f} ms {ratio}  {flag}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
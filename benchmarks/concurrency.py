@@ -0,0 +1,113 @@
+"""
+Concurrency benchmark: reader processes page through movie lists while writer
+processes add and update movies, like several gunicorn workers on one database.
+Runs once with SQLite's defaults ('legacy') and once with the engine profile
+('tuned'), and reports read throughput and latency while the writers are active.
+
+    python -m benchmarks.concurrency --readers 4 --writers 1 --duration 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.run import summarize
+from benchmarks.seed import seed_database
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from data_manager.sqlite_engine import DEFAULT_PRAGMAS, LEGACY_PRAGMAS
+
+
+PROFILES = {
+    'legacy': {'pragmas': LEGACY_PRAGMAS, 'lock_retries': 0},
+    'tuned': {'pragmas': DEFAULT_PRAGMAS, 'lock_retries': 5},
+}
+
+
+def _worker(role, database_url, profile, users, movies, duration, seed):
+    """Runs in its own process. Returns: (role, latencies, errors, elapsed)"""
+    rng = random.Random(seed)
+    dm = SQLiteDataManager(database_url, **PROFILES[profile])
+    latencies, errors, number = [], 0, 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while time.perf_counter() < deadline:
+        number += 1
+        start = time.perf_counter()
+        try:
+            if role == 'reader':
+                dm.get_user_movies_page(rng.randint(1, users),
+                                        sort=rng.choice(['title', '-rating', 'year']))
+            elif number % 2:
+                ok = dm.add_movie(title=f"Concurrent {seed}-{number}",
+                                  user_id=rng.randint(1, users)) is not None
+                errors += not ok
+            else:
+                errors += not dm.update_user_movie(rng.randint(1, movies),
+                                                   {'comment': f"write {number}"})
+        except Exception:
+            errors += 1
+        finally:
+            dm.remove_session()
+        latencies.append(time.perf_counter() - start)
+    return role, latencies, errors, time.perf_counter() - started
+
+
+def run_profile(profile, readers, writers, users, movies, duration, workdir):
+    """Seed a fresh database and run the readers and writers against it.
+        Returns: dict: 'reads' and 'writes' summaries (see benchmarks.run.summarize)
+    """
+    database_url = f"sqlite:///{os.path.join(workdir, f'{profile}.db')}"
+    seed_database(database_url, users=users, movies=movies).engine.dispose()
+    # switch the journal mode once, before the workers open the file
+    SQLiteDataManager(database_url, **PROFILES[profile]).engine.dispose()
+
+    jobs = [('reader', seed) for seed in range(readers)] + \
+           [('writer', 1000 + seed) for seed in range(writers)]
+    with multiprocessing.Pool(len(jobs)) as pool:
+        outcomes = pool.starmap(_worker, [(role, database_url, profile, users, movies,
+                                           duration, seed) for role, seed in jobs])
+
+    results = {}
+    for role, key in (('reader', 'reads'), ('writer', 'writes')):
+        latencies = [value for r, values, _, _ in outcomes if r == role for value in values]
+        errors = sum(errors for r, _, errors, _ in outcomes if r == role)
+        elapsed = max((e for r, _, _, e in outcomes if r == role), default=0)
+        results[key] = summarize(latencies, elapsed, errors)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read throughput while writers are active")
+    parser.add_argument("--readers", type=int, default=4, help="Reader processes")
+    parser.add_argument("--writers", type=int, default=1, help="Writer processes")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--movies", type=int, default=100000)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per profile")
+    parser.add_argument("--profiles", nargs="+", choices=tuple(PROFILES),
+                        default=list(PROFILES))
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="movieweb-concurrency-")
+    results = {}
+    for profile in args.profiles:
+        results[profile] = run_profile(profile, args.readers, args.writers, args.users,
+                                       args.movies, args.duration, workdir)
+        for key, result in results[profile].items():
+            print(f"{profile:7} {key:7} {result['throughput'] or 0:9.1f}/s  "
+                  f"p50 {(result['p50'] or 0) * 1000:7.2f} ms  "
+                  f"p95 {(result['p95'] or 0) * 1000:7.2f} ms  "
+                  f"p99 {(result['p99'] or 0) * 1000:7.2f} ms  errors {result['errors']}",
+                  file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
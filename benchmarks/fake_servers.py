@@ -0,0 +1,173 @@
+"""
+Local stand-ins for the OMDb and DeepSeek APIs.
+Each server answers like the real API after a configurable delay, so the benchmarks
+measure our code under realistic upstream latency without network access or keys.
+Streamed answers (Server-Sent Events) send their events one by one with a delay.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+# sizes of the synthetic people of FakeOMDbServer, directors share several movies
+DIRECTORS = 500
+ACTORS = 5000
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Drama", "Fantasy",
+          "Horror", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"]
+
+
+class FakeServer:
+    """HTTP server on a free localhost port, running in a daemon thread."""
+    def __init__(self, latency=0.05, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    path = "/"
+
+    def respond(self, handler, body):
+        """Returns: tuple: (status code, JSON payload) for one request"""
+        raise NotImplementedError
+
+    def stream(self, handler, body):
+        """Returns: Iterable of event payloads to stream instead of one answer, or None"""
+        return None
+
+    def delay(self):
+        with self._lock:
+            self.requests += 1
+            extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+        time.sleep(self.latency + extra)
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+            def _answer(self, body=None):
+                fake.delay()
+                events = fake.stream(self, body)
+                if events is not None:
+                    return self._stream(events)
+                status, payload = fake.respond(self, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, events):
+                # chunked like the real APIs, every event is sent as soon as it's ready
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for event in events:
+                        data = f"data: {event}\n\n".encode()
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # the client stopped reading
+
+            def do_GET(self):
+                self._answer()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._answer(json.loads(self.rfile.read(length) or b"null"))
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeOMDbServer(FakeServer):
+    """Answers ?t=<title> like OMDb. not_found_ratio of the titles are unknown, the
+    others get their own IMDb id, year, director and genres."""
+    def __init__(self, latency=0.05, jitter=0.0, not_found_ratio=0.0, seed=None):
+        super().__init__(latency, jitter, seed)
+        self.not_found_ratio = not_found_ratio
+
+    def respond(self, handler, body):
+        title = parse_qs(urlparse(handler.path).query).get('t', [''])[0]
+        # stable per title, so the cache and the catalog see the same answer again
+        rng = random.Random(title)
+        if rng.random() < self.not_found_ratio:
+            return 200, {"Response": "False", "Error": "Movie not found!"}
+        director = f"Director {rng.randrange(DIRECTORS)}"
+        return 200, {
+            "Title": title, "Year": str(rng.randint(1930, 2024)), "Director": director,
+            "Writer": director, "Actors": ", ".join(f"Actor {rng.randrange(ACTORS)}"
+                                                    for _ in range(3)),
+            "imdbRating": f"{rng.uniform(2, 9.5):.1f}",
+            "Runtime": f"{rng.randint(75, 190)} min",
+            "Genre": ", ".join(rng.sample(GENRES, rng.randint(1, 3))),
+            "Plot": f"A synthetic plot of {title}.",
+            "imdbID": f"tt{rng.randrange(10 ** 8):08d}", "Response": "True",
+        }
+
+
+class FakeDeepSeekServer(FakeServer):
+    """Answers chat completion requests like DeepSeek. With "stream": true the answer
+    comes word by word, token_delay seconds apart (latency is the time to the first)."""
+    path = "/v1/chat/completions"
+
+    def __init__(self, latency=0.05, jitter=0.0, seed=None, token_delay=0.01):
+        super().__init__(latency, jitter, seed)
+        self.token_delay = token_delay
+
+    def _fact(self):
+        with self._lock:
+            number = self.requests
+        return f"Synthetic fun fact number {number}."
+
+    def respond(self, handler, body):
+        return 200, {"choices": [{"message": {"role": "assistant",
+                                              "content": self._fact()}}]}
+
+    def stream(self, handler, body):
+        if not (body or {}).get("stream"):
+            return None
+        return self._chunks(self._fact())
+
+    def _chunks(self, fact):
+        for index, word in enumerate(fact.split(" ")):
+            if index:
+                time.sleep(self.token_delay)
+            yield json.dumps({"choices": [{"index": 0, "delta": {
+                "content": (" " if index else "") + word}}]})
+        yield "[DONE]"
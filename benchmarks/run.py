@@ -0,0 +1,454 @@
+"""
+Benchmark runner: seeds a scratch database, starts fake OMDb and DeepSeek servers and
+measures latency percentiles and throughput of every route and every data manager
+method. The results are written as JSON, compare two runs with benchmarks/compare.py.
+
+    python -m benchmarks.run --users 1000 --movies 1000000 --omdb-latency 0.2 \
+        --output benchmarks/results/main.json
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import inspect
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from app import create_app, get_autocomplete, get_recommender, themes
+from benchmarks.fake_servers import FakeDeepSeekServer, FakeOMDbServer
+from benchmarks.seed import seed_database, synthetic_movie
+from benchmarks.startup import measure_startup
+from data_manager.sqlite_data_manager import SQLiteDataManager
+
+
+ADMIN_TOKEN = "benchmark-admin"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_time, errors):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / wall_time if wall_time else None,
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else None,
+    }
+
+
+def measure(operation, iterations, concurrency=1, warmup=2):
+    """Call operation(number) iterations times from concurrency threads.
+        Args:
+            operation (callable): Runs one call, raises on errors
+            iterations (int): Number of measured calls
+            concurrency (int): Number of threads calling at the same time
+            warmup (int): Unmeasured calls before the run
+        Returns: dict: count, errors, throughput (calls/s) and latencies in seconds
+    """
+    numbers = itertools.count()
+    for _ in range(warmup):
+        operation(next(numbers))
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        nonlocal errors
+        while next(remaining) < iterations:
+            number = next(numbers)
+            start = time.perf_counter()
+            try:
+                operation(number)
+                failed = False
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def route_scenarios(flask_app, users, movies, rng):
+    """Requests per route, keyed by scenario name. Each takes a running number, returns
+    the HTTP status and raises on server errors. Write scenarios use disjoint ids, so
+    they don't collide."""
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = flask_app.test_client()
+        return local.client
+
+    def get(path_factory):
+        return lambda n: client().get(path_factory(n)).status_code
+
+    def any_user(n):
+        return rng.randint(1, users)
+
+    def any_movie(n):
+        return rng.randint(1, movies)
+
+    def user_movies(user_id):
+        # the seeded movies are spread over the users round robin
+        return list(range(user_id, movies + 1, users))
+
+    def batch_delete(n):
+        # ten movies of one of the users from 3 on (1 and 2 are rated), round robin
+        user_id = users - n % (users - 2)
+        offset = 10 * (n // (users - 2))
+        return client().post(f"/user/{user_id}/movies/batch",
+                             data={'movie_id': user_movies(user_id)[offset:offset + 10],
+                                   'action': "delete"}).status_code
+
+    def consume(response):
+        # streamed exports only run while the body is read
+        for _ in response.response:
+            pass
+        return response.status_code
+
+    def first_event(response):
+        next(iter(response.response))
+        response.close()
+        return response.status_code
+
+    import_file = "title,year\n" + "".join(f"Imported Movie {i},2001\n" for i in range(50))
+    scenarios = {
+        'home': ('main.home', get(lambda n: "/")),
+        'list_users': ('main.list_users', get(lambda n: "/users")),
+        'user_movies': ('main.user_movies', get(lambda n: f"/user/{any_user(n)}")),
+        'user_movies_by_rating': ('main.user_movies',
+                                  get(lambda n: f"/user/{any_user(n)}?sort=-rating")),
+        'search': ('main.search', get(
+            lambda n: f"/search?q={rng.choice(['dark', 'river', 'lost'])}")),
+        'search_user': ('main.search', get(lambda n: f"/search?q=golden&user_id={any_user(n)}")),
+        'add_user_form': ('main.add_user', get(lambda n: "/add_user")),
+        'add_user': ('main.add_user', lambda n: client().post(
+            "/add_user", data={'username': f"bench{n}-{rng.random()}"}).status_code),
+        'add_movie_form': ('main.add_movie', get(lambda n: f"/add_movie/{any_user(n)}")),
+        'add_movie': ('main.add_movie', lambda n: client().post(
+            f"/add_movie/{any_user(n)}",
+            data={'title': f"Benchmark Movie {n} {rng.random()}"}).status_code),
+        'import_form': ('main.import_user_movies', get(
+            lambda n: f"/user/{any_user(n)}/import")),
+        'import': ('main.import_user_movies', lambda n: client().post(
+            f"/user/{users}/import",
+            data={'file': (io.BytesIO(import_file.replace("Movie", f"Movie{n}").encode()),
+                           "movies.csv")},
+            content_type="multipart/form-data").status_code),
+        'export_user': ('main.export_user_movies', lambda n: consume(client().get(
+            f"/user/{any_user(n)}/export?format=jsonl"))),
+        'export_all': ('main.export_all_movies', lambda n: consume(client().get(
+            "/export?format=csv", headers={'X-Admin-Token': ADMIN_TOKEN}))),
+        'update_movie_form': ('main.update_movie', get(
+            lambda n: f"/user/1/update_movie/{any_movie(n)}")),
+        'update_movie': ('main.update_movie', lambda n: client().post(
+            f"/user/1/update_movie/{any_movie(n)}",
+            data={'comment': f"benchmark {n}"}).status_code),
+        'delete_movie': ('main.delete_movie', lambda n: client().post(
+            f"/user/1/delete_movie/{movies - n}").status_code),
+        'batch_rate_movies': ('main.batch_edit_movies', lambda n: client().post(
+            "/user/1/movies/batch",
+            data={'movie_id': rng.sample(user_movies(1), 20), 'action': "rate",
+                  'rating': rng.randint(0, 10)}).status_code),
+        'batch_delete_movies': ('main.batch_edit_movies', lambda n: batch_delete(n)),
+        'movie_details': ('main.movie_details', get(lambda n: f"/movie/{any_movie(n)}")),
+        'funfact': ('main.themed_funfact', get(
+            lambda n: f"/funfact/{rng.choice(list(themes))}")),
+        'funfact_stream': ('main.funfact_stream', lambda n: consume(client().get(
+            f"/funfact/{rng.choice(list(themes))}/stream"))),
+        # time to the first piece of the fact, the stream is dropped after it
+        'funfact_stream_first_text': ('main.funfact_stream', lambda n: first_event(
+            client().get(f"/funfact/{rng.choice(list(themes))}/stream"))),
+        'metrics': ('main.metrics_endpoint', get(lambda n: "/metrics")),
+        'api_users': ('api.users', get(lambda n: "/api/v1/users")),
+        'api_user_movies': ('api.user_movies', get(
+            lambda n: f"/api/v1/users/{any_user(n)}/movies?fields=id,title,year,rating")),
+        'recommendations': ('main.user_recommendations', get(
+            lambda n: f"/user/{any_user(n)}/recommendations")),
+        'user_stats': ('main.user_stats', get(lambda n: f"/user/{any_user(n)}/stats")),
+        'api_user_stats': ('api.user_stats', get(
+            lambda n: f"/api/v1/users/{any_user(n)}/stats")),
+        'api_movie': ('api.movie', get(lambda n: f"/api/v1/movies/{any_movie(n)}")),
+        'api_search': ('api.search', get(
+            lambda n: f"/api/v1/search?q={rng.choice(['dark', 'river', 'lost'])}")),
+        'api_autocomplete': ('api.autocomplete', get(
+            lambda n: f"/api/v1/autocomplete?q={rng.choice(['d', 'da', 'dark', 'the lo'])}")),
+        'api_similar_titles': ('api.similar_titles', get(
+            lambda n: f"/api/v1/titles/similar?q=dark%20rivr%20{n}&user_id={any_user(n)}")),
+        'api_batch_movies': ('api.batch_movies', lambda n: client().post(
+            "/api/v1/users/2/movies/batch",
+            json={'update': [{'id': movie_id, 'rating': rng.randint(0, 10)}
+                             for movie_id in rng.sample(user_movies(2), 20)]}).status_code),
+        'api_create_movies': ('api.create_movies', lambda n: client().post(
+            f"/api/v1/users/{users}/movies",
+            json=[{'title': f"API Movie {n} {i} {rng.random()}", 'year': 2001}
+                  for i in range(20)]).status_code),
+    }
+    return {name: (endpoint, checked(operation))
+            for name, (endpoint, operation) in scenarios.items()}
+
+
+def checked(operation):
+    def call(number):
+        status = operation(number)
+        if status >= 500:
+            raise RuntimeError(f"HTTP {status}")
+        return status
+    return call
+
+
+def data_manager_scenarios(dm, users, movies, rng):
+    """Calls per SQLiteDataManager method, keyed by method name."""
+    first_delete = movies // 2
+    first_bulk_delete = movies // 4
+
+    def any_user(n):
+        return rng.randint(1, users)
+
+    def any_movie(n):
+        return rng.randint(1, movies)
+
+    return {
+        'get_all_users': lambda n: dm.get_all_users(),
+        'get_user_movies': lambda n: dm.get_user_movies(any_user(n)),
+        'get_user_movies_page': lambda n: dm.get_user_movies_page(
+            any_user(n), sort=rng.choice(['title', '-year', 'rating'])),
+        'get_users_page': lambda n: dm.get_users_page(),
+        'iter_movies': lambda n: sum(1 for _ in dm.iter_movies(['id', 'title'],
+                                                                 user_id=any_user(n))),
+        'search_movies': lambda n: dm.search_movies(rng.choice(['dark', 'river', 'lost'])),
+        'get_user_by_id': lambda n: dm.get_user_by_id(any_user(n)),
+        'get_user_with_movies': lambda n: dm.get_user_with_movies(any_user(n)),
+        'get_user_by_username': lambda n: dm.get_user_by_username(f"user{any_user(n):07d}"),
+        'movie_exists': lambda n: dm.movie_exists(any_user(n), f"The Dark River {n}"),
+        'get_existing_titles': lambda n: dm.get_existing_titles(
+            any_user(n), [f"The Dark River {i}" for i in range(100)]),
+        'get_movie_by_id': lambda n: dm.get_movie_by_id(any_movie(n)),
+        'get_collection_version': lambda n: dm.get_collection_version(any_user(n)),
+        'get_movie_collection_version': lambda n: dm.get_movie_collection_version(
+            any_movie(n)),
+        'get_collection_stats': lambda n: dm.get_collection_stats(any_user(n)),
+        'get_catalog_entries': lambda n: dm.get_catalog_entries(
+            [any_movie(n) for _ in range(10)]),
+        'get_last_collection_change': lambda n: dm.get_last_collection_change(),
+        'rebuild_collection_stats': lambda n: dm.rebuild_collection_stats(any_user(n)),
+        'add_user': lambda n: dm.add_user(f"dm-bench{n}-{rng.random()}"),
+        'add_movie': lambda n: dm.add_movie(title=f"DM Movie {n} {rng.random()}",
+                                            user_id=any_user(n)),
+        'add_movies_bulk': lambda n: dm.add_movies_bulk(
+            [dict(synthetic_movie(rng, f"{n}-{i}-{rng.random()}", any_user(n)))
+             for i in range(100)]),
+        'delete_movie': lambda n: dm.delete_movie(first_delete + n),
+        'bulk_update_movies': lambda n: dm.bulk_update_movies(
+            {any_movie(n): {'rating': rng.randint(0, 10)} for _ in range(100)}),
+        'bulk_delete_movies': lambda n: dm.bulk_delete_movies(
+            range(first_bulk_delete + 20 * n, first_bulk_delete + 20 * n + 20)),
+        'update_user_movie': lambda n: dm.update_user_movie(any_movie(n),
+                                                            {'comment': f"bench {n}"}),
+        'get_movie_with_user': lambda n: dm.get_movie_with_user(any_movie(n)),
+        'find_catalog_entry': lambda n: dm.find_catalog_entry(f"The Dark River {n}"),
+        'get_title_counts': lambda n: dm.get_title_counts(after_movie_id=movies - 10),
+        'find_similar_titles': lambda n: dm.find_similar_titles(f"dark rivr {n}",
+                                                                user_id=any_user(n)),
+        'enrich_movie': lambda n: dm.enrich_movie(any_movie(n), {
+            'director': "Christopher Nolan", 'rating': 8.8, 'imdb_id': "tt1375666"}),
+        'create_enrichment_job': lambda n: dm.create_enrichment_job(any_movie(n)),
+        'claim_enrichment_job': lambda n: dm.claim_enrichment_job(any_movie(n), lease=60),
+        'update_enrichment_job': lambda n: dm.update_enrichment_job(any_movie(n), 'done'),
+        'get_unfinished_enrichment_jobs': lambda n: dm.get_unfinished_enrichment_jobs(),
+        'get_funfacts': lambda n: dm.get_funfacts(),
+        'add_funfacts': lambda n: dm.add_funfacts('technology', [f"Fact {n}"]),
+        'take_funfact': lambda n: dm.take_funfact('technology'),
+        'count_funfacts': lambda n: dm.count_funfacts(),
+        'mark_funfacts_served': lambda n: dm.mark_funfacts_served(
+            [fact.id for fact in dm.get_funfacts()[:1]]),
+    }
+
+
+def public_methods(obj):
+    return {name for name, _ in inspect.getmembers(obj, inspect.ismethod)
+            if not name.startswith('_')} - {'remove_session'}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def app_config(workdir, database_url, omdb, deepseek, enrichment_mode):
+    """Config that points the app at the scratch database and the fake APIs."""
+    return {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'OMDB_API_URL': omdb.url,
+        'OMDB_API_KEY': 'benchmark',
+        'OMDB_CACHE_PATH': os.path.join(workdir, 'omdb_cache.db'),
+        'OMDB_ENRICHMENT_MODE': enrichment_mode,
+        'OMDB_LOG_SAMPLE_RATE': 0,
+        'DEEPSEEK_API_URL': deepseek.url,
+        'DEEPSEEK_API_KEY': 'benchmark',
+        'FUNFACT_GENERATOR': 'deepseek',
+        'ADMIN_TOKEN': ADMIN_TOKEN,
+        'RECOMMENDATIONS_PATH': os.path.join(workdir, 'recommendations.idx'),
+        # built once below, not by a background thread during the measurements
+        'RECOMMENDATIONS_REFRESH_INTERVAL': 0,
+        'AUTOCOMPLETE_REFRESH_INTERVAL': 0,
+        # the limiter runs (its cost is measured) but never rejects a request
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'rate_limits.db'),
+        'RATE_LIMIT_FUNFACT_IP': '1000000/second',
+        'RATE_LIMIT_ADD_MOVIE_IP': '1000000/second',
+        'RATE_LIMIT_ADD_MOVIE_USER': '1000000/second',
+        'RATE_LIMIT_ENRICH_IP': '1000000/second',
+        'RATE_LIMIT_ENRICH_USER': '1000000/second',
+    }
+
+
+def run(args):
+    """Run the whole suite.
+        Returns: dict: meta data, 'startup', 'routes' and 'data_manager' results
+    """
+    rng = random.Random(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="movieweb-bench-")
+    database_url = f"sqlite:///{os.path.join(workdir, 'movies.db')}"
+    results = {
+        'meta': {
+            'started': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'arguments': vars(args),
+        },
+        'startup': {},
+        'routes': {},
+        'data_manager': {},
+    }
+
+    started = time.perf_counter()
+    seed_database(database_url, users=args.users, movies=args.movies, seed=args.seed)
+    results['meta']['seed_seconds'] = time.perf_counter() - started
+    if 'startup' in args.suites:
+        results['startup'] = measure_startup(database_url, args.startup_repeat)
+        for phase, result in results['startup'].items():
+            print_result('start', phase, result)
+
+    with FakeOMDbServer(args.omdb_latency, not_found_ratio=args.not_found_ratio,
+                        seed=args.seed) as omdb, \
+            FakeDeepSeekServer(args.deepseek_latency, seed=args.seed) as deepseek:
+        flask_app = create_app(app_config(workdir, database_url, omdb, deepseek,
+                                          args.enrichment_mode))
+        started = time.perf_counter()
+        get_recommender(flask_app).refresh(force=True)
+        results['meta']['recommendations_build_seconds'] = time.perf_counter() - started
+        started = time.perf_counter()
+        get_autocomplete(flask_app).index()
+        results['meta']['autocomplete_build_seconds'] = time.perf_counter() - started
+
+        if 'routes' in args.suites:
+            scenarios = route_scenarios(flask_app, args.users, args.movies, rng)
+            covered = {endpoint for endpoint, _ in scenarios.values()}
+            results['meta']['routes_not_benchmarked'] = sorted(
+                {rule.endpoint for rule in flask_app.url_map.iter_rules()}
+                - covered - {'static'})
+            for name, (_, operation) in scenarios.items():
+                if args.only and name not in args.only:
+                    continue
+                results['routes'][name] = measure(operation, args.iterations,
+                                                  args.concurrency)
+                print_result('route', name, results['routes'][name])
+        results['meta']['omdb_requests'] = omdb.requests
+        results['meta']['deepseek_requests'] = deepseek.requests
+
+    if 'data_manager' in args.suites:
+        dm = SQLiteDataManager(database_url)
+        scenarios = data_manager_scenarios(dm, args.users, args.movies, rng)
+        results['meta']['methods_not_benchmarked'] = sorted(public_methods(dm) - set(scenarios))
+        for name, operation in scenarios.items():
+            if args.only and name not in args.only:
+                continue
+
+            def call(number, operation=operation):
+                try:
+                    return operation(number)
+                finally:
+                    dm.remove_session()  # like the end of a request
+            results['data_manager'][name] = measure(call, args.iterations, args.concurrency)
+            print_result('method', name, results['data_manager'][name])
+    return results
+
+
+def print_result(kind, name, result):
+    def ms(value):
+        return f"{value * 1000:8.2f}" if value is not None else "     n/a"
+    print(f"{kind:6} {name:32} p50 {ms(result['p50'])} ms  p95 {ms(result['p95'])} ms  "
+          f"p99 {ms(result['p99'])} ms  {result['throughput'] or 0:8.1f}/s  "
+          f"errors {result['errors']}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100, help="Synthetic users")
+    parser.add_argument("--movies", type=int, default=1000,
+                        help="Synthetic movies (1000 to 1000000)")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent callers")
+    parser.add_argument("--omdb-latency", type=float, default=0.05,
+                        help="Delay of the fake OMDb server in seconds")
+    parser.add_argument("--deepseek-latency", type=float, default=0.5,
+                        help="Delay of the fake DeepSeek server in seconds")
+    parser.add_argument("--not-found-ratio", type=float, default=0.1,
+                        help="Share of titles the fake OMDb doesn't know")
+    parser.add_argument("--enrichment-mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--suites", nargs="+", choices=("startup", "routes", "data_manager"),
+                        default=["startup", "routes", "data_manager"])
+    parser.add_argument("--startup-repeat", type=int, default=5,
+                        help="Fresh processes for the cold start measurement")
+    parser.add_argument("--only", nargs="+", help="Run only these scenarios")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Directory for the scratch databases")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results",
+                                                         "latest.json"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Fills a database with synthetic users and movies for the benchmarks.
+The same seed always produces the same data, so runs on different commits compare
+like with like. Rows are inserted with executemany in large batches, a million
+movies take well under a minute.
+"""
+
+import random
+
+from sqlalchemy import insert
+
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from data_manager.sqlalchemy_data_manager import catalog_values
+from models import CatalogEntry, CollectionVersion, Movie, User
+
+
+ADJECTIVES = ('Silent', 'Dark', 'Golden', 'Last', 'Broken', 'Hidden', 'Electric', 'Lonely',
+              'Crimson', 'Frozen', 'Wild', 'Midnight', 'Lost', 'Burning', 'Secret', 'Final')
+NOUNS = ('River', 'Empire', 'Dream', 'Horizon', 'Garden', 'Machine', 'Shadow', 'Summer',
+         'Kingdom', 'Stranger', 'Voyage', 'Island', 'Signal', 'Harbor', 'Planet', 'Witness')
+DIRECTORS = ('Christopher Nolan', 'Greta Gerwig', 'Denis Villeneuve', 'Bong Joon-ho',
+             'Kathryn Bigelow', 'Hayao Miyazaki', 'Agnès Varda', 'Akira Kurosawa')
+GENRES = ('Drama', 'Comedy', 'Sci-Fi', 'Thriller', 'Horror', 'Animation', 'Documentary',
+          'Romance')
+WORDS = ('love', 'war', 'family', 'betrayal', 'journey', 'memory', 'city', 'ocean', 'robot',
+         'detective', 'heist', 'storm', 'letter', 'music', 'escape', 'winter')
+
+
+def movie_title(rng, number):
+    """Readable, unique title for the movie with the given number."""
+    return f"The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}"
+
+
+def synthetic_movie(rng, number, user_id):
+    """Values of one movie row, every field filled like an OMDb enriched movie."""
+    return {
+        'user_id': user_id,
+        'title': movie_title(rng, number),
+        'director': rng.choice(DIRECTORS),
+        'writer': rng.choice(DIRECTORS),
+        'actors': ", ".join(rng.sample(DIRECTORS, 3)),
+        'year': rng.randint(1920, 2025),
+        'rating': round(rng.uniform(1, 10), 1),
+        'genre': ", ".join(rng.sample(GENRES, 2)),
+        'runtime': f"{rng.randint(70, 200)} min",
+        'plot': " ".join(rng.choices(WORDS, k=30)),
+        'comment': rng.choice(('', 'Must see', 'Seen twice', '')),
+    }
+
+
+def seed_database(database_url, users=100, movies=1000, seed=42, batch_size=10000):
+    """Create the schema and insert synthetic data.
+        Args:
+            database_url (str): SQLAlchemy URL of an empty database
+            users (int): Number of users
+            movies (int): Number of movies, spread evenly over the users
+            seed (int): Seed of the random generator
+            batch_size (int): Rows per executemany
+        Returns: SQLiteDataManager: Data manager of the seeded database
+    """
+    rng = random.Random(seed)
+    data_manager = SQLiteDataManager(database_url)
+    with data_manager.engine.begin() as connection:
+        user_rows = [{'id': number, 'username': f"user{number:07d}"}
+                     for number in range(1, users + 1)]
+        for start in range(0, len(user_rows), batch_size):
+            connection.execute(insert(User.__table__), user_rows[start:start + batch_size])
+            connection.execute(insert(CollectionVersion.__table__),
+                               [{'user_id': row['id'], 'version': 1, 'modified_at': 0.0}
+                                for row in user_rows[start:start + batch_size]])
+
+        batch = []
+        for number in range(1, movies + 1):
+            batch.append(synthetic_movie(rng, number, (number - 1) % users + 1))
+            if len(batch) == batch_size or number == movies:
+                insert_movies(connection, batch, first_id=number - len(batch) + 1)
+                batch = []
+    # the rows bypass the data manager, so the statistics are computed like a backfill
+    data_manager.rebuild_collection_stats()
+    return data_manager
+
+
+def insert_movies(connection, batch, first_id):
+    """Insert movies with ids from first_id on, each with a catalog entry of the same id."""
+    ids = range(first_id, first_id + len(batch))
+    connection.execute(insert(CatalogEntry.__table__),
+                       [dict(catalog_values(movie), id=number)
+                        for number, movie in zip(ids, batch)])
+    connection.execute(insert(Movie.__table__),
+                       [{'id': number, 'catalog_id': number, 'user_id': movie['user_id'],
+                         'title': movie['title'], 'rating': movie['rating'],
+                         'comment': movie['comment']}
+                        for number, movie in zip(ids, batch)])
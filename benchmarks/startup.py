@@ -0,0 +1,78 @@
+"""
+Cold start benchmark: every sample is a fresh Python process that imports the app,
+calls create_app() and serves its first request.
+
+    python -m benchmarks.startup --repeat 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.seed import seed_database
+
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app({'SQLALCHEMY_DATABASE_URI': %(database_url)r,
+                            'FUNFACT_GENERATOR': 'local'})
+created = time.perf_counter()
+status = flask_app.test_client().get('/users').status_code
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': served - created, 'status': status}))
+"""
+
+PHASES = ('import', 'create_app', 'first_request', 'total')
+
+
+def measure_startup(database_url, repeat=5):
+    """Start repeat fresh processes and time the phases of a cold start.
+        Args: database_url (str): Database the first request reads
+              repeat (int): Number of processes
+        Returns: dict: Per phase ('import', 'create_app', 'first_request' and their
+                 'total') the summary of benchmarks.run.summarize
+    """
+    from benchmarks.run import summarize
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = {phase: [] for phase in PHASES}
+    errors = 0
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD % {'database_url': database_url}],
+            cwd=root, capture_output=True, text=True)
+        if output.returncode != 0:
+            errors += 1
+            continue
+        timings = json.loads(output.stdout.strip().splitlines()[-1])
+        errors += timings['status'] >= 500
+        for phase in PHASES[:-1]:
+            samples[phase].append(timings[phase])
+        samples['total'].append(sum(timings[phase] for phase in PHASES[:-1]))
+    return {phase: summarize(values, sum(values), errors) for phase, values in samples.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold start of the app")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--movies", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="movieweb-startup-")
+    database_url = f"sqlite:///{os.path.join(workdir, 'movies.db')}"
+    seed_database(database_url, users=10, movies=args.movies)
+    results = measure_startup(database_url, args.repeat)
+    for phase, result in results.items():
+        print(f"{phase:14} p50 {result['p50'] * 1000:8.1f} ms  "
+              f"p95 {result['p95'] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Bulk import of movie collections for the MovieWeb application.
+Reads a CSV or JSON Lines file row by row, checks a whole batch of titles against the
+collection with one query, optionally fills missing fields from OMDb with a bounded
+number of concurrent requests and inserts every batch in a single transaction.
+Only one batch is held in memory at a time, so the file size doesn't matter.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+from itertools import islice
+import json
+import logging
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from data_manager.sqlalchemy_data_manager import title_key
+from models import CATALOG_FIELDS, check_rating
+
+
+MOVIE_FIELDS = ('title', 'director', 'writer', 'actors', 'year', 'rating', 'genre',
+                'runtime', 'plot', 'comment')
+ENRICHABLE_FIELDS = ('director', 'writer', 'actors', 'year', 'rating', 'genre',
+                     'runtime', 'plot')
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportReport:
+    """Counters of an import run."""
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"row {line}: {message}")
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def summary(self):
+        return (f"{self.rows} rows: {self.inserted} imported, {self.duplicates} duplicates, "
+                f"{self.failed} failed in {self.elapsed:.2f}s "
+                f"({self.rows_per_second:.0f} rows/s)")
+
+
+def detect_format(filename):
+    """Guess the file format from the file name.
+        Returns: str: 'csv' or 'jsonl', None if unknown
+    """
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(stream, file_format):
+    """Stream the rows of an import file.
+        Args: stream: Binary or text file object
+              file_format (str): 'csv' (with header line) or 'jsonl'
+        Yields: tuple: (line number, dict of raw values or an error message)
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield number, row
+    elif file_format == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, f"invalid JSON ({e})"
+                continue
+            yield number, row if isinstance(row, dict) else "expected a JSON object"
+    else:
+        raise ValueError(f"Unknown import format: {file_format!r}")
+
+
+def clean_row(raw):
+    """Validate and convert one raw import row.
+        Args: raw (dict): Values as read from the file
+        Returns: dict: Values for every movie field (None if missing)
+        Raises: ValueError: with a message for the report
+    """
+    row = {}
+    for field in MOVIE_FIELDS:
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip() or None
+        row[field] = value
+
+    if not row['title']:
+        raise ValueError("title is missing")
+    row['title'] = str(row['title'])
+    if row['year'] is not None:
+        try:
+            row['year'] = int(row['year'])
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid year {row['year']!r}")
+    row['rating'] = check_rating(row['rating'])
+    return row
+
+
+def enrich_rows(rows, fetch, executor):
+    """Fill the empty fields of rows with OMDb data, concurrency is bounded by executor.
+        Args: rows (List[dict]): Cleaned rows, changed in place
+              fetch (callable): title -> sanitized OMDb dict or None
+              executor: ThreadPoolExecutor limiting the concurrent requests
+    """
+    def lookup(row):
+        try:
+            return fetch(row['title']) or {}
+        except Exception as e:
+            logging.warning("OMDb lookup for '%s' failed during import: %s", row['title'], e)
+            return {}
+
+    pending = [row for row in rows
+               if any(row[field] is None for field in ENRICHABLE_FIELDS)]
+    for row, omdb_data in zip(pending, executor.map(lookup, pending)):
+        if omdb_data.get('imdb_id') and all(row[field] is None for field in CATALOG_FIELDS):
+            # nothing of the file's own, the movie shares the catalog entry
+            row['imdb_id'] = omdb_data['imdb_id']
+            row['imdb_rating'] = omdb_data.get('rating')
+        for field in ENRICHABLE_FIELDS:
+            if row[field] is None and omdb_data.get(field) is not None:
+                row[field] = omdb_data[field]
+
+
+def import_movies(data_manager, user_id, stream, file_format, fetch=None, batch_size=500,
+                  concurrency=4):
+    """Import a movie file into the collection of a user.
+        Args:
+            data_manager: Data manager to write to
+            user_id (int): ID of the user owning the movies
+            stream: Binary or text file object
+            file_format (str): 'csv' or 'jsonl'
+            fetch (callable, optional): title -> sanitized OMDb dict, enables enrichment
+            batch_size (int): Rows per transaction
+            concurrency (int): Maximum number of concurrent OMDb requests
+        Returns: ImportReport
+        Raises: ValueError: for an unknown file format
+    """
+    report = ImportReport()
+    rows = read_rows(stream, file_format)
+    executor = ThreadPoolExecutor(max_workers=concurrency,
+                                  thread_name_prefix="import-enrichment") if fetch else None
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            _import_batch(data_manager, user_id, batch, report, fetch, executor)
+    finally:
+        if executor:
+            executor.shutdown()
+    return report.finish()
+
+
+def _import_batch(data_manager, user_id, batch, report, fetch, executor):
+    """Validate, deduplicate, enrich and insert one batch of raw rows."""
+    movies = {}
+    for line, raw in batch:
+        report.rows += 1
+        if isinstance(raw, str):
+            report.add_error(line, raw)
+            continue
+        try:
+            row = clean_row(raw)
+        except ValueError as e:
+            report.add_error(line, str(e))
+            continue
+        key = title_key(row['title'])
+        if key in movies:
+            report.duplicates += 1
+            continue
+        movies[key] = (line, row)
+
+    # one query for the whole batch instead of movie_exists per row
+    existing = data_manager.get_existing_titles(
+        user_id, [row['title'] for _, row in movies.values()])
+    report.duplicates += len(existing)
+    lines = [line for key, (line, _) in movies.items() if key not in existing]
+    new_movies = [row for key, (_, row) in movies.items() if key not in existing]
+
+    if fetch and new_movies:
+        enrich_rows(new_movies, fetch, executor)
+    for row in new_movies:
+        row['user_id'] = user_id
+
+    try:
+        inserted = data_manager.add_movies_bulk(new_movies)
+        report.inserted += inserted
+        # backends with INSERT ... ON CONFLICT skip titles added meanwhile
+        report.duplicates += len(new_movies) - inserted
+    except IntegrityError:
+        # someone added one of the titles meanwhile - fall back to row by row
+        for line, row in zip(lines, new_movies):
+            if data_manager.movie_exists(user_id, row['title']):
+                report.duplicates += 1
+            elif data_manager.add_movie(**row):
+                report.inserted += 1
+            else:
+                report.add_error(line, f"could not save '{row['title']}'")
@@ -0,0 +1,161 @@
+"""
+Statistics of the movie collections for the MovieWeb application: number of movies,
+average rating, total runtime and the movies per genre, decade and director.
+They are kept in the collection_stats and collection_stat_counts tables and updated
+in the transaction of every write to a collection, so reading them doesn't depend on
+the size of the collection. The free-text runtime ("148 min") and the comma separated
+genres and directors are parsed when a movie is written, not when the page is read.
+A write collects the contributions of the movies it removes and adds in a StatsDelta,
+which is then applied with a few statements (apply_delta). rebuild() recomputes the
+statistics of users from their movies, for the migration and the rebuild-stats command.
+"""
+
+from collections import Counter, defaultdict
+import re
+
+from sqlalchemy import bindparam, text
+
+
+KINDS = ('genre', 'decade', 'director')
+TOTALS = ('movie_count', 'rated_count', 'rating_sum', 'runtime_count', 'runtime_sum')
+# the values of a movie its contribution is computed from
+STATS_FIELDS = ('rating', 'year', 'genre', 'director', 'runtime')
+
+RUNTIME_PART = re.compile(r"(\d+)\s*(h|hr|hrs|hours?|m|min|mins|minutes?)?\b", re.IGNORECASE)
+
+UPDATE_TOTALS = text(
+    "UPDATE collection_stats SET movie_count = movie_count + :movie_count,"
+    " rated_count = rated_count + :rated_count, rating_sum = rating_sum + :rating_sum,"
+    " runtime_count = runtime_count + :runtime_count,"
+    " runtime_sum = runtime_sum + :runtime_sum"
+    " WHERE user_id = :user_id")
+# the same upsert syntax works on SQLite and PostgreSQL
+UPSERT_COUNT = text(
+    "INSERT INTO collection_stat_counts (user_id, kind, name, movie_count)"
+    " VALUES (:user_id, :kind, :name, :movie_count)"
+    " ON CONFLICT (user_id, kind, name) DO UPDATE"
+    " SET movie_count = collection_stat_counts.movie_count + excluded.movie_count")
+DELETE_EMPTY_COUNTS = text(
+    "DELETE FROM collection_stat_counts WHERE user_id IN :user_ids AND movie_count <= 0"
+).bindparams(bindparam('user_ids', expanding=True))
+
+
+def parse_runtime(runtime):
+    """Minutes of a runtime like "148 min", "2h 28min" or "90".
+        Returns: int: Minutes or None if there is no runtime
+    """
+    if runtime is None:
+        return None
+    minutes = None
+    for number, unit in RUNTIME_PART.findall(str(runtime)):
+        factor = 60 if unit and unit[0].lower() == 'h' else 1
+        minutes = (minutes or 0) + int(number) * factor
+    return minutes or None
+
+
+def split_names(value):
+    """Names of a comma separated field like genre ("Action, Sci-Fi") or director."""
+    if not value:
+        return []
+    names = (name.strip() for name in str(value).split(','))
+    return [name for name in dict.fromkeys(names) if name and name != 'N/A']
+
+
+def decade(year):
+    """Decade of a year as shown on the statistics page ("1990s")."""
+    if not year:
+        return None
+    return f"{int(year) // 10 * 10}s"
+
+
+class StatsDelta:
+    """Changes to the statistics of collections, collected during a write and applied in
+    its transaction with apply_delta."""
+    def __init__(self):
+        self.totals = defaultdict(Counter)  # user_id -> changes of TOTALS
+        self.counts = Counter()  # (user_id, kind, name) -> change of the movie count
+
+    def add(self, user_id, movie, sign=1):
+        """Add (or with sign -1 remove) the contribution of a movie.
+            Args: user_id (int): Owner of the collection
+                  movie: Mapping or object with the STATS_FIELDS
+                  sign (int): 1 for a movie added to the collection, -1 for one removed
+        """
+        if user_id is None:
+            return  # not in a collection
+        if isinstance(movie, dict):
+            rating, year, genre, director, runtime = (movie.get(f) for f in STATS_FIELDS)
+        else:
+            rating, year, genre, director, runtime = (getattr(movie, f) for f in STATS_FIELDS)
+        totals = self.totals[user_id]
+        totals['movie_count'] += sign
+        if rating is not None:
+            totals['rated_count'] += sign
+            totals['rating_sum'] += sign * rating
+        minutes = parse_runtime(runtime)
+        if minutes is not None:
+            totals['runtime_count'] += sign
+            totals['runtime_sum'] += sign * minutes
+        for kind, names in (('genre', split_names(genre)),
+                            ('decade', [decade(year)] if decade(year) else []),
+                            ('director', split_names(director))):
+            for name in names:
+                self.counts[(user_id, kind, name)] += sign
+
+    def remove(self, user_id, movie):
+        self.add(user_id, movie, sign=-1)
+
+
+def apply_delta(connection, delta):
+    """Apply the changes to the statistics tables.
+        Args: connection: Session or Connection of the write transaction
+              delta (StatsDelta): Changes collected during the write
+    """
+    totals = [dict({name: changes[name] for name in TOTALS}, user_id=user_id)
+              for user_id, changes in delta.totals.items() if any(changes.values())]
+    if totals:
+        connection.execute(UPDATE_TOTALS, totals)
+    counts = [{'user_id': user_id, 'kind': kind, 'name': name, 'movie_count': change}
+              for (user_id, kind, name), change in delta.counts.items() if change]
+    if counts:
+        connection.execute(UPSERT_COUNT, counts)
+        if any(count['movie_count'] < 0 for count in counts):
+            connection.execute(DELETE_EMPTY_COUNTS,
+                               {'user_ids': sorted({count['user_id'] for count in counts})})
+
+
+def rebuild(connection, user_ids):
+    """Recompute the statistics of users from their movies. Run it in one transaction
+    with the write lock (SQLite) or row locks (PostgreSQL) taken by the reset, so
+    concurrent writes are neither lost nor counted twice.
+        Args: connection (Connection): Connection in a transaction
+              user_ids (list): Users whose statistics are rebuilt
+    """
+    if not user_ids:
+        return
+    params = {'user_ids': list(user_ids)}
+    # users created before the statistics tables existed have no row yet
+    connection.execute(text(
+        "INSERT INTO collection_stats"
+        " (user_id, movie_count, rated_count, rating_sum, runtime_count, runtime_sum)"
+        " SELECT id, 0, 0, 0, 0, 0 FROM users WHERE id IN :user_ids AND id NOT IN"
+        " (SELECT user_id FROM collection_stats WHERE user_id IN :user_ids)"
+    ).bindparams(bindparam('user_ids', expanding=True)), params)
+    connection.execute(text(
+        "UPDATE collection_stats SET movie_count = 0, rated_count = 0, rating_sum = 0,"
+        " runtime_count = 0, runtime_sum = 0 WHERE user_id IN :user_ids"
+    ).bindparams(bindparam('user_ids', expanding=True)), params)
+    connection.execute(text(
+        "DELETE FROM collection_stat_counts WHERE user_id IN :user_ids"
+    ).bindparams(bindparam('user_ids', expanding=True)), params)
+
+    delta = StatsDelta()
+    rows = connection.execute(text(
+        "SELECT user_movies.user_id, user_movies.rating, catalog.year, catalog.genre,"
+        " catalog.director, catalog.runtime"
+        " FROM user_movies JOIN catalog ON catalog.id = user_movies.catalog_id"
+        " WHERE user_movies.user_id IN :user_ids"
+    ).bindparams(bindparam('user_ids', expanding=True)), params)
+    for row in rows:
+        delta.add(row.user_id, row)
+    apply_delta(connection, delta)
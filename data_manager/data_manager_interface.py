@@ -2,27 +2,235 @@ from abc import ABC, abstractmethod
 
 
 class DataManagerInterface(ABC):
+    """Everything the routes, the background workers and the import/export need from a
+    database backend. See SQLAlchemyDataManager for the documented implementation."""
+
+    @abstractmethod
+    def remove_session(self):
+        """Release the session of the current thread (end of a request or job)"""
+        pass
+
 
     @abstractmethod
     def get_all_users(self):
         pass
 
 
+    @abstractmethod
+    def get_users_page(self, cursor=None, page_size=None):
+        """One Page of users ordered by username"""
+        pass
+
+
+    @abstractmethod
+    def get_user_by_id(self, user_id):
+        pass
+
+
+    @abstractmethod
+    def get_user_by_username(self, username):
+        pass
+
+
+    @abstractmethod
+    def get_user_with_movies(self, user_id):
+        """User with the movie collection loaded"""
+        pass
+
+
+    @abstractmethod
+    def get_collection_version(self, user_id):
+        """(version, modified_at) of a collection, changes with every write to it"""
+        pass
+
+
+    @abstractmethod
+    def get_movie_collection_version(self, movie_id):
+        """(version, modified_at) of the collection a movie belongs to"""
+        pass
+
+
+    @abstractmethod
+    def get_collection_stats(self, user_id, top=10):
+        """Precomputed statistics of a collection (counts, average rating, runtime and
+        the movies per genre, decade and director)"""
+        pass
+
+
+    @abstractmethod
+    def rebuild_collection_stats(self, user_id=None, batch_size=500):
+        """Recompute the statistics of one or all collections from their movies"""
+        pass
+
+
+    @abstractmethod
+    def add_user(self, username):
+        """ID of the new user or None (e.g. if the name is taken)"""
+        pass
+
+
     @abstractmethod
     def get_user_movies(self, user_id):
         pass
 
 
     @abstractmethod
-    def movie_exists(self, user_id, title):
-        """Check if movie exists for a user"""
+    def get_user_movies_page(self, user_id, sort='title', cursor=None, page_size=None,
+                             fields=None):
+        """One Page of the movies of a user in the given sort order"""
+        pass
+
+
+    @abstractmethod
+    def iter_movies(self, fields, user_id=None, batch_size=1000, by_user=False):
+        """Stream movies as rows of the given fields, without loading all of them"""
+        pass
+
+
+    @abstractmethod
+    def get_title_counts(self, after_movie_id=None):
+        """Number of collections of every catalog entry (of the movies after an id)"""
+        pass
+
+
+    @abstractmethod
+    def get_catalog_entries(self, catalog_ids):
+        """Catalog entries in the order of the given ids, unknown ids are skipped"""
+        pass
+
+
+    @abstractmethod
+    def get_last_collection_change(self):
+        """Unix time of the latest write to any collection"""
+        pass
+
+
+    @abstractmethod
+    def search_movies(self, query, user_id=None, page=1, page_size=None):
+        """Full-text search, one Page of movies ranked by relevance"""
+        pass
+
+
+    @abstractmethod
+    def movie_exists(self, user_id, title, year=None):
+        """Check if movie exists for a user (same normalized title, same release)"""
         pass
 
+
+    @abstractmethod
+    def get_existing_titles(self, user_id, titles):
+        """Set based version of movie_exists"""
+        pass
+
+
+    @abstractmethod
+    def get_movie_by_id(self, movie_id):
+        pass
+
+
+    @abstractmethod
+    def get_movie_with_user(self, movie_id):
+        pass
+
+
+    @abstractmethod
+    def find_catalog_entry(self, title):
+        """OMDb data of a title from the shared catalog, None if nobody added it yet"""
+        pass
+
+
+    @abstractmethod
+    def find_similar_titles(self, title, user_id=None, limit=5):
+        """Catalog titles similar to a title, the most similar first"""
+        pass
+
+
+    @abstractmethod
+    def add_movie(self, title, director=None, year=None, rating=None, user_id=None,
+                  genre=None, plot=None, comment=None, writer=None, actors=None,
+                  runtime=None, imdb_id=None, imdb_rating=None):
+        """ID of the new movie or None (e.g. if the user already has the title)"""
+        pass
+
+
+    @abstractmethod
+    def add_movies_bulk(self, movies, returning=False):
+        """Insert many movies in one transaction, returns the number inserted (or
+        their (id, title) rows)"""
+        pass
+
+
     @abstractmethod
     def update_user_movie(self, movie_id, updated_data):
         pass
 
 
     @abstractmethod
-    def get_user_by_username(self, username):
+    def bulk_update_movies(self, updates, user_id=None):
+        """Change the rating or comment of many movies in one transaction, returns the
+        result of every movie ("updated", "not found" or why the changes are invalid)"""
+        pass
+
+
+    @abstractmethod
+    def bulk_delete_movies(self, movie_ids, user_id=None):
+        """Delete many movies in one transaction, returns "deleted" or "not found" for
+        every movie"""
+        pass
+
+
+    @abstractmethod
+    def enrich_movie(self, movie_id, omdb_data):
+        """Fill the empty fields of a movie, shares the catalog entry if possible"""
+        pass
+
+
+    @abstractmethod
+    def delete_movie(self, movie_id):
+        pass
+
+
+    @abstractmethod
+    def create_enrichment_job(self, movie_id):
+        pass
+
+
+    @abstractmethod
+    def update_enrichment_job(self, movie_id, status, attempts=None, last_error=None):
+        pass
+
+
+    @abstractmethod
+    def claim_enrichment_job(self, movie_id, lease):
+        pass
+
+
+    @abstractmethod
+    def get_unfinished_enrichment_jobs(self):
+        pass
+
+
+    @abstractmethod
+    def get_funfacts(self, served=False):
+        pass
+
+
+    @abstractmethod
+    def add_funfacts(self, theme, facts, served=False):
+        pass
+
+
+    @abstractmethod
+    def take_funfact(self, theme):
+        """Claim the oldest unused fun fact of a theme, see FunFactPool.take"""
+        pass
+
+
+    @abstractmethod
+    def count_funfacts(self):
+        pass
+
+
+    @abstractmethod
+    def mark_funfacts_served(self, fact_ids, keep_per_theme=20):
         pass
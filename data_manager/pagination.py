@@ -0,0 +1,122 @@
+"""
+Keyset (seek) pagination for the data managers.
+Instead of OFFSET, a page continues after (or before) the sort values of the last
+(or first) row of the previous page. With a matching index every page costs the same,
+no matter how far the user has paged into a collection.
+"""
+
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class Page:
+    """One page of results plus the cursors to its neighbours."""
+    def __init__(self, items, next_cursor=None, prev_cursor=None, sort=None, page_size=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.sort = sort
+        self.page_size = page_size
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def clamp_page_size(page_size):
+    """Limit a requested page size to 1..MAX_PAGE_SIZE."""
+    if not page_size:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+
+def encode_cursor(direction, values):
+    """Build an opaque cursor string.
+        Args: direction (str): 'next' or 'prev'
+              values (list): Sort key values of the boundary row
+        Returns: str: URL safe cursor
+    """
+    raw = json.dumps([direction, list(values)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key_count):
+    """Parse a cursor created by encode_cursor.
+        Args: cursor (str): Cursor from the query string
+              key_count (int): Number of sort keys the cursor must contain
+        Returns: tuple: (direction, values)
+        Raises: ValueError: if the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if direction not in ('next', 'prev') or not isinstance(values, list) \
+            or len(values) != key_count:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return direction, values
+
+
+def seek_condition(keys, values, reverse=False):
+    """Build "keys come after values" for a keyset page.
+    Written as k1 >= v1 AND (k1 > v1 OR ...) instead of a row value comparison,
+    because SQLite only uses the leading key of an expression index as a range
+    for this form.
+    """
+    key, value = keys[0], values[0]
+    after = key < value if reverse else key > value
+    if len(keys) == 1:
+        return after
+    at_or_after = key <= value if reverse else key >= value
+    return and_(at_or_after, or_(after, seek_condition(keys[1:], values[1:], reverse)))
+
+
+def keyset_page(query, keys, cursor=None, page_size=None, descending=False, sort=None):
+    """Fetch one page of a query ordered by keys.
+        Args:
+            query: SQLAlchemy query for one entity with all filters applied, but
+                without ORDER BY
+            keys (list): Sort expressions, the last one must be unique (e.g. the id)
+            cursor (str, optional): Cursor of the page to fetch, None for the first page
+            page_size (int, optional): Rows per page (capped at MAX_PAGE_SIZE)
+            descending (bool): Sort all keys descending
+            sort (str, optional): Name of the sort order, stored on the page
+        Returns: Page
+        Raises: ValueError: if the cursor is malformed
+    """
+    page_size = clamp_page_size(page_size)
+    direction, values = ('next', None)
+    if cursor:
+        direction, values = decode_cursor(cursor, len(keys))
+
+    # walking backwards means reading in the opposite order and flipping the result
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+    if values is not None:
+        query = query.filter(seek_condition(keys, values, reverse))
+    query = query.order_by(*[key.desc() if reverse else key.asc() for key in keys])
+
+    # the key values are selected as well, so cursors use exactly what the DB compares
+    rows = query.add_columns(*keys).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor('next', rows[-1][1:])
+        if (values is not None and not backwards) or (backwards and has_more):
+            prev_cursor = encode_cursor('prev', rows[0][1:])
+    return Page([row[0] for row in rows], next_cursor=next_cursor,
+                prev_cursor=prev_cursor, sort=sort, page_size=page_size)
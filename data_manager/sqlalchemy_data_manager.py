@@ -0,0 +1,1136 @@
+"""
+Data manager for any database SQLAlchemy supports. The backends subclass it and only
+replace what needs database specific SQL, e.g. the engine setup and the search.
+
+All methods share one scoped session per thread, i.e. one session per Flask request.
+The app removes it in teardown_appcontext (see remove_session), so returned objects
+stay attached while the templates render. Every method loads the relationships its
+callers need explicitly, so rendering never triggers extra lazy loads.
+
+The metadata of a movie lives in the shared catalog (see models.CatalogEntry). Movies
+with an IMDb ID share one entry, changing a shared entry for one user copies it first
+(see _own_catalog_entry), so the other collections never change.
+
+Every write to a collection updates its statistics in the same transaction (see
+collection_stats), reading them never touches the movies.
+
+Duplicates are found by the normalized titles (see titles), not by the exact title.
+"""
+
+from sqlalchemy import and_, delete, exists, func, insert, or_, select, update
+from sqlalchemy.orm import (contains_eager, joinedload, load_only, scoped_session,
+                            sessionmaker)
+from collection_stats import apply_delta, KINDS, rebuild, STATS_FIELDS, StatsDelta
+from data_manager.data_manager_interface import DataManagerInterface
+from data_manager.pagination import keyset_page
+from data_manager.sqlite_engine import is_lock_error, retry_on_lock
+from migrations import upgrade
+from models import (ALL_USERS, CATALOG_FIELDS, CatalogEntry, check_rating,
+                    CollectionStatCount, CollectionStats, CollectionVersion, EnrichmentJob,
+                    FunFact, MOVIE_SORT_EXPRESSIONS, User, Movie)
+from titles import normalize_title, same_release, similarity, split_year
+from abc import abstractmethod
+from collections import defaultdict, namedtuple
+import logging
+import time
+
+
+# a row of get_title_counts
+TitleCount = namedtuple('TitleCount', 'title year imdb_id movie_count last_movie_id')
+
+# entries read from the trigram index per similar title lookup, and the least share of
+# trigrams a hint has in common with the typed title
+SIMILAR_CANDIDATES = 50
+MIN_SIMILARITY = 0.2
+
+# fields of the user's own movie that bulk_update_movies changes, the catalog fields go
+# through update_user_movie
+BULK_FIELDS = ('rating', 'comment')
+
+# statements of take_funfact before it gives up on facts other processes keep taking
+TAKE_FUNFACT_ATTEMPTS = 3
+
+
+# SQLite's lower() only folds ASCII letters, title_key mirrors it in Python
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def title_key(title):
+    """Key of a title in the unique (user_id, lower(title)) index.
+        Args: title (str): Movie title
+        Returns: str: The title as SQLite's lower() returns it
+    """
+    return title.translate(_ASCII_LOWER)
+
+
+def check_bulk_changes(changes):
+    """Validate the changes of one movie of bulk_update_movies before anything is written.
+        Args: changes (dict): New values of BULK_FIELDS
+        Returns: dict: The changes with the rating as float
+        Raises: ValueError: with a message for the result of the movie
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("expected the changed fields")
+    unknown = [field for field in changes if field not in BULK_FIELDS]
+    if unknown:
+        raise ValueError(f"can't change {', '.join(map(str, unknown))} of many movies at once")
+    changes = dict(changes)
+    if 'rating' in changes:
+        changes['rating'] = check_rating(changes['rating'])
+    return changes
+
+
+def catalog_values(movie):
+    """Values of the catalog entry of a new movie.
+        Args: movie (dict): Movie values (see add_movie), imdb_id and imdb_rating optional
+        Returns: dict: Values of the catalog columns
+    """
+    values = {field: movie.get(field) for field in CATALOG_FIELDS}
+    values.update(title=movie['title'], normalized_title=normalize_title(movie['title']),
+                  imdb_id=movie.get('imdb_id'), imdb_rating=movie.get('imdb_rating'))
+    return values
+
+
+class SQLAlchemyDataManager(DataManagerInterface):
+    """Database operations of the movie web application on an SQLAlchemy engine.
+    Subclasses implement search_movies and _similar_candidates with the full-text and
+    trigram indexes of their database."""
+    def __init__(self, engine, lock_retries=0, lock_backoff=0.05):
+        """
+               Migrate the database and set up the sessions.
+
+               Args:
+                   engine (Engine): Engine of the database
+                   lock_retries (int): Retries of a write that hit a database lock
+                   lock_backoff (float): Seconds before the first retry, doubled each time
+               """
+        self.engine = engine
+        self.lock_retries = lock_retries
+        self.lock_backoff = lock_backoff
+        upgrade(self.engine)  # create or migrate the schema to the latest version
+        # one session per thread/request, objects stay usable after commit
+        self.Session = scoped_session(sessionmaker(bind=self.engine, expire_on_commit=False))
+
+
+    def remove_session(self):
+        """Close the session of the current thread. Called at the end of every request
+        and by background workers after each job."""
+        self.Session.remove()
+
+
+    def get_all_users(self):
+        """Retrieve all users from the database.
+           Returns: List[User]: All user objects in the database
+        """
+        session = self.Session()
+        return session.query(User).all()
+
+
+    def get_user_movies(self, user_id):
+        """Get all movies for a specific user.
+           Args: user_id (int): ID of the user
+           Returns:
+           List[Movie]: Movies associated with the user or empty list if not found
+        """
+        session = self.Session()
+        return session.query(Movie).options(
+            joinedload(Movie.enrichment)
+        ).filter_by(user_id=user_id).all()
+
+
+    def get_user_movies_page(self, user_id, sort='title', cursor=None, page_size=None,
+                             fields=None):
+        """Get one page of the movies of a user (keyset pagination).
+           Args: user_id (int): ID of the user
+                 sort (str): 'title', 'year', 'rating' or 'id', prefix '-' for descending
+                 cursor (str, optional): next/prev cursor of an earlier page
+                 page_size (int, optional): Movies per page (capped)
+                 fields (Sequence[str], optional): Only load these columns (the id is
+                     always loaded), e.g. to skip plot and comment
+           Returns: Page: Movies of the page with next_cursor and prev_cursor
+           Raises: ValueError: for an unknown sort order or a malformed cursor
+        """
+        keys = MOVIE_SORT_EXPRESSIONS.get(sort.lstrip('-'))
+        if keys is None:
+            raise ValueError(f"Unknown sort order: {sort!r}")
+        session = self.Session()
+        # joined explicitly, the year sort orders by a catalog column
+        query = session.query(Movie).join(Movie.catalog).options(
+            joinedload(Movie.enrichment)
+        ).filter(Movie.user_id == user_id)
+        if fields is None:
+            query = query.options(contains_eager(Movie.catalog))
+        else:
+            query = query.options(
+                load_only(Movie.id, *[getattr(Movie, name) for name in fields
+                                      if name not in CATALOG_FIELDS]),
+                contains_eager(Movie.catalog).load_only(
+                    CatalogEntry.id, *[getattr(CatalogEntry, name) for name in fields
+                                       if name in CATALOG_FIELDS]))
+        return keyset_page(query, keys, cursor=cursor, page_size=page_size,
+                           descending=sort.startswith('-'), sort=sort)
+
+
+    def get_users_page(self, cursor=None, page_size=None):
+        """Get one page of all users ordered by username (keyset pagination).
+           Args: cursor (str, optional): next/prev cursor of an earlier page
+                 page_size (int, optional): Users per page (capped)
+           Returns: Page: Users of the page with next_cursor and prev_cursor
+           Raises: ValueError: for a malformed cursor
+        """
+        session = self.Session()
+        return keyset_page(session.query(User), [User.username, User.id],
+                           cursor=cursor, page_size=page_size, sort='username')
+
+
+    def iter_movies(self, fields, user_id=None, batch_size=1000, by_user=False):
+        """Stream movies as plain rows, ordered by id, without loading all of them.
+           Uses its own connection with a streaming cursor, so it can outlive the
+           request session of a streamed response.
+           Args: fields (Sequence[str]): Column names, in the order of the row values
+                 user_id (int, optional): Only the movies of this user, default all
+                 batch_size (int): Rows fetched from the cursor at a time
+                 by_user (bool): Order by user_id first, so every collection is one
+                     run of rows (uses the (user_id, id) index)
+           Yields: Row: One tuple of values per movie
+        """
+        columns = [(CatalogEntry if name in CATALOG_FIELDS else Movie).__table__.c[name]
+                   for name in fields]
+        order = [Movie.user_id, Movie.id] if by_user else [Movie.id]
+        query = select(*columns).select_from(
+            Movie.__table__.join(CatalogEntry.__table__)).order_by(*order)
+        if user_id is not None:
+            query = query.where(Movie.user_id == user_id)
+        with self.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True, yield_per=batch_size
+            ).execute(query)
+            for partition in result.partitions():
+                yield from partition
+
+
+    def get_user_by_id(self, user_id):
+        """Retrieve a user by their ID.
+               Args: user_id (int): User ID to search for
+               Returns: User: The user object or None if not found
+        """
+        session = self.Session()
+        return session.query(User).filter_by(id=user_id).first()
+
+
+    def get_user_with_movies(self, user_id):
+        """Retrieve a user together with the movie collection in one query.
+               Args: user_id (int): User ID to search for
+               Returns: User: The user object with loaded movies or None if not found
+        """
+        session = self.Session()
+        return session.query(User).options(
+            joinedload(User.movies).joinedload(Movie.enrichment)
+        ).filter_by(id=user_id).first()
+
+
+    def get_user_by_username(self, username):
+        """Find a user by their username.
+               Args: username (str): Username to search for
+               Returns: User: User object or None if not found
+        """
+        session = self.Session()
+        return session.query(User).filter_by(username=username).first()
+
+
+    def movie_exists(self, user_id, title, year=None):
+        """Check if a movie already exists for a user: a movie with the same normalized
+           title (see titles.normalize_title) that isn't another release of it. One
+           lookup of the (user_id, normalized_title) index.
+                Args: user_id (int): ID of the user
+                      title (str): Movie title to check, "Heat (1995)" gives the year
+                      year (int, optional): Release year, if it isn't in the title
+                Returns: bool: True if movie exists, False otherwise
+        """
+        return bool(self._existing(user_id, [title], years={title: year}))
+
+
+    def get_existing_titles(self, user_id, titles):
+        """Set based version of movie_exists for many titles at once.
+                Args: user_id (int): ID of the user
+                      titles (Iterable[str]): Movie titles to check
+                Returns: Set[str]: title_key() of every title the user already has
+        """
+        return self._existing(user_id, titles)
+
+
+    def _existing(self, user_id, titles, years=None):
+        """title_key() of the titles the user has, see movie_exists."""
+        wanted = {}
+        for title in titles:
+            year = (years or {}).get(title) or split_year(title)[1]
+            wanted[title_key(title)] = (normalize_title(title), year)
+        if not wanted:
+            return set()
+        session = self.Session()
+        rows = session.query(Movie.title, Movie.normalized_title, CatalogEntry.year).join(
+            Movie.catalog
+        ).filter(
+            Movie.user_id == user_id,
+            Movie.normalized_title.in_({normalized for normalized, _ in wanted.values()})
+        ).all()
+        owned = {}
+        for title, normalized, year in rows:
+            owned.setdefault(normalized, []).append((title_key(title), year))
+        return {key for key, (normalized, year) in wanted.items()
+                if any(key == owned_key or same_release(year, owned_year)
+                       for owned_key, owned_year in owned.get(normalized, ()))}
+
+
+    def get_movie_by_id(self, movie_id):
+        """Retrieve a movie by its ID
+                Args: movie_id (int): ID of the movie
+                Returns: Movie: Movie object or None if not found
+        """
+        session = self.Session()
+        return session.query(Movie).filter_by(id=movie_id).first()
+
+
+    def find_catalog_entry(self, title):
+        """Find the OMDb data of a title in the shared catalog by its normalized title,
+        so OMDb is asked only once per movie, however it is typed ("inception",
+        "Inception (2010)"). Uses its own connection, so it can be called from any thread.
+                Args: title (str): Movie title, a year in it ("Heat (1995)") has to match
+                Returns: Row: imdb_id, title, the catalog fields and imdb_rating of the
+                         entry or None if no user added the movie yet
+        """
+        _, year = split_year(title)
+        query = select(
+            CatalogEntry.imdb_id, CatalogEntry.title,
+            *[getattr(CatalogEntry, field) for field in CATALOG_FIELDS],
+            CatalogEntry.imdb_rating
+        ).where(
+            CatalogEntry.normalized_title == normalize_title(title),
+            CatalogEntry.imdb_id.is_not(None)
+        ).order_by(CatalogEntry.id).limit(1)
+        if year is not None:
+            query = query.where(CatalogEntry.year == year)
+        with self.engine.connect() as connection:
+            return connection.execute(query).first()
+
+
+    def find_similar_titles(self, title, user_id=None, limit=5):
+        """Catalog titles similar to a title, e.g. as hints while it is typed. The
+        candidates come from the trigram index of the backend, they are ranked by the
+        trigrams they share with the title.
+                Args: title (str): Title as typed
+                      user_id (int, optional): Mark the titles this user already has
+                      limit (int): Number of titles
+                Returns: List[dict]: title, year, imdb_id, score (0.0-1.0) and
+                         in_collection, the most similar first
+        """
+        normalized = normalize_title(title)
+        if not normalized:
+            return []
+        session = self.Session()
+        best = {}
+        for entry in self._similar_candidates(session, normalized, SIMILAR_CANDIDATES):
+            score = similarity(normalized, entry.normalized_title)
+            if score < MIN_SIMILARITY:
+                continue
+            # every collection may have its own entry of a movie, show it once
+            key = (entry.normalized_title, entry.year)
+            if key not in best or (entry.imdb_id is not None
+                                   and best[key][1].imdb_id is None):
+                best[key] = (score, entry)
+        ranked = sorted(best.values(), key=lambda hit: (-hit[0], hit[1].title))[:limit]
+        owned = set()
+        if user_id is not None and ranked:
+            owned = {row[0] for row in session.query(Movie.normalized_title).filter(
+                Movie.user_id == user_id,
+                Movie.normalized_title.in_({entry.normalized_title for _, entry in ranked}))}
+        return [{'title': entry.title, 'year': entry.year, 'imdb_id': entry.imdb_id,
+                 'score': round(score, 3), 'in_collection': entry.normalized_title in owned}
+                for score, entry in ranked]
+
+
+    @abstractmethod
+    def _similar_candidates(self, session, normalized, limit):
+        """Catalog entries that share trigrams with a normalized title, from the trigram
+        index of the backend.
+            Returns: List[Row]: title, normalized_title, year and imdb_id of at most limit
+                     entries
+        """
+
+
+    def get_title_counts(self, after_movie_id=None):
+        """Get the number of collections of every catalog entry, e.g. to rank titles by
+        popularity.
+                Args: after_movie_id (int, optional): Only count the movies with a larger
+                      id (the ones added since), entries without them are left out
+                Returns: List[Row]: title, year, imdb_id, movie_count and last_movie_id
+                         (largest counted movie id, None without movies) per entry
+        """
+        session = self.Session()
+        if after_movie_id is None:
+            return session.query(
+                CatalogEntry.title, CatalogEntry.year, CatalogEntry.imdb_id,
+                func.count(Movie.id).label('movie_count'),
+                func.max(Movie.id).label('last_movie_id')
+            ).outerjoin(Movie, Movie.catalog_id == CatalogEntry.id).group_by(
+                CatalogEntry.id).all()
+        # the new movies are a range of the primary key, they are counted here because a
+        # GROUP BY makes SQLite read the whole catalog (or catalog index) instead
+        counts = {}
+        for row in session.query(CatalogEntry.id, CatalogEntry.title, CatalogEntry.year,
+                                 CatalogEntry.imdb_id, Movie.id).select_from(Movie).join(
+                Movie.catalog).filter(Movie.id > after_movie_id):
+            catalog_id, title, year, imdb_id, movie_id = row
+            count = counts.get(catalog_id)
+            if count is not None:
+                count = count._replace(movie_count=count.movie_count + 1,
+                                       last_movie_id=max(count.last_movie_id, movie_id))
+            counts[catalog_id] = count or TitleCount(title, year, imdb_id, 1, movie_id)
+        return list(counts.values())
+
+
+    def get_catalog_entries(self, catalog_ids):
+        """Get catalog entries, e.g. the recommended movies.
+                Args: catalog_ids (List[int]): IDs of the entries
+                Returns: List[CatalogEntry]: The existing entries in the order of the ids
+        """
+        session = self.Session()
+        entries = {entry.id: entry for entry in session.query(CatalogEntry).filter(
+            CatalogEntry.id.in_(set(catalog_ids)))} if catalog_ids else {}
+        return [entries[catalog_id] for catalog_id in catalog_ids if catalog_id in entries]
+
+
+    def get_last_collection_change(self):
+        """Get the time of the latest write to any collection, e.g. to find out if data
+        derived from all collections is outdated.
+                Returns: float: Unix time of the change, None if nothing was written yet
+        """
+        session = self.Session()
+        return session.query(func.max(CollectionVersion.modified_at)).filter(
+            CollectionVersion.user_id != ALL_USERS).scalar()
+
+
+    def get_collection_version(self, user_id):
+        """Get the change counter of a collection, one primary key lookup.
+                Args: user_id (int): ID of the user, ALL_USERS for the user list
+                Returns: tuple: (version, modified_at) or None if the user is unknown
+        """
+        session = self.Session()
+        return session.query(CollectionVersion.version, CollectionVersion.modified_at
+                             ).filter_by(user_id=user_id).first()
+
+
+    def get_movie_collection_version(self, movie_id):
+        """Get the change counter of the collection a movie belongs to.
+                Args: movie_id (int): ID of the movie
+                Returns: tuple: (version, modified_at) or None if the movie is unknown
+        """
+        session = self.Session()
+        return session.query(CollectionVersion.version, CollectionVersion.modified_at
+                             ).join(Movie, Movie.user_id == CollectionVersion.user_id
+                                    ).filter(Movie.id == movie_id).first()
+
+
+    def get_collection_stats(self, user_id, top=10):
+        """Get the statistics of a user's collection from the precomputed tables, the
+        reads don't depend on the number of movies.
+                Args: user_id (int): ID of the user
+                      top (int): Number of genres and directors, the most frequent first
+                Returns: dict: movie_count, average_rating, total_runtime and
+                         average_runtime (minutes), genres, decades (in order) and
+                         directors as lists of (name, movie_count) or None if the user
+                         is unknown
+        """
+        session = self.Session()
+        totals = session.query(CollectionStats).filter_by(user_id=user_id).first()
+        if totals is None:
+            return None
+        stats = {
+            'movie_count': totals.movie_count,
+            'average_rating': (round(totals.rating_sum / totals.rated_count, 2)
+                               if totals.rated_count else None),
+            'total_runtime': totals.runtime_sum,
+            'average_runtime': (round(totals.runtime_sum / totals.runtime_count)
+                                if totals.runtime_count else None),
+        }
+        for kind in KINDS:
+            query = session.query(CollectionStatCount.name, CollectionStatCount.movie_count
+                                  ).filter_by(user_id=user_id, kind=kind)
+            if kind == 'decade':
+                query = query.order_by(CollectionStatCount.name)
+            else:
+                query = query.order_by(CollectionStatCount.movie_count.desc(),
+                                       CollectionStatCount.name).limit(top)
+            stats[kind + 's'] = [tuple(row) for row in query]
+        return stats
+
+
+    def rebuild_collection_stats(self, user_id=None, batch_size=500):
+        """Recompute the statistics of collections from their movies, e.g. after the
+        data was changed outside of the app. Every batch of users is one transaction.
+                Args: user_id (int, optional): Only this user, default is all users
+                      batch_size (int): Users per transaction
+                Returns: int: Number of users whose statistics were rebuilt
+        """
+        if user_id is not None:
+            user_ids = [user_id]
+        else:
+            with self.engine.connect() as connection:
+                user_ids = connection.execute(select(User.id).order_by(User.id)).scalars().all()
+        for start in range(0, len(user_ids), batch_size):
+            self._rebuild_stats_batch(user_ids[start:start + batch_size])
+        return len(user_ids)
+
+
+    @retry_on_lock()
+    def _rebuild_stats_batch(self, user_ids):
+        with self.engine.begin() as connection:
+            rebuild(connection, user_ids)
+
+
+    def _touch_collections(self, session, user_ids):
+        """Bump the versions of the collections the running transaction changes."""
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if user_ids:
+            session.query(CollectionVersion).filter(
+                CollectionVersion.user_id.in_(user_ids)
+            ).update({CollectionVersion.version: CollectionVersion.version + 1,
+                      CollectionVersion.modified_at: time.time()},
+                     synchronize_session=False)
+
+
+    def _owner_of(self, session, movie_id):
+        return session.query(Movie.user_id).filter_by(id=movie_id).scalar()
+
+
+    def _register_collection(self, session, user_id):
+        """Start the version and the statistics of a new user's collection and bump the
+        user list."""
+        session.add(CollectionVersion(user_id=user_id, version=1, modified_at=time.time()))
+        session.add(CollectionStats(user_id=user_id, movie_count=0, rated_count=0,
+                                    rating_sum=0.0, runtime_count=0, runtime_sum=0))
+        self._touch_collections(session, [ALL_USERS])
+
+
+    def _count_new_movies(self, session, rows):
+        """Add new movies to the statistics of their collections.
+            Args: rows (List[dict]): user_id, rating and catalog_id of every movie
+        """
+        rows = [row for row in rows if row.get('user_id') is not None]
+        if not rows:
+            return
+        entries = {entry.id: entry for entry in session.query(
+            CatalogEntry.id, CatalogEntry.year, CatalogEntry.genre, CatalogEntry.director,
+            CatalogEntry.runtime
+        ).filter(CatalogEntry.id.in_({row['catalog_id'] for row in rows}))}
+        delta = StatsDelta()
+        for row in rows:
+            entry = entries[row['catalog_id']]
+            delta.add(row['user_id'], {'rating': row.get('rating'), 'year': entry.year,
+                                       'genre': entry.genre, 'director': entry.director,
+                                       'runtime': entry.runtime})
+        apply_delta(session, delta)
+
+
+    def _link_catalog(self, session, movies):
+        """Catalog entries of new movies: the shared entry of their imdb_id (created on
+        first use) or a new entry of their own.
+            Returns: List[int]: catalog ids in the order of movies
+        """
+        shared = {}
+        for movie in movies:
+            if movie.get('imdb_id') is not None:
+                shared.setdefault(movie['imdb_id'], movie)
+        ids = self._shared_entry_ids(session, shared)
+        private = [catalog_values(movie) for movie in movies if movie.get('imdb_id') is None]
+        private_ids = iter(self._insert_catalog_entries(session, private) if private else [])
+        return [ids[movie['imdb_id']] if movie.get('imdb_id') is not None
+                else next(private_ids) for movie in movies]
+
+
+    def _insert_catalog_entries(self, session, entries):
+        """Insert catalog entries.
+            Returns: List[int]: Their ids in the order of entries
+        """
+        return session.execute(insert(CatalogEntry.__table__).returning(
+            CatalogEntry.id, sort_by_parameter_order=True), entries).scalars().all()
+
+
+    def _shared_entry_ids(self, session, shared):
+        """Ids of the catalog entries of IMDb IDs, missing ones are created.
+            Args: shared (dict): imdb_id -> movie values for a new entry
+            Returns: dict: imdb_id -> catalog id
+        """
+        if not shared:
+            return {}
+        ids = dict(session.query(CatalogEntry.imdb_id, CatalogEntry.id).filter(
+            CatalogEntry.imdb_id.in_(shared)).all())
+        missing = [catalog_values(movie) for imdb_id, movie in shared.items()
+                   if imdb_id not in ids]
+        if missing:
+            ids.update(session.execute(insert(CatalogEntry.__table__).returning(
+                CatalogEntry.imdb_id, CatalogEntry.id), missing).all())
+        return ids
+
+
+    def _own_catalog_entry(self, session, movie):
+        """The catalog entry of a movie, copied first if other movies use it or it's the
+        OMDb entry of an IMDb ID, so changing it changes only this movie."""
+        entry = movie.catalog
+        shared = entry.imdb_id is not None or session.query(Movie.id).filter(
+            Movie.catalog_id == entry.id, Movie.id != movie.id).first() is not None
+        if not shared:
+            return entry
+        copy = CatalogEntry(title=movie.title, imdb_rating=entry.imdb_rating,
+                            **{field: getattr(entry, field) for field in CATALOG_FIELDS})
+        movie.catalog = copy
+        return copy
+
+
+    def _prune_catalog(self, session, catalog_ids):
+        """Delete entries without IMDb ID that no movie uses anymore. OMDb entries stay,
+        the next user adding the movie gets them without asking OMDb."""
+        catalog_ids = {catalog_id for catalog_id in catalog_ids if catalog_id is not None}
+        if catalog_ids:
+            session.query(CatalogEntry).filter(
+                CatalogEntry.id.in_(catalog_ids),
+                CatalogEntry.imdb_id.is_(None),
+                ~exists().where(Movie.catalog_id == CatalogEntry.id)
+            ).delete(synchronize_session=False)
+
+
+    @retry_on_lock(failed=None)
+    def add_user(self, username):
+        """Add a new user to the database.
+                Args: username (str): Name of the user to add
+                Returns: int: ID of the newly created user or None on failure
+        """
+        session = self.Session()
+        try:
+            new_user = User(username=username)
+            session.add(new_user)
+            session.flush()
+            self._register_collection(session, new_user.id)
+            session.commit()
+            return new_user.id
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error adding user: %s", e)
+            return None
+
+
+    @retry_on_lock(failed=None)
+    def add_movie(self, title, director=None, year=None, rating=None, user_id=None,
+                  genre=None, plot=None, comment=None, writer=None, actors=None,
+                  runtime=None, imdb_id=None, imdb_rating=None):
+        """Add a new movie to the database.
+               Args:
+                   title (str): Title of the movie
+                   director (str, optional): Director of the movie
+                   year (int, optional): Release year
+                   rating (float, optional): Rating (limited to 0.0-10.0)
+                   user_id (int, optional): ID of the user who added the movie
+                   genre (str, optional): Genre of the movie
+                   plot (str, optional): Plot summary
+                   comment (str, optional): User written comment
+                   writer (str, optional): Screenwriter(s)
+                   actors (str, optional): Main actors
+                   runtime (str, optional): movie duration
+                   imdb_id (str, optional): IMDb ID of OMDb data, the movie then shares
+                       the catalog entry of that ID (the other values only fill a new
+                       entry)
+                   imdb_rating (float, optional): IMDb rating for a new entry
+               Returns: int: ID of the newly created movie or None on failure
+               """
+        session = self.Session()
+        try:
+            catalog_id = self._link_catalog(session, [{
+                'title': title, 'director': director, 'writer': writer, 'actors': actors,
+                'runtime': runtime, 'year': year, 'genre': genre, 'plot': plot,
+                'imdb_id': imdb_id, 'imdb_rating': imdb_rating}])[0]
+            new_movie = Movie(
+                title=title,
+                rating=rating,
+                user_id=user_id,
+                comment=comment,
+                catalog_id=catalog_id
+            )
+            session.add(new_movie)
+            self._count_new_movies(session, [{'user_id': user_id, 'rating': rating,
+                                              'catalog_id': catalog_id}])
+            self._touch_collections(session, [user_id])
+            session.commit()
+            return new_movie.id
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error adding movie: %s", e)
+            return None
+
+
+    @retry_on_lock()
+    def add_movies_bulk(self, movies, returning=False):
+        """Insert many movies (and their catalog entries) in one transaction.
+                Args: movies (List[dict]): Values of every movie field (see add_movie)
+                      returning (bool): Return the new ids instead of the count
+                Returns: int: Number of inserted movies, or List[Row]: (id, title) of
+                         every inserted movie if returning is set
+                Raises: sqlalchemy.exc.IntegrityError: e.g. if a title already exists,
+                        nothing of the batch is stored then
+        """
+        if not movies:
+            return [] if returning else 0
+        session = self.Session()
+        try:
+            values = self._movie_rows(movies, self._link_catalog(session, movies))
+            if returning:
+                rows = session.execute(insert(Movie.__table__).returning(
+                    Movie.id, Movie.title, sort_by_parameter_order=True), values).all()
+            else:
+                # Core insert without RETURNING, so the driver runs one executemany
+                session.execute(insert(Movie.__table__), values)
+            self._count_new_movies(session, values)
+            self._touch_collections(session, {movie.get('user_id') for movie in movies})
+            session.commit()
+            return rows if returning else len(movies)
+        except Exception:
+            session.rollback()
+            raise
+
+
+    @staticmethod
+    def _movie_rows(movies, catalog_ids):
+        """Values of the user_movies rows of new movies."""
+        return [{'user_id': movie.get('user_id'), 'title': movie['title'],
+                 'normalized_title': normalize_title(movie['title']),
+                 'rating': movie.get('rating'), 'comment': movie.get('comment'),
+                 'catalog_id': catalog_id}
+                for movie, catalog_id in zip(movies, catalog_ids)]
+
+
+    @retry_on_lock(failed=False)
+    def delete_movie(self, movie_id):
+        """Delete a movie from the database.
+               Args: movie_id (int): ID of the movie to delete
+               Returns: bool: True if deletion was successful, False otherwise
+        """
+        session = self.Session()
+        try:
+            movie = session.query(Movie).filter_by(id=movie_id).first()
+            if movie:
+                delta = StatsDelta()
+                delta.remove(movie.user_id, movie)
+                apply_delta(session, delta)
+                session.delete(movie)
+                session.flush()
+                self._prune_catalog(session, [movie.catalog_id])
+                self._touch_collections(session, [movie.user_id])
+                session.commit()
+                return True
+            return False
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error deleting movie: %s", e)
+            return False
+
+
+    def _bulk_rows(self, session, movie_ids, user_id=None):
+        """The movies of bulk changes with the values their statistics depend on.
+            Returns: dict: movie_id -> Row (id, user_id, catalog_id and STATS_FIELDS)
+        """
+        query = session.query(Movie.id, Movie.user_id, Movie.catalog_id, Movie.rating,
+                              CatalogEntry.year, CatalogEntry.genre, CatalogEntry.director,
+                              CatalogEntry.runtime
+                              ).join(CatalogEntry, Movie.catalog_id == CatalogEntry.id
+                                     ).filter(Movie.id.in_(movie_ids))
+        if user_id is not None:
+            query = query.filter(Movie.user_id == user_id)
+        return {row.id: row for row in query}
+
+
+    @retry_on_lock()
+    def bulk_update_movies(self, updates, user_id=None):
+        """Change the rating or comment of many movies in one transaction. All changes
+        are validated first, then the movies with the same changes get one
+        UPDATE ... WHERE id IN (...).
+                Args: updates (dict): movie_id -> changes of BULK_FIELDS
+                      user_id (int, optional): Only change the movies of this user
+                Returns: dict: movie_id -> "updated", "not found" or the validation error,
+                         in the order of updates
+        """
+        results, valid = {}, {}
+        for movie_id, changes in updates.items():
+            try:
+                valid[movie_id] = check_bulk_changes(changes)
+            except ValueError as e:
+                results[movie_id] = str(e)
+        session = self.Session()
+        try:
+            rows = self._bulk_rows(session, list(valid), user_id) if valid else {}
+            delta = StatsDelta()
+            groups = defaultdict(list)  # changes -> ids of the movies that get them
+            for movie_id, changes in valid.items():
+                row = rows.get(movie_id)
+                if row is None:
+                    results[movie_id] = "not found"
+                    continue
+                results[movie_id] = "updated"
+                if changes:
+                    groups[tuple(sorted(changes.items()))].append(movie_id)
+                if 'rating' in changes and changes['rating'] != row.rating:
+                    values = {field: getattr(row, field) for field in STATS_FIELDS}
+                    delta.remove(row.user_id, values)
+                    delta.add(row.user_id, dict(values, rating=changes['rating']))
+            for changes, movie_ids in groups.items():
+                session.execute(update(Movie.__table__).where(
+                    Movie.__table__.c.id.in_(movie_ids)).values(dict(changes)))
+            apply_delta(session, delta)
+            self._touch_collections(session, {row.user_id for row in rows.values()})
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return {movie_id: results[movie_id] for movie_id in updates}
+
+
+    @retry_on_lock()
+    def bulk_delete_movies(self, movie_ids, user_id=None):
+        """Delete many movies in one transaction with set based statements.
+                Args: movie_ids (Iterable[int]): IDs of the movies to delete
+                      user_id (int, optional): Only delete the movies of this user
+                Returns: dict: movie_id -> "deleted" or "not found", in the order of
+                         movie_ids
+        """
+        movie_ids = list(dict.fromkeys(movie_ids))
+        if not movie_ids:
+            return {}
+        session = self.Session()
+        try:
+            rows = self._bulk_rows(session, movie_ids, user_id)
+            if rows:
+                delta = StatsDelta()
+                for row in rows.values():
+                    delta.remove(row.user_id, row)
+                apply_delta(session, delta)
+                session.execute(delete(EnrichmentJob.__table__).where(
+                    EnrichmentJob.__table__.c.movie_id.in_(list(rows))))
+                session.execute(delete(Movie.__table__).where(
+                    Movie.__table__.c.id.in_(list(rows))))
+                self._prune_catalog(session, {row.catalog_id for row in rows.values()})
+                self._touch_collections(session, {row.user_id for row in rows.values()})
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return {movie_id: "deleted" if movie_id in rows else "not found"
+                for movie_id in movie_ids}
+
+
+    @retry_on_lock(failed=False)
+    def update_user_movie(self, movie_id, updated_data):
+        """Update movie information. Changed catalog fields are written to an entry of
+        the movie's own, the collections of other users keep theirs.
+                Args: movie_id (int): ID of the movie to update
+                      updated_data (dict): Dictionary of fields to update
+                Returns: bool: True if update was successful, False otherwise
+        """
+        session = self.Session()
+        try:
+            movie = session.query(Movie).filter_by(id=movie_id).first()
+            if not movie:
+                return False
+            delta = StatsDelta()
+            delta.remove(movie.user_id, movie)
+
+            changed = {key: value for key, value in updated_data.items()
+                       if key in CATALOG_FIELDS and getattr(movie, key) != value}
+            if changed:
+                entry = self._own_catalog_entry(session, movie)
+                for key, value in changed.items():
+                    setattr(entry, key, value)
+            for key, value in updated_data.items():
+                if key not in CATALOG_FIELDS and hasattr(movie, key):
+                    setattr(movie, key, value)
+            delta.add(movie.user_id, movie)
+            apply_delta(session, delta)
+
+            self._touch_collections(session, [movie.user_id])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error updating movie: %s", e)
+            return False
+
+
+    @retry_on_lock(failed=False)
+    def enrich_movie(self, movie_id, omdb_data):
+        """Fill the empty fields of a movie with OMDb data. A movie without metadata of
+        its own is linked to the shared catalog entry of the IMDb ID (created on first
+        use), otherwise its own entry gets the missing values.
+                Args: movie_id (int): ID of the movie
+                      omdb_data (dict): Sanitized OMDb data (see app.convert_omdb_data),
+                          'rating' is the IMDb rating
+                Returns: bool: True if the movie exists, False otherwise
+        """
+        session = self.Session()
+        try:
+            movie = session.query(Movie).filter_by(id=movie_id).first()
+            if not movie:
+                return False
+            delta = StatsDelta()
+            delta.remove(movie.user_id, movie)
+
+            entry = movie.catalog
+            empty = [field for field in CATALOG_FIELDS
+                     if getattr(entry, field) in (None, '')]
+            if (omdb_data.get('imdb_id') and entry.imdb_id is None
+                    and len(empty) == len(CATALOG_FIELDS)):
+                movie.catalog_id = self._link_catalog(session, [dict(
+                    omdb_data, title=omdb_data.get('title') or movie.title,
+                    imdb_rating=omdb_data.get('rating'))])[0]
+                session.flush()
+                session.expire(movie, ['catalog'])
+                self._prune_catalog(session, [entry.id])
+            else:
+                updates = {field: omdb_data[field] for field in empty
+                           if omdb_data.get(field) is not None}
+                if updates:
+                    entry = self._own_catalog_entry(session, movie)
+                    for key, value in updates.items():
+                        setattr(entry, key, value)
+            if movie.rating is None and omdb_data.get('rating') is not None:
+                movie.rating = omdb_data['rating']
+            delta.add(movie.user_id, movie)
+            apply_delta(session, delta)
+
+            self._touch_collections(session, [movie.user_id])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error enriching movie: %s", e)
+            return False
+
+
+    def get_movie_with_user(self, movie_id):
+        """Get a movie along with its associated user data.
+                Args: movie_id (int): ID of the movie
+                Returns: Movie: Movie object with joined user data or None if not found
+        """
+        session = self.Session()
+        return session.query(Movie).options(
+            joinedload(Movie.user)
+        ).filter_by(id=movie_id).first()
+
+
+    @retry_on_lock(failed=False)
+    def create_enrichment_job(self, movie_id):
+        """Mark a movie as waiting for background OMDb enrichment.
+                Args: movie_id (int): ID of the movie
+                Returns: bool: True if the job was stored, False otherwise
+        """
+        session = self.Session()
+        try:
+            session.merge(EnrichmentJob(movie_id=movie_id, status="pending", attempts=0,
+                                        last_error=None))
+            # the collection page shows which movies are still being enriched
+            self._touch_collections(session, [self._owner_of(session, movie_id)])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error creating enrichment job: %s", e)
+            return False
+
+
+    @retry_on_lock(failed=False)
+    def update_enrichment_job(self, movie_id, status, attempts=None, last_error=None):
+        """Update the status of a background OMDb enrichment.
+                Args: movie_id (int): ID of the movie
+                      status (str): pending, running, done or failed
+                      attempts (int, optional): Number of OMDb requests so far
+                      last_error (str, optional): Message of the last failed attempt
+                Returns: bool: True if the job was updated, False otherwise
+        """
+        session = self.Session()
+        try:
+            job = session.query(EnrichmentJob).filter_by(movie_id=movie_id).first()
+            if not job:
+                return False
+            job.status = status
+            if attempts is not None:
+                job.attempts = attempts
+            job.last_error = last_error
+            job.claimed_at = time.time()  # every attempt renews the claim
+            self._touch_collections(session, [self._owner_of(session, movie_id)])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error updating enrichment job: %s", e)
+            return False
+
+
+    @retry_on_lock(failed=False)
+    def claim_enrichment_job(self, movie_id, lease):
+        """Claim a background OMDb enrichment for this process, in one statement, so of
+        several processes resuming the same jobs only one runs each.
+                Args: movie_id (int): ID of the movie
+                      lease (float): Seconds after which a running job whose process
+                      made no progress may be claimed again
+                Returns: bool: True if this process runs the job now, False if it is
+                finished or another process has it
+        """
+        session = self.Session()
+        now = time.time()
+        try:
+            claimed = session.execute(
+                update(EnrichmentJob)
+                .where(EnrichmentJob.movie_id == movie_id,
+                       or_(EnrichmentJob.status == "pending",
+                           and_(EnrichmentJob.status == "running",
+                                or_(EnrichmentJob.claimed_at.is_(None),
+                                    EnrichmentJob.claimed_at < now - lease))))
+                .values(status="running", claimed_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount == 1
+            session.commit()
+            return claimed
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error claiming enrichment job: %s", e)
+            return False
+
+
+    def get_unfinished_enrichment_jobs(self):
+        """Find enrichments that were queued but never finished, e.g. before a restart.
+                Returns: List[tuple]: (movie_id, title) pairs
+        """
+        session = self.Session()
+        return session.query(Movie.id, Movie.title).join(Movie.enrichment).filter(
+            EnrichmentJob.status.in_(("pending", "running"))
+        ).all()
+
+
+    def get_funfacts(self, served=False):
+        """Get the stored fun facts, oldest first.
+                Args: served (bool): False for the pool of unused facts, True for the
+                      facts that were already shown (used as fallback)
+                Returns: List[tuple]: (id, theme, fact) rows
+        """
+        session = self.Session()
+        return session.query(FunFact.id, FunFact.theme, FunFact.fact).filter(
+            FunFact.served == served
+        ).order_by(FunFact.id).all()
+
+
+    @retry_on_lock(failed=[])
+    def add_funfacts(self, theme, facts, served=False):
+        """Store newly generated fun facts in the pool of a theme.
+                Args: theme (str): Theme key
+                      facts (List[str]): Generated facts
+                      served (bool): The facts were shown already (e.g. streamed)
+                Returns: List[int]: IDs of the stored facts (empty on failure)
+        """
+        session = self.Session()
+        try:
+            rows = [FunFact(theme=theme, fact=fact, served=served) for fact in facts]
+            session.add_all(rows)
+            session.commit()
+            return [row.id for row in rows]
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error adding fun facts: %s", e)
+            return []
+
+
+    @retry_on_lock(failed=None)
+    def take_funfact(self, theme):
+        """Claim the oldest unused fun fact of a theme. It is marked served in the same
+        statement, so two processes never show the same fact.
+                Args: theme (str): Theme key
+                Returns: tuple: (id, fact, number of unused facts of the theme left),
+                         None if the pool of the theme is empty or can't be read
+        """
+        session = self.Session()
+        unused = (FunFact.theme == theme, FunFact.served.is_(False))
+        try:
+            for _ in range(TAKE_FUNFACT_ATTEMPTS):
+                oldest = select(FunFact.id).where(*unused).order_by(FunFact.id).limit(1)
+                taken = session.execute(
+                    update(FunFact)
+                    # served is checked again: a concurrent take may have won the row
+                    .where(FunFact.id == oldest.scalar_subquery(), FunFact.served.is_(False))
+                    .values(served=True)
+                    .returning(FunFact.id, FunFact.fact)
+                    .execution_options(synchronize_session=False)
+                ).first()
+                left = session.execute(
+                    select(func.count()).select_from(FunFact).where(*unused)).scalar()
+                session.commit()
+                if taken is not None:
+                    return taken.id, taken.fact, left
+                if not left:
+                    return None
+            return None
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error taking a fun fact: %s", e)
+            return None
+
+
+    def count_funfacts(self):
+        """Count the unused fun facts of every theme, e.g. to top up the pools.
+                Returns: dict: theme -> number of unused facts, themes without are missing
+        """
+        session = self.Session()
+        return dict(session.query(FunFact.theme, func.count(FunFact.id)).filter(
+            FunFact.served.is_(False)
+        ).group_by(FunFact.theme).all())
+
+
+    @retry_on_lock(failed=None)
+    def mark_funfacts_served(self, fact_ids, keep_per_theme=20):
+        """Move shown facts out of the pool and prune the old ones.
+                Args: fact_ids (List[int]): IDs of the facts that were shown
+                      keep_per_theme (int): Served facts kept per theme as fallback
+        """
+        session = self.Session()
+        try:
+            if fact_ids:
+                session.query(FunFact).filter(FunFact.id.in_(fact_ids)).update(
+                    {FunFact.served: True}, synchronize_session=False)
+            for (theme,) in session.query(FunFact.theme).distinct().all():
+                keep = session.query(FunFact.id).filter(
+                    FunFact.theme == theme, FunFact.served.is_(True)
+                ).order_by(FunFact.id.desc()).limit(keep_per_theme)
+                session.query(FunFact).filter(
+                    FunFact.theme == theme, FunFact.served.is_(True),
+                    FunFact.id.not_in(keep.scalar_subquery())
+                ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if is_lock_error(e):
+                raise  # retried by @retry_on_lock
+            logging.error("Error updating fun facts: %s", e)
@@ -1,19 +1,65 @@
 """
 SQLite Data Manager implementation for movie database application.
-Handles all database operations using SQLAlchemy ORM.
+Handles all database operations using SQLAlchemy ORM, see SQLAlchemyDataManager for
+the methods every backend shares. SQLite adds the tuned engine profile (sqlite_engine)
+and the FTS5 full-text and trigram search.
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, joinedload
-from data_manager.data_manager_interface import DataManagerInterface
-from models import Base, User, Movie
-import logging
+from sqlalchemy import column, func, insert, literal_column, select, table, text, union_all
+from sqlalchemy.orm import joinedload
+from data_manager.pagination import clamp_page_size, Page
+from data_manager.sqlalchemy_data_manager import SQLAlchemyDataManager
+from data_manager.sqlite_engine import create_sqlite_engine
+from models import CatalogEntry, Movie
+from titles import trigrams
 import os
-
-
-class SQLiteDataManager(DataManagerInterface):
+import re
+
+
+# FTS5 indexes created by migration 0007, rowid is the catalog id and the movie id
+catalog_fts = table("catalog_fts", column("rowid"))
+user_movies_fts = table("user_movies_fts", column("rowid"))
+# trigram index of the normalized catalog titles (migration 0009)
+catalog_trigram_fts = table("catalog_trigram_fts", column("rowid"))
+
+# bm25 weights of title, director, writer, actors, genre, plot
+CATALOG_RANK = literal_column("bm25(catalog_fts, 10.0, 4.0, 2.0, 3.0, 2.0, 1.0)")
+# bm25 weights of the user's title and comment
+USER_MOVIES_RANK = literal_column("bm25(user_movies_fts, 10.0, 1.0)")
+
+
+def build_fts_query(query):
+    """Turn user input into a safe FTS5 query: every word must match as a prefix.
+        Args: query (str): Search text as typed by the user
+        Returns: str: FTS5 MATCH expression or '' if there is nothing to search for
+    """
+    words = re.findall(r"\w+", query or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def build_trigram_queries(normalized):
+    """FTS5 queries of the trigram index for titles similar to a normalized title, the
+    most specific first: the title as a substring (also what is typed so far), every
+    word of it with a typo at most, any trigram of it.
+        Args: normalized (str): Result of titles.normalize_title
+        Returns: List[str]: MATCH expressions, empty if the title has no trigram
+    """
+    if not trigrams(normalized):
+        return []
+    # the grams are letters, digits and spaces (see normalize_title), safe to quote
+    words = [" OR ".join(f'"{gram}"' for gram in sorted(trigrams(word)))
+             for word in normalized.split() if trigrams(word)]
+    queries = [f'"{normalized}"']
+    if len(words) > 1:
+        queries.append(" AND ".join(f"({word})" for word in words))
+    queries.append(" OR ".join(f'"{gram}"' for gram in sorted(trigrams(normalized))))
+    return queries
+
+
+class SQLiteDataManager(SQLAlchemyDataManager):
     """Manages database operations for the movie web application."""
-    def __init__(self, db_url=None):
+    def __init__(self, db_url=None, pragmas=None, pool_size=5, lock_retries=5,
+                 lock_backoff=0.05):
         """
                Initialize the database connection.
 
@@ -21,214 +67,90 @@ class SQLiteDataManager(DataManagerInterface):
                    db_url (str): Optional database URL. If None, uses:
                        - ':memory:' for testing (when TESTING=true)
                        - 'sqlite:///data/movies.db' for production
+                   pragmas (dict, optional): Overrides of the engine profile
+                       (see sqlite_engine.DEFAULT_PRAGMAS)
+                   pool_size (int): Connections kept open per process
+                   lock_retries (int): Retries of a write that hit a database lock
+                   lock_backoff (float): Seconds before the first retry, doubled each time
                """
         if db_url is None:
             if os.environ.get('TESTING') == 'true':
                 db_url = "sqlite:///:memory:"  # In-Memory for Tests
             else:
                 db_url = "sqlite:///data/movies.db"  # real DB
-        self.engine = create_engine(db_url)
-        Base.metadata.create_all(self.engine)
-        SessionLocal = sessionmaker(bind=self.engine)
-        self.Session = sessionmaker(bind=self.engine)  # Session-Instance
-
-
-    def get_all_users(self):
-        """Retrieve all users from the database.
-           Returns: List[User]: All user objects in the database
-        """
-        session = self.Session()
-        try:
-            return session.query(User).all()
-        finally:
-            session.close()
-
-
-    def get_user_movies(self, user_id):
-        """Get all movies for a specific user.
-           Args: user_id (int): ID of the user
-           Returns:
-           List[Movie]: Movies associated with the user or empty list if not found
+        super().__init__(create_sqlite_engine(db_url, pragmas=pragmas, pool_size=pool_size),
+                         lock_retries=lock_retries, lock_backoff=lock_backoff)
+
+
+    def _insert_catalog_entries(self, session, entries):
+        """Like SQLAlchemyDataManager._insert_catalog_entries, but in multi-row INSERTs.
+        SQLAlchemy inserts row by row to return the ids in order on SQLite. That isn't
+        needed: a new row gets the largest rowid + 1 and the transaction holds the
+        write lock, so the ids ascend in the order of entries."""
+        return sorted(session.execute(insert(CatalogEntry.__table__).returning(
+            CatalogEntry.id), entries).scalars())
+
+
+    def search_movies(self, query, user_id=None, page=1, page_size=None):
+        """Full-text search over title, director, writer, actors, genre, plot and comment.
+           Every word is matched as a prefix, results are ranked by bm25 (title matches
+           count most). The catalog and the titles/comments of the users are separate
+           indexes, a movie is found if all words match in one of them.
+           Args: query (str): Search text
+                 user_id (int, optional): Only search the collection of this user
+                 page (int): Page number, starting at 1
+                 page_size (int, optional): Results per page (capped)
+           Returns: Page: Movies (with their user loaded) of the page, next_cursor and
+                    prev_cursor hold the neighbouring page numbers
         """
-        session = self.Session()
-        try:
-            user = session.query(User).filter_by(id=user_id).first()
-            if user:
-                return user.movies
-            return []
-        finally:
-            session.close()
-
-
-    def get_user_by_id(self, user_id):
-        """Retrieve a user by their ID.
-               Args: user_id (int): User ID to search for
-               Returns: User: The user object or None if not found
-        """
-        session = self.Session()
-        try:
-            return session.query(User).filter_by(id=user_id).first()
-        finally:
-            session.close()
-
-
-    def get_user_by_username(self, username):
-        """Find a user by their username.
-               Args: username (str): Username to search for
-               Returns: User: User object or None if not found
-        """
-        session = self.Session()
-        try:
-            return session.query(User).filter_by(username=username).first()
-        finally:
-            session.close()
-
+        page = max(1, page or 1)
+        page_size = clamp_page_size(page_size)
+        match = build_fts_query(query)
+        if not match:
+            return Page([], sort='rank', page_size=page_size)
+
+        catalog_hits = select(Movie.id.label('movie_id'), CATALOG_RANK.label('rank')).join(
+            catalog_fts, catalog_fts.c.rowid == Movie.catalog_id
+        ).where(text("catalog_fts MATCH :match"))
+        own_hits = select(user_movies_fts.c.rowid.label('movie_id'),
+                          USER_MOVIES_RANK.label('rank')).where(
+            text("user_movies_fts MATCH :match"))
+        if user_id is not None:
+            catalog_hits = catalog_hits.where(Movie.user_id == user_id)
+        hits = union_all(catalog_hits, own_hits).subquery()
+        best = select(hits.c.movie_id, func.min(hits.c.rank).label('rank')).group_by(
+            hits.c.movie_id).subquery()
 
-    def movie_exists(self, user_id, title):
-        """Check if a movie already exists for a user
-                Args: user_id (int): ID of the user
-                      title (str): Movie title to check
-                Returns: bool: True if movie exists, False otherwise
-        """
-        session = self.Session()
-        try:
-            existing_movie = session.query(Movie).filter_by(
-                user_id=user_id,
-                title=title
-            ).first()
-            return existing_movie is not None
-        finally:
-            session.close()
-
-
-    def get_movie_by_id(self, movie_id):
-        """Retrieve a movie by its ID
-                Args: movie_id (int): ID of the movie
-                Returns: Movie: Movie object or None if not found
-        """
-        session = self.Session()
-        try:
-            return session.query(Movie).filter_by(id=movie_id).first()
-        finally:
-            session.close()
-
-
-    def add_user(self, username):
-        """Add a new user to the database.
-                Args: username (str): Name of the user to add
-                Returns: int: ID of the newly created user or None on failure
-        """
-        session = self.Session()  # create a local session
-        try:
-            new_user = User(username=username)
-            session.add(new_user)
-            session.commit()
-            return new_user.id
-        except Exception as e:
-            session.rollback()
-            logging.error("Error adding user: %s", e)
-            return None
-        finally:
-            session.close()
-
-
-    def add_movie(self, title, director=None, year=None, rating=None, user_id=None,
-                  genre=None, plot=None, comment=None, writer=None, actors=None,
-                  runtime=None):
-        """Add a new movie to the database.
-               Args:
-                   title (str): Title of the movie
-                   director (str, optional): Director of the movie
-                   year (int, optional): Release year
-                   rating (float, optional): Rating (limited to 0.0-10.0)
-                   user_id (int, optional): ID of the user who added the movie
-                   genre (str, optional): Genre of the movie
-                   plot (str, optional): Plot summary
-                   comment (str, optional): User written comment
-                   writer (str, optional): Screenwriter(s)
-                   actors (str, optional): Main actors
-                   runtime (str, optional): movie duration
-               """
-        session = self.Session()
-        try:
-            new_movie = Movie(
-                title=title,
-                director=director,
-                writer=writer,
-                actors=actors,
-                runtime=runtime,
-                year=year,
-                rating=rating,
-                user_id=user_id,
-                genre=genre,
-                plot=plot,
-                comment=comment
-            )
-            session.add(new_movie)
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            logging.error("Error adding movie: %s", e)
-        finally:
-            session.close()
-
-
-    def delete_movie(self, movie_id):
-        """Delete a movie from the database.
-               Args: movie_id (int): ID of the movie to delete
-               Returns: bool: True if deletion was successful, False otherwise
-        """
-        session = self.Session()
-        try:
-            movie = session.query(Movie).filter_by(id=movie_id).first()
-            if movie:
-                session.delete(movie)
-                session.commit()
-                return True
-            return False
-        except Exception as e:
-            session.rollback()
-            logging.error("Error deleting movie: %s", e)
-            return False
-        finally:
-            session.close()
-
-
-    def update_user_movie(self, movie_id, updated_data):
-        """Update movie information.
-                Args: movie_id (int): ID of the movie to update
-                      updated_data (dict): Dictionary of fields to update
-                Returns: bool: True if update was successful, False otherwise
-        """
-        session = self.Session()
-        try:
-            movie = session.query(Movie).filter_by(id=movie_id).first()
-            if not movie:
-                return False
-
-            for key, value in updated_data.items():
-                if hasattr(movie, key):
-                    setattr(movie, key, value)
-
-            session.commit()
-            return True
-        except Exception as e:
-            session.rollback()
-            logging.error("Error updating movie: %s", e)
-            return False
-        finally:
-            session.close()
-
-
-    def get_movie_with_user(self, movie_id):
-        """Get a movie along with its associated user data.
-                Args: movie_id (int): ID of the movie
-                Returns: Movie: Movie object with joined user data or None if not found
-        """
         session = self.Session()
-        try:
-            return session.query(Movie).options(
-                joinedload(Movie.user)
-            ).filter_by(id=movie_id).first()
-        finally:
-            session.close()
+        results = session.query(Movie).options(joinedload(Movie.user)).join(
+            best, best.c.movie_id == Movie.id)
+        if user_id is not None:
+            results = results.filter(Movie.user_id == user_id)
+        movies = results.order_by(best.c.rank, Movie.id).params(match=match).limit(
+            page_size + 1).offset((page - 1) * page_size).all()
+
+        return Page(movies[:page_size],
+                    next_cursor=page + 1 if len(movies) > page_size else None,
+                    prev_cursor=page - 1 if page > 1 else None,
+                    sort='rank', page_size=page_size)
+
+
+    def _similar_candidates(self, session, normalized, limit):
+        """Entries of the trigram FTS5 index, collected from the strictest query of
+        build_trigram_queries on until there are limit of them. Ranking the matches with
+        bm25 costs more than finding them, so they are taken unranked and ranked by
+        find_similar_titles. Titles too short for a trigram are looked up as they are."""
+        columns = (CatalogEntry.id, CatalogEntry.title, CatalogEntry.normalized_title,
+                   CatalogEntry.year, CatalogEntry.imdb_id)
+        candidates = {row.id: row for row in session.query(*columns).filter(
+            CatalogEntry.normalized_title == normalized).limit(limit)}
+        for match in build_trigram_queries(normalized):
+            if len(candidates) >= limit:
+                break
+            rows = session.query(*columns).join(
+                catalog_trigram_fts, catalog_trigram_fts.c.rowid == CatalogEntry.id
+            ).filter(text("catalog_trigram_fts MATCH :match")).params(match=match).limit(
+                limit).all()
+            for row in rows:
+                candidates.setdefault(row.id, row)
+        return list(candidates.values())[:limit]
@@ -0,0 +1,142 @@
+"""
+Engine profile for SQLite databases shared by several threads and worker processes.
+WAL lets readers continue while one connection writes, the other pragmas trade a
+little durability on power loss (never on a crash of the app) for fewer fsyncs and
+more caching. Writes that still hit a lock are retried with backoff, see retry_on_lock.
+"""
+
+import functools
+import logging
+import random
+import sqlite3
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+
+# Applied to every new connection, in this order
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,       # wait up to 5 s for a lock before giving up
+    'journal_mode': 'WAL',      # readers don't block the writer and vice versa
+    'synchronous': 'NORMAL',    # safe with WAL, syncs at checkpoints instead of commits
+    'cache_size': -32000,       # 32 MB page cache per connection
+    'mmap_size': 268435456,     # read up to 256 MB of the file through memory mapping
+    'temp_store': 'MEMORY',     # sorts and temporary indexes don't touch the disk
+}
+
+# What SQLite does without a profile, e.g. to compare in benchmarks
+LEGACY_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'temp_store': 'DEFAULT',
+}
+
+# In-memory databases have no file to journal or map
+_FILE_ONLY_PRAGMAS = ('journal_mode', 'mmap_size')
+
+
+def is_memory_database(url):
+    return make_url(url).database in (None, '', ':memory:')
+
+
+def parse_pragmas(value):
+    """Parse pragma overrides like "cache_size=-64000,mmap_size=0" (e.g. from the env).
+        Returns: dict: pragma name -> value
+    """
+    pragmas = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            name, _, setting = item.partition('=')
+            pragmas[name.strip().lower()] = setting.strip()
+    return pragmas
+
+
+def create_sqlite_engine(db_url, pragmas=None, pool_size=5, max_overflow=10):
+    """Create an engine that applies the pragmas to every connection.
+        Args:
+            db_url (str): SQLite database URL
+            pragmas (dict, optional): Overrides of DEFAULT_PRAGMAS
+            pool_size (int): Connections kept open per process
+            max_overflow (int): Extra connections under load
+        Returns: Engine
+    """
+    settings = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+    if is_memory_database(db_url):
+        # each connection is its own empty database, so all threads share one
+        engine = create_engine(db_url, poolclass=StaticPool,
+                               connect_args={'check_same_thread': False})
+        for name in _FILE_ONLY_PRAGMAS:
+            settings.pop(name, None)
+    else:
+        # every thread of a process checks a connection out of the pool
+        engine = create_engine(
+            db_url, pool_size=pool_size, max_overflow=max_overflow,
+            connect_args={'timeout': int(settings['busy_timeout']) / 1000,
+                          'check_same_thread': False})
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in settings.items():
+                try:
+                    cursor.execute(f"PRAGMA {name}={value}")
+                except sqlite3.OperationalError as e:
+                    # the journal mode is stored in the file, so it was most likely
+                    # switched already by another connection that holds it open
+                    if name != 'journal_mode':
+                        raise
+                    logging.warning("Could not set journal_mode=%s: %s", value, e)
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def is_lock_error(error):
+    """True for 'database is locked' and 'database is busy' errors."""
+    message = str(getattr(error, 'orig', error)).lower()
+    return isinstance(error, OperationalError) and (
+        'database is locked' in message or 'database is busy' in message)
+
+
+_RAISE = object()
+
+
+def retry_on_lock(failed=_RAISE):
+    """Decorator for data manager write methods: runs the whole method (i.e. the whole
+    transaction) again when SQLite reports a lock, with exponential backoff and jitter.
+    The method must roll back and re-raise lock errors. The number of retries and the
+    first delay are read from self.lock_retries and self.lock_backoff.
+        Args: failed: Return value once all retries are used up, by default the lock
+              error is raised
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return method(self, *args, **kwargs)
+                except OperationalError as e:
+                    if not is_lock_error(e):
+                        raise
+                    if attempt >= self.lock_retries:
+                        if failed is _RAISE:
+                            raise
+                        logging.error("%s failed, database still locked after %d "
+                                      "attempts: %s", method.__name__, attempt + 1, e)
+                        return failed
+                    delay = self.lock_backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                    attempt += 1
+                    logging.warning("%s hit a database lock, retry %d in %.3fs",
+                                    method.__name__, attempt, delay)
+                    time.sleep(delay)
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+"""
+Background OMDb enrichment for the MovieWeb application.
+In async mode a new movie is saved with the fields the user typed in and a job is
+queued here. A small thread pool asks OMDb for the movie and fills every field the
+user left empty, retrying failed lookups with exponential backoff. A movie the user
+typed nothing in for gets the shared catalog entry of the OMDb movie.
+Every process resumes the unfinished jobs when it starts its worker (e.g. after a
+restart), a job is only run by the process that claims it in the database.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for
+import logging
+import random
+import threading
+import time
+
+
+class OMDbError(Exception):
+    """OMDb answered with an error that is not 'Movie not found!' (e.g. request limit)."""
+
+
+class EnrichmentWorker:
+    """Bounded thread pool that enriches movies with OMDb data in the background."""
+    def __init__(self, data_manager, fetch, max_workers=2, max_attempts=3, backoff=1.0,
+                 lease=60):
+        """
+        Args:
+            data_manager: Data manager used to read and update the movies
+            fetch (callable): title -> sanitized OMDb dict, None if OMDb does not know
+                the movie. Raises an exception for errors worth a retry.
+            max_workers (int): Maximum number of concurrent OMDb requests
+            max_attempts (int): Attempts per movie before the job is marked failed
+            backoff (float): Seconds to wait after the first failed attempt, doubled
+                for every further attempt
+            lease (float): Seconds a running job without a new attempt stays claimed,
+                then another process takes it over. Longer than an attempt and its backoff.
+        """
+        self.data_manager = data_manager
+        self.fetch = fetch
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="omdb-enrichment")
+        self._lock = threading.Lock()
+        self._recheck = None
+        self._resumed = None
+        self._stopped = False
+
+    def submit(self, movie_id, title):
+        """Queue a movie for enrichment.
+            Args: movie_id (int): ID of the saved movie
+                  title (str): Title to look up
+            Returns: Future of the background job
+        """
+        self.data_manager.create_enrichment_job(movie_id)
+        return self._executor.submit(self.run, movie_id, title)
+
+    def resume_unfinished(self):
+        """Queue again the jobs that were pending or running when a process stopped, in
+        the background. Jobs another process still holds are checked again when their
+        lease is over, in case that process is gone.
+            Returns: Future of the number of jobs this process claimed
+        """
+        self._resumed = self._executor.submit(self._resume)
+        return self._resumed
+
+    def _resume(self):
+        try:
+            claimed = held = 0
+            for movie_id, title in self.data_manager.get_unfinished_enrichment_jobs():
+                if self.data_manager.claim_enrichment_job(movie_id, self.lease):
+                    self._executor.submit(self._finish, movie_id, title)
+                    claimed += 1
+                else:
+                    held += 1
+        finally:
+            self.data_manager.remove_session()
+        if held:
+            with self._lock:
+                if not self._stopped:
+                    self._recheck = threading.Timer(self.lease, self._resume_again)
+                    self._recheck.daemon = True
+                    self._recheck.start()
+        logging.info("Resumed %s OMDb enrichments, %s are held by other processes",
+                     claimed, held)
+        return claimed
+
+    def _resume_again(self):
+        with self._lock:
+            if not self._stopped:
+                self.resume_unfinished()
+
+    def run(self, movie_id, title):
+        """Claim a job, look up the movie at OMDb and fill its empty fields.
+            Args: movie_id (int): ID of the movie
+                  title (str): Title to look up
+            Returns: str: Final status of the job ('done' or 'failed'), None if the job
+                     is finished or another process runs it
+        """
+        try:
+            if not self.data_manager.claim_enrichment_job(movie_id, self.lease):
+                return None
+            return self._run(movie_id, title)
+        finally:
+            self.data_manager.remove_session()
+
+    def _finish(self, movie_id, title):
+        """Run a job this process has claimed already."""
+        try:
+            return self._run(movie_id, title)
+        finally:
+            self.data_manager.remove_session()
+
+    def _run(self, movie_id, title):
+        last_error = None
+        for attempt in range(1, self.max_attempts + 1):
+            self.data_manager.update_enrichment_job(movie_id, "running", attempts=attempt)
+            try:
+                omdb_data = self.fetch(title)
+                self.data_manager.enrich_movie(movie_id, omdb_data or {})
+                self.data_manager.update_enrichment_job(movie_id, "done", attempts=attempt)
+                return "done"
+            except Exception as e:
+                last_error = str(e)
+                logging.warning("OMDb enrichment of movie %s failed (attempt %s/%s): %s",
+                                movie_id, attempt, self.max_attempts, e)
+                if attempt < self.max_attempts:
+                    delay = self.backoff * 2 ** (attempt - 1)
+                    time.sleep(delay + random.uniform(0, delay / 2))
+
+        self.data_manager.update_enrichment_job(movie_id, "failed",
+                                                attempts=self.max_attempts,
+                                                last_error=last_error)
+        return "failed"
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for the running ones."""
+        with self._lock:
+            self._stopped = True
+            if self._recheck is not None:
+                self._recheck.cancel()
+        if wait and self._resumed is not None:
+            wait_for([self._resumed])  # it queues the jobs it claimed
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,141 @@
+"""
+Streaming export of movie collections for the MovieWeb application.
+The writers take an iterator of movie rows (see SQLiteDataManager.iter_movies) and
+yield the file piece by piece, so a Flask response or a file can be written without
+ever holding the whole collection in memory.
+Parquet needs the optional pyarrow package, it is only imported for the first parquet
+export because it adds a noticeable delay to the start of the app.
+"""
+
+import csv
+import io
+import json
+
+
+EXPORT_FIELDS = ('id', 'user_id', 'title', 'director', 'writer', 'actors', 'year',
+                 'rating', 'genre', 'runtime', 'plot', 'comment')
+FORMATS = ('csv', 'jsonl', 'parquet')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+ROWS_PER_CHUNK = 1000
+
+
+class ExportError(Exception):
+    """The requested export format can't be produced."""
+
+
+def export_csv(rows):
+    """Yield a CSV file (with header line) in chunks of ROWS_PER_CHUNK rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_jsonl(rows):
+    """Yield a JSON Lines file, one object per movie."""
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False))
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain."""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def import_pyarrow():
+    """Returns: The pyarrow module (with pyarrow.parquet loaded) or None if not installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # optional dependency, only needed for parquet exports
+        return None
+    return pyarrow
+
+
+def parquet_schema(pyarrow):
+    return pyarrow.schema([
+        ('id', pyarrow.int64()), ('user_id', pyarrow.int64()), ('title', pyarrow.string()),
+        ('director', pyarrow.string()), ('writer', pyarrow.string()),
+        ('actors', pyarrow.string()), ('year', pyarrow.int32()),
+        ('rating', pyarrow.float64()), ('genre', pyarrow.string()),
+        ('runtime', pyarrow.string()), ('plot', pyarrow.string()),
+        ('comment', pyarrow.string()),
+    ])
+
+
+def export_parquet(rows, row_group_size=10000):
+    """Yield a Parquet file, one row group of row_group_size movies at a time.
+        Raises: ExportError: if pyarrow is not installed
+    """
+    pyarrow = import_pyarrow()
+    if pyarrow is None:
+        raise ExportError("Parquet export needs the 'pyarrow' package")
+    return _parquet_chunks(pyarrow, rows, row_group_size)
+
+
+def _parquet_chunks(pyarrow, rows, row_group_size):
+    schema = parquet_schema(pyarrow)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    columns = [[] for _ in EXPORT_FIELDS]
+    for count, row in enumerate(rows, start=1):
+        for column, value in zip(columns, row):
+            column.append(value)
+        if count % row_group_size == 0:
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+            columns = [[] for _ in EXPORT_FIELDS]
+            yield sink.drain()
+    if columns[0]:
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+    writer.close()
+    yield sink.drain()
+
+
+def export_movies(rows, file_format):
+    """Pick the writer for a format.
+        Args: rows: Iterator of movie rows in EXPORT_FIELDS order
+              file_format (str): 'csv', 'jsonl' or 'parquet'
+        Returns: Iterator of str (csv, jsonl) or bytes (parquet) chunks
+        Raises: ExportError: for an unknown or unavailable format
+    """
+    if file_format == 'csv':
+        return export_csv(rows)
+    if file_format == 'jsonl':
+        return export_jsonl(rows)
+    if file_format == 'parquet':
+        return export_parquet(rows)
+    raise ExportError(f"Unknown export format: {file_format!r}")
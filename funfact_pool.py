@@ -0,0 +1,270 @@
+"""
+Fun fact pool for the MovieWeb application.
+Instead of asking DeepSeek on every page view, a background refiller keeps a number
+of pre-generated facts per theme in the database. The routes claim one there (one
+UPDATE ... RETURNING, so the processes of the app never show the same fact) and fall
+back to an already shown fact if the pool runs empty. Once a theme's
+pool is empty, a fresh fact can be streamed to the reader while it is generated
+(see FunFactPool.stream, DeepSeek's chat completions with "stream": true).
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import random
+import threading
+import time
+
+from http_client import HTTPClient
+
+
+DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
+
+# Shown if neither the pool nor the fallback facts have anything for us
+DEFAULT_FACT = ("In 'The Wizard of Oz' (1939), asbestos was used as fake snow.")
+
+
+def build_prompt(description):
+    """Create the DeepSeek prompt for a theme description."""
+    return f"""Tell ONE surprising fact about: {description}.
+    -Focus on a single specific example
+    -Be specific (mention movie titles/years)
+    - Maximum 1 sentences
+    -No lists or multiple examples
+    - Make it unexpected
+    Example: "In 'The Wizard of Oz' (1939), asbestos was used as fake snow"
+    """
+
+
+class DeepSeekFactGenerator:
+    """Generates a fun fact with the DeepSeek chat completions API. The calls are not
+    retried (POST), but limited and circuit broken by the HTTP client."""
+    def __init__(self, api_key, url=DEEPSEEK_URL, timeout=(5, 30), client=None):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.client = client or HTTPClient()
+
+    def _post(self, description, stream=False):
+        return self.client.post(
+            self.url,
+            upstream="deepseek",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "model": "deepseek-chat",
+                "messages": [{"role": "user", "content": build_prompt(description)}],
+                "temperature": 0.8,  # More creative facts
+                "stream": stream
+            },
+            timeout=self.timeout,
+            stream=stream
+        )
+
+    def __call__(self, description):
+        """Args: description (str): Theme description used in the prompt
+           Returns: str: The generated fact
+           Raises: requests.exceptions.RequestException, KeyError, ValueError
+        """
+        response = self._post(description)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    def stream(self, description):
+        """Generate a fact token by token. The answer is a stream of Server-Sent Events,
+        "data: {chunk}" lines ending with "data: [DONE]". The HTTP client's limit covers
+        the call until the answer starts, the caller limits the rest.
+            Args: description (str): Theme description used in the prompt
+            Yields: str: The next piece of the fact
+            Raises: requests.exceptions.RequestException, KeyError, ValueError
+        """
+        response = self._post(description, stream=True)
+        try:
+            response.raise_for_status()
+            response.encoding = "utf-8"  # event streams have no charset
+            # chunk_size None hands on every chunk as it arrives instead of filling a buffer
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue  # keep-alive comments and blank separator lines
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                piece = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if piece:
+                    yield piece
+        finally:
+            response.close()
+
+
+class LocalFactGenerator:
+    """Offline stand-in for DeepSeek, e.g. for tests and development without a key."""
+    def __init__(self):
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, description):
+        with self._lock:
+            self._counter += 1
+            number = self._counter
+        return f"Fun fact #{number} about {description[0].lower()}{description[1:]}."
+
+    def stream(self, description):
+        """Yields: str: The fact word by word, like DeepSeek's token stream"""
+        words = self(description).split(" ")
+        yield words[0]
+        for word in words[1:]:
+            yield " " + word
+
+
+class FunFactPool:
+    """Per theme pool of pre-generated fun facts with a background refiller."""
+    def __init__(self, data_manager, themes, generator, size=10, low_watermark=3,
+                 concurrency=2, keep_served=20, refill_interval=60):
+        """
+        Args:
+            data_manager: Data manager storing the facts
+            themes (dict): theme key -> description used for generation
+            generator (callable): description -> fact, raises if the upstream fails
+            size (int): Number of facts the refiller keeps per theme
+            low_watermark (int): Refill a theme once it has fewer facts than this
+            concurrency (int): Maximum number of facts generated at the same time
+            keep_served (int): Shown facts kept per theme as fallback
+            refill_interval (int): Seconds between refill checks without a trigger
+        """
+        self.data_manager = data_manager
+        self.themes = themes
+        self.generator = generator
+        self.size = size
+        self.low_watermark = low_watermark
+        self.concurrency = concurrency
+        self.keep_served = keep_served
+        self.refill_interval = refill_interval
+        self._fallback = {theme: deque(maxlen=keep_served) for theme in themes}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._refill_needed = threading.Event()
+        self._thread = None
+        self.failed_refills = 0
+
+    def _load(self):
+        """Load the shown facts used as fallback from the database on first use."""
+        with self._lock:
+            if self._loaded:
+                return
+            for _, theme, fact in self.data_manager.get_funfacts(served=True):
+                if theme in self._fallback:
+                    self._fallback[theme].append(fact)
+            self._loaded = True
+
+    def take(self, theme, fallback=True):
+        """Get a fresh fun fact for a theme, claimed in the database so no other process
+        shows it too. Never calls the upstream and never raises.
+            Args: theme (str): Key of the themes dict
+                  fallback (bool): Return an already shown fact if the pool is empty
+            Returns: str: A fun fact, None if the pool is empty and fallback is False
+        """
+        self._load()
+        self.start()
+        taken = self.data_manager.take_funfact(theme)
+        if taken is None or taken[2] < self.low_watermark:
+            self._refill_needed.set()
+        with self._lock:
+            if taken is not None:
+                self._fallback[theme].append(taken[1])
+                return taken[1]
+            return self._fallback_fact(theme) if fallback else None
+
+    def _fallback_fact(self, theme):
+        """Pick an already shown fact, preferably of the requested theme."""
+        if self._fallback[theme]:
+            return random.choice(self._fallback[theme])
+        shown = [fact for facts in self._fallback.values() for fact in facts]
+        return random.choice(shown) if shown else DEFAULT_FACT
+
+    def stream(self, theme):
+        """Generate a fresh fun fact for a theme while the reader waits, e.g. because
+        its pool is empty. The finished fact is stored as a shown one.
+            Args: theme (str): Key of the themes dict
+            Yields: str: The fact piece by piece as the generator produces it
+            Raises: what the generator raises if the upstream fails
+        """
+        self._load()
+        self.start()
+        self._refill_needed.set()
+        generate = getattr(self.generator, 'stream', None)
+        description = self.themes[theme]
+        pieces = []
+        for piece in generate(description) if generate else [self.generator(description)]:
+            pieces.append(piece)
+            yield piece
+        fact = "".join(pieces).strip()
+        if fact:
+            self.data_manager.add_funfacts(theme, [fact], served=True)
+            with self._lock:
+                self._fallback[theme].append(fact)
+
+    def available(self, theme):
+        """Returns: int: Number of unused facts in the pool of a theme"""
+        return self.data_manager.count_funfacts().get(theme, 0)
+
+    def start(self):
+        """Start the background refiller (once per process)."""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._refill_needed.set()
+                    self._thread = threading.Thread(target=self._refill_loop,
+                                                    name="funfact-refiller", daemon=True)
+                    self._thread.start()
+
+    def _refill_loop(self):
+        while True:
+            self._refill_needed.wait(self.refill_interval)
+            self._refill_needed.clear()
+            try:
+                self.refill()
+            except Exception as e:
+                self.failed_refills += 1
+                logging.error("Fun fact refill failed: %s", e)
+            finally:
+                self.data_manager.remove_session()
+            if self.failed_refills:
+                # upstream is down: back off instead of retrying on every page view
+                time.sleep(min(self.refill_interval, 2 ** self.failed_refills))
+
+    def refill(self):
+        """Prune the old shown facts and top up every theme with fewer facts than the
+        low watermark.
+            Returns: int: Number of newly generated facts
+        """
+        self.data_manager.mark_funfacts_served([], keep_per_theme=self.keep_served)
+        counts = self.data_manager.count_funfacts()
+        missing = {theme: self.size - counts.get(theme, 0) for theme in self.themes
+                   if counts.get(theme, 0) < self.low_watermark}
+
+        jobs = [theme for theme, count in missing.items() for _ in range(count)]
+        if not jobs:
+            self.failed_refills = 0
+            return 0
+
+        generated = {theme: [] for theme in missing}
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="funfact-generator") as executor:
+            results = executor.map(self._generate, jobs)
+            for theme, fact in zip(jobs, results):
+                if fact:
+                    generated[theme].append(fact)
+
+        added = 0
+        for theme, facts in generated.items():
+            added += len(self.data_manager.add_funfacts(theme, facts)) if facts else 0
+        self.failed_refills = 0 if added else self.failed_refills + 1
+        return added
+
+    def _generate(self, theme):
+        """Generate one fact, returns None if the upstream is not available."""
+        try:
+            return self.generator(self.themes[theme])
+        except Exception as e:
+            logging.warning("Could not generate a fun fact for '%s': %s", theme, e)
+            return None
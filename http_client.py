@@ -0,0 +1,242 @@
+"""
+Outbound HTTP client for the MovieWeb application (OMDb, DeepSeek).
+One requests session per process keeps connections alive. On top of that, every
+upstream gets:
+- a limit of concurrent calls, so a slow API can't occupy all worker threads
+- connect/read timeouts unless the caller passes its own
+- retries with jittered exponential backoff, only for idempotent methods
+- a circuit breaker: after a series of failures the upstream is skipped for a while
+  and calls fail at once, then a single trial call decides whether it is back
+Calls that are not made raise subclasses of requests.exceptions.ConnectionError, so
+callers handle them like any other connection problem.
+"""
+
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import track_upstream
+
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+# numeric circuit states for /metrics
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The upstream failed repeatedly, calls are skipped until the breaker resets."""
+
+
+class UpstreamBusyError(requests.exceptions.ConnectionError):
+    """All allowed concurrent calls to the upstream are in progress."""
+
+
+class CircuitBreaker:
+    """Counts consecutive failures of an upstream and opens after failure_threshold of
+    them. After reset_timeout seconds one trial call is let through (half open), its
+    result closes or opens the breaker again."""
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """True if a call may be made now. Reserves the trial call when half open."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = HALF_OPEN
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = CLOSED
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logging.warning("Circuit breaker opened after %d failures", self.failures)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+class _Upstream:
+    """Concurrency limit, breaker and counters of one upstream."""
+    def __init__(self, max_concurrency, failure_threshold, reset_timeout):
+        self.limit = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.host = None
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+
+class HTTPClient:
+    """Pooled, limited, retrying and circuit broken HTTP client, see module docstring."""
+    def __init__(self, pool_maxsize=10, max_concurrency=8, connect_timeout=3.05,
+                 read_timeout=10.0, retries=2, backoff=0.2, acquire_timeout=None,
+                 failure_threshold=5, reset_timeout=30.0):
+        """
+        Args:
+            pool_maxsize (int): Kept-alive connections per host
+            max_concurrency (int): Concurrent calls per upstream
+            connect_timeout (float): Default seconds to establish a connection
+            read_timeout (float): Default seconds to wait for the answer
+            retries (int): Extra attempts of idempotent calls
+            backoff (float): Seconds before the first retry, doubled each time
+            acquire_timeout (float, optional): Seconds to wait for a free slot of the
+                upstream, default is the connect timeout
+            failure_threshold (int): Consecutive failures that open the breaker
+            reset_timeout (float): Seconds the breaker stays open
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = connect_timeout if acquire_timeout is None else acquire_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+        self._upstreams = {}
+        self._lock = threading.Lock()
+
+    def _upstream(self, name):
+        with self._lock:
+            upstream = self._upstreams.get(name)
+            if upstream is None:
+                upstream = self._upstreams[name] = _Upstream(
+                    self.max_concurrency, self.failure_threshold, self.reset_timeout)
+            return upstream
+
+    def get(self, url, upstream=None, **kwargs):
+        return self.request("GET", url, upstream=upstream, **kwargs)
+
+    def post(self, url, upstream=None, **kwargs):
+        return self.request("POST", url, upstream=upstream, **kwargs)
+
+    def request(self, method, url, upstream=None, **kwargs):
+        """Make a call like requests.Session.request.
+            Args: method (str): HTTP method, only idempotent ones are retried
+                  url (str): URL to call
+                  upstream (str, optional): Name for limits, breaker and metrics,
+                      default is the host of the url
+                  kwargs: Passed to requests (params, json, headers, timeout ...)
+            Returns: requests.Response: Also for error statuses, like requests
+            Raises: CircuitOpenError, UpstreamBusyError, requests.exceptions.RequestException
+        """
+        name = upstream or urlsplit(url).netloc
+        state = self._upstream(name)
+        state.host = urlsplit(url).hostname
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = 1 + (self.retries if method.upper() in IDEMPOTENT_METHODS else 0)
+
+        for attempt in range(attempts):
+            try:
+                response = self._send(state, name, method, url, kwargs)
+            except (CircuitOpenError, UpstreamBusyError):
+                raise
+            except requests.exceptions.RequestException as e:
+                state.breaker.record_failure()
+                retryable = isinstance(e, (requests.exceptions.ConnectionError,
+                                           requests.exceptions.Timeout))
+                if not retryable or attempt + 1 >= attempts:
+                    raise
+                logging.warning("%s %s failed (%s), retry %d", method, name, e, attempt + 1)
+            except BaseException:
+                # e.g. a bug in a hook, it must not keep the trial call of a half open
+                # breaker reserved forever
+                state.breaker.record_failure()
+                raise
+            else:
+                if response.status_code >= 500:
+                    state.breaker.record_failure()
+                else:
+                    state.breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                    return response
+                logging.warning("%s %s answered %d, retry %d", method, name,
+                                response.status_code, attempt + 1)
+                response.close()
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def _send(self, state, name, method, url, kwargs):
+        if not state.slots.acquire(timeout=self.acquire_timeout):
+            raise UpstreamBusyError(f"{name} has {state.limit} calls in progress")
+        try:
+            if not state.breaker.allow():
+                raise CircuitOpenError(f"{name} is unavailable, circuit breaker is open")
+            with state.lock:
+                state.in_flight += 1
+            try:
+                with track_upstream(name) as call:
+                    response = self.session.request(method, url, **kwargs)
+                    call.status = response.status_code
+                return response
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+        finally:
+            state.slots.release()
+
+    def _idle_connections(self, host):
+        """Kept-alive connections to host that are waiting in the pool."""
+        idle = 0
+        pools = self._adapter.poolmanager.pools
+        # keys() is a copy taken under the lock of the pool manager, a pool can
+        # still be evicted before we look at it
+        for key in pools.keys():
+            pool = pools.get(key) if key.key_host == host else None
+            if pool is not None and pool.pool is not None:
+                idle += sum(1 for connection in list(pool.pool.queue) if connection)
+        return idle
+
+    def stats(self):
+        """State of every upstream called so far, e.g. for /metrics.
+            Returns: dict: upstream name -> in_flight, limit, circuit, failures and
+                     idle_connections
+        """
+        with self._lock:
+            upstreams = dict(self._upstreams)
+        return {name: {'in_flight': state.in_flight,
+                       'limit': state.limit,
+                       'circuit': state.breaker.state,
+                       'failures': state.breaker.failures,
+                       'idle_connections': self._idle_connections(state.host)}
+                for name, state in upstreams.items()}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,316 @@
+"""
+Lightweight instrumentation for the MovieWeb application.
+Counters, gauges and histograms are kept in process memory and rendered in the
+Prometheus text format on /metrics. Hooks time every Flask route, every data manager
+method, every SQL statement and the outbound OMDb/DeepSeek calls.
+Every worker process has its own numbers, so scrape each worker (or run one).
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import inspect
+import json
+import logging
+import random
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+import requests
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Current value per label set, either set directly or read from a function."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Read the value from function() on every scrape."""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logging.warning("Gauge %s could not be read: %s", self.name, e)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets per label set."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2]))
+                           for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])}"
+                             f" {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self):
+        """Returns: str: All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "movieweb_http_request_duration_seconds", "Duration of HTTP requests per route",
+    ("endpoint", "method", "status"))
+DATA_MANAGER_DURATION = REGISTRY.histogram(
+    "movieweb_data_manager_duration_seconds", "Duration of data manager methods",
+    ("method", "outcome"))
+SQL_DURATION = REGISTRY.histogram(
+    "movieweb_sql_statement_duration_seconds", "Duration of SQL statements per operation",
+    ("operation",))
+SQL_STATEMENTS = REGISTRY.counter(
+    "movieweb_sql_statements_total", "Number of SQL statements per operation",
+    ("operation",))
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "movieweb_upstream_request_duration_seconds", "Duration of outbound API calls",
+    ("upstream", "outcome"), buckets=DEFAULT_BUCKETS + (30.0, 60.0))
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "movieweb_upstream_requests_total", "Outbound API calls by result",
+    ("upstream", "outcome"))
+
+
+def instrument_app(app):
+    """Time every request of a Flask app by its endpoint (not the URL, so the number
+    of label values stays small)."""
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start,
+                                          endpoint=request.endpoint or "unmatched",
+                                          method=request.method,
+                                          status=response.status_code)
+        return response
+    return app
+
+
+def _sql_operation(statement):
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement of a SQLAlchemy engine."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_metrics_start")
+        if not starts:
+            return
+        operation = _sql_operation(statement)
+        SQL_DURATION.observe(time.perf_counter() - starts.pop(), operation=operation)
+        SQL_STATEMENTS.inc(operation=operation)
+    return engine
+
+
+def _timed(name, method):
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            start, outcome = time.perf_counter(), "error"
+            try:
+                yield from method(*args, **kwargs)
+                outcome = "ok"
+            finally:
+                DATA_MANAGER_DURATION.observe(time.perf_counter() - start,
+                                              method=name, outcome=outcome)
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start, outcome = time.perf_counter(), "error"
+        try:
+            result = method(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            DATA_MANAGER_DURATION.observe(time.perf_counter() - start,
+                                          method=name, outcome=outcome)
+    return wrapper
+
+
+def instrument_data_manager(data_manager):
+    """Time all public methods of a data manager instance."""
+    for name, method in inspect.getmembers(data_manager, inspect.ismethod):
+        if not name.startswith("_") and name != "remove_session":
+            setattr(data_manager, name, _timed(name, method))
+    return data_manager
+
+
+class _UpstreamCall:
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def track_upstream(upstream):
+    """Time an outbound API call. Set .status on the yielded object to the HTTP status.
+        Args: upstream (str): Name of the API, e.g. 'omdb'
+    """
+    call = _UpstreamCall()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield call
+        outcome = str(call.status) if call.status is not None else "ok"
+    except requests.exceptions.Timeout:
+        outcome = "timeout"
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream=upstream, outcome=outcome)
+        UPSTREAM_REQUESTS.inc(upstream=upstream, outcome=outcome)
+
+
+def log_sampled(logger, rate, event_name, **fields):
+    """Log a structured (JSON) event for a random sample of the calls.
+        Args: logger: Logger to write to
+              rate (float): Fraction of the calls that are logged (0..1)
+              event_name (str): Name of the event
+              fields: Values logged with the event
+    """
+    if rate > 0 and random.random() < rate:
+        logger.info(json.dumps({"event": event_name, **fields}, default=str,
+                               ensure_ascii=False))
@@ -0,0 +1,125 @@
+"""
+Schema migrations for the MovieWeb database.
+Migrations are versioned and forward-only: every module in this package upgrades the
+schema by one step and the applied versions are recorded in the schema_version table.
+Each step runs in its own transaction, so a failing migration leaves the database
+exactly as it was. Run setup_database.py to upgrade an existing database.
+"""
+
+from contextlib import contextmanager
+import logging
+import time
+
+from sqlalchemy import inspect, text
+
+from migrations import (m0001_initial_schema, m0002_movie_indexes, m0003_movie_search,
+                        m0004_postgres_search, m0005_collection_versions,
+                        m0006_movie_catalog, m0007_catalog_search,
+                        m0008_collection_stats, m0009_normalized_titles,
+                        m0010_enrichment_claims)
+
+
+class MigrationError(Exception):
+    """A migration can't be applied to the data that is in the database."""
+
+
+# (version, module) in the order they have to be applied. Never change or remove an
+# entry that was released - add a new module instead.
+MIGRATIONS = [
+    (1, m0001_initial_schema),
+    (2, m0002_movie_indexes),
+    (3, m0003_movie_search),
+    (4, m0004_postgres_search),
+    (5, m0005_collection_versions),
+    (6, m0006_movie_catalog),
+    (7, m0007_catalog_search),
+    (8, m0008_collection_stats),
+    (9, m0009_normalized_titles),
+    (10, m0010_enrichment_claims),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Arbitrary, but fixed: every app node has to use the same advisory lock
+MIGRATION_LOCK_KEY = 7283561
+
+
+@contextmanager
+def _transaction(engine):
+    """Open a connection with a real transaction around DDL statements.
+    pysqlite only starts transactions before INSERT/UPDATE/DELETE, so for SQLite the
+    transaction is started explicitly (and IMMEDIATE, so two app processes starting
+    at the same time can't run the same migration twice). PostgreSQL takes a
+    transaction level advisory lock for the same reason, DDL alone doesn't block a
+    second node from checking the version at the same time.
+    """
+    if engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            connection.exec_driver_sql("COMMIT")
+    else:
+        with engine.begin() as connection:
+            if engine.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                                   {"key": MIGRATION_LOCK_KEY})
+            yield connection
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER PRIMARY KEY,"
+        " description VARCHAR NOT NULL,"
+        " applied_at FLOAT NOT NULL)"))
+
+
+def _current_version(connection):
+    return connection.execute(
+        text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def current_version(engine):
+    """Get the schema version of a database, without taking a write lock.
+        Args: engine: SQLAlchemy engine of the database
+        Returns: int: Latest applied migration, 0 for a database without migrations
+    """
+    with engine.connect() as connection:
+        if not inspect(connection).has_table("schema_version"):
+            return 0
+        return _current_version(connection)
+
+
+def upgrade(engine, target=None):
+    """Apply all pending migrations up to target.
+        Args: engine: SQLAlchemy engine of the database
+              target (int, optional): Version to stop at, default is the latest
+        Returns: List[int]: Versions that were applied by this call
+        Raises: MigrationError: if a migration can't be applied to the existing data
+    """
+    target = LATEST_VERSION if target is None else target
+    # every data manager upgrades when it is built, a current database must not cost
+    # a write lock per migration
+    if current_version(engine) >= target:
+        return []
+    applied = []
+    for version, module in MIGRATIONS:
+        if version > target:
+            break
+        with _transaction(engine) as connection:
+            _ensure_version_table(connection)
+            if _current_version(connection) >= version:
+                continue
+            module.upgrade(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version, description, applied_at)"
+                     " VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": module.DESCRIPTION,
+                 "applied_at": time.time()})
+        logging.info("Applied migration %s: %s", version, module.DESCRIPTION)
+        applied.append(version)
+    return applied
@@ -0,0 +1,57 @@
+"""
+Baseline schema: users, movies, enrichment_jobs and funfacts as they were created by
+Base.metadata.create_all before migrations existed. Tables that already exist are
+left untouched, so this also adopts existing databases.
+The definitions are frozen copies - later changes to models.py need a new migration.
+"""
+
+from sqlalchemy import (Boolean, CheckConstraint, Column, Float, ForeignKey, Index, Integer,
+                        MetaData, String, Table, Text)
+
+
+DESCRIPTION = "initial schema"
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String, unique=True, nullable=False),
+)
+
+movies = Table(
+    "movies", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("title", String, nullable=False),
+    Column("director", String),
+    Column("writer", String),
+    Column("actors", String),
+    Column("year", Integer),
+    Column("rating", Float, CheckConstraint('rating >= 0 AND rating <= 10')),
+    Column("genre", String),
+    Column("runtime", String),
+    Column("plot", Text),
+    Column("comment", Text),
+)
+
+enrichment_jobs = Table(
+    "enrichment_jobs", metadata,
+    Column("movie_id", Integer, ForeignKey("movies.id"), primary_key=True),
+    Column("status", String, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("last_error", Text),
+)
+
+funfacts = Table(
+    "funfacts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("theme", String, nullable=False),
+    Column("fact", Text, nullable=False),
+    Column("served", Boolean, nullable=False),
+    Index("ix_funfacts_theme", "theme"),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
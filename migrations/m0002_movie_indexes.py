@@ -0,0 +1,42 @@
+"""
+Indexes for the queries the app runs on every page view:
+- movie_exists looks up (user_id, lower(title)) -> unique index, which also serves
+  the title sort of the paginated movie list
+- the other sort orders of the movie list and the plain user_id filter
+- unfinished enrichment jobs and the unused fun facts
+"""
+
+from sqlalchemy import text
+
+
+DESCRIPTION = "movie lookup and sort indexes"
+
+INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_movies_user_title"
+    " ON movies (user_id, lower(title))",
+    "CREATE INDEX IF NOT EXISTS ix_movies_user_year"
+    " ON movies (user_id, coalesce(year, 0), id)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_user_rating"
+    " ON movies (user_id, coalesce(rating, -1.0), id)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_user_id ON movies (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_enrichment_jobs_status ON enrichment_jobs (status)",
+    "CREATE INDEX IF NOT EXISTS ix_funfacts_served ON funfacts (served, id)",
+]
+
+
+def upgrade(connection):
+    # Import here to avoid a circular import of the migrations package
+    from migrations import MigrationError
+
+    duplicates = connection.execute(text(
+        "SELECT user_id, lower(title), COUNT(*) FROM movies"
+        " GROUP BY user_id, lower(title) HAVING COUNT(*) > 1")).fetchall()
+    if duplicates:
+        listing = ", ".join(f"user {user_id}: '{title}' ({count}x)"
+                            for user_id, title, count in duplicates)
+        raise MigrationError(
+            "Can't add the unique (user_id, lower(title)) index, these movies exist more "
+            f"than once: {listing}. Rename or delete the duplicates and run again.")
+
+    for statement in INDEXES:
+        connection.execute(text(statement))
@@ -0,0 +1,52 @@
+"""
+Full-text search over the movies with an SQLite FTS5 index.
+movies_fts is an external content table (it stores only the index, the text stays in
+movies) and is kept in sync by triggers on insert, update and delete. Other
+databases are skipped here.
+"""
+
+from sqlalchemy import text
+
+
+DESCRIPTION = "movie full-text search"
+
+STATEMENTS = [
+    "CREATE VIRTUAL TABLE movies_fts USING fts5("
+    " title, director, writer, actors, genre, plot, comment,"
+    " content='movies', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+    "CREATE TRIGGER movies_fts_insert AFTER INSERT ON movies BEGIN"
+    " INSERT INTO movies_fts (rowid, title, director, writer, actors, genre, plot, comment)"
+    " VALUES (new.id, new.title, new.director, new.writer, new.actors, new.genre,"
+    " new.plot, new.comment);"
+    " END",
+
+    "CREATE TRIGGER movies_fts_delete AFTER DELETE ON movies BEGIN"
+    " INSERT INTO movies_fts (movies_fts, rowid, title, director, writer, actors, genre,"
+    " plot, comment)"
+    " VALUES ('delete', old.id, old.title, old.director, old.writer, old.actors,"
+    " old.genre, old.plot, old.comment);"
+    " END",
+
+    "CREATE TRIGGER movies_fts_update AFTER UPDATE OF title, director, writer, actors,"
+    " genre, plot, comment ON movies BEGIN"
+    " INSERT INTO movies_fts (movies_fts, rowid, title, director, writer, actors, genre,"
+    " plot, comment)"
+    " VALUES ('delete', old.id, old.title, old.director, old.writer, old.actors,"
+    " old.genre, old.plot, old.comment);"
+    " INSERT INTO movies_fts (rowid, title, director, writer, actors, genre, plot, comment)"
+    " VALUES (new.id, new.title, new.director, new.writer, new.actors, new.genre,"
+    " new.plot, new.comment);"
+    " END",
+
+    # index the movies that already exist
+    "INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
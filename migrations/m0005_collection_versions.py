@@ -0,0 +1,31 @@
+"""
+Change counters of the movie collections, used as validators for HTTP caching.
+Every existing user (and the user list, row 0) starts at version 1.
+"""
+
+import time
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, text
+
+
+DESCRIPTION = "collection versions"
+
+metadata = MetaData()
+
+collection_versions = Table(
+    "collection_versions", metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("version", Integer, nullable=False),
+    Column("modified_at", Float, nullable=False),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+    now = time.time()
+    connection.execute(text(
+        "INSERT INTO collection_versions (user_id, version, modified_at)"
+        " SELECT id, 1, :now FROM users"), {"now": now})
+    connection.execute(text(
+        "INSERT INTO collection_versions (user_id, version, modified_at)"
+        " VALUES (0, 1, :now)"), {"now": now})
@@ -0,0 +1,113 @@
+"""
+Shared movie catalog: the OMDb metadata (director, writer, actors, year, genre,
+runtime, plot) moves from the movies of every user into the catalog table, the
+collections keep only title, rating and comment in user_movies.
+Movies with exactly the same metadata become one catalog entry. The ids of the movies
+stay the same, so links, enrichment jobs and the collection versions stay valid.
+The full-text indexes of the movies table are dropped here and rebuilt on the new
+tables by migration 0007.
+"""
+
+from sqlalchemy import (CheckConstraint, Column, Float, ForeignKey, Integer, MetaData,
+                        String, Table, Text, text)
+
+
+DESCRIPTION = "shared movie catalog"
+
+metadata = MetaData()
+
+# only referenced by the foreign key
+users = Table("users", metadata, Column("id", Integer, primary_key=True))
+
+catalog = Table(
+    "catalog", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("imdb_id", String, unique=True),
+    Column("title", String, nullable=False),
+    Column("director", String),
+    Column("writer", String),
+    Column("actors", String),
+    Column("year", Integer),
+    Column("genre", String),
+    Column("runtime", String),
+    Column("plot", Text),
+    Column("imdb_rating", Float),
+)
+
+user_movies = Table(
+    "user_movies", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("catalog_id", Integer, ForeignKey("catalog.id"), nullable=False),
+    Column("title", String, nullable=False),
+    Column("rating", Float, CheckConstraint('rating >= 0 AND rating <= 10')),
+    Column("comment", Text),
+)
+
+# created under a new name and renamed, enrichment_jobs has to reference user_movies
+enrichment_jobs = Table(
+    "enrichment_jobs_new", metadata,
+    Column("movie_id", Integer, ForeignKey("user_movies.id"), primary_key=True),
+    Column("status", String, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("last_error", Text),
+)
+
+METADATA_FIELDS = ('director', 'writer', 'actors', 'year', 'genre', 'runtime', 'plot')
+
+DROP_MOVIE_SEARCH = {
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS movies_fts_insert",
+        "DROP TRIGGER IF EXISTS movies_fts_delete",
+        "DROP TRIGGER IF EXISTS movies_fts_update",
+        "DROP TABLE IF EXISTS movies_fts",
+    ],
+    # the generated search_vector column and its index go with the movies table
+}
+
+INDEXES = [
+    "CREATE UNIQUE INDEX ux_user_movies_user_title ON user_movies (user_id, lower(title))",
+    "CREATE INDEX ix_user_movies_user_rating"
+    " ON user_movies (user_id, coalesce(rating, -1.0), id)",
+    "CREATE INDEX ix_user_movies_user_id ON user_movies (user_id, id)",
+    "CREATE INDEX ix_user_movies_catalog ON user_movies (catalog_id)",
+    "CREATE INDEX ix_enrichment_jobs_status ON enrichment_jobs (status)",
+]
+
+
+def upgrade(connection):
+    dialect = connection.dialect.name
+    # NULL equals NULL when movies are matched with their catalog entry
+    same = "IS" if dialect == "sqlite" else "IS NOT DISTINCT FROM"
+    fields = ", ".join(METADATA_FIELDS)
+
+    for statement in DROP_MOVIE_SEARCH.get(dialect, []):
+        connection.execute(text(statement))
+    metadata.create_all(connection, tables=[catalog, user_movies, enrichment_jobs])
+    # matches the movies to their entries below and later the titles to OMDb entries
+    connection.execute(text("CREATE INDEX ix_catalog_title ON catalog (lower(title))"))
+
+    connection.execute(text(
+        f"INSERT INTO catalog (title, {fields})"
+        f" SELECT MIN(title), {fields} FROM movies"
+        f" GROUP BY lower(title), {fields}"))
+    connection.execute(text(
+        "INSERT INTO user_movies (id, user_id, catalog_id, title, rating, comment)"
+        " SELECT movies.id, movies.user_id, catalog.id, movies.title, movies.rating,"
+        " movies.comment FROM movies JOIN catalog"
+        " ON lower(catalog.title) = lower(movies.title) AND "
+        + " AND ".join(f"catalog.{field} {same} movies.{field}" for field in METADATA_FIELDS)))
+    connection.execute(text(
+        "INSERT INTO enrichment_jobs_new (movie_id, status, attempts, last_error)"
+        " SELECT movie_id, status, attempts, last_error FROM enrichment_jobs"))
+
+    connection.execute(text("DROP TABLE enrichment_jobs"))
+    connection.execute(text("DROP TABLE movies"))
+    connection.execute(text("ALTER TABLE enrichment_jobs_new RENAME TO enrichment_jobs"))
+    for statement in INDEXES:
+        connection.execute(text(statement))
+    if dialect == "postgresql":
+        # the ids were copied, new movies have to continue after them
+        connection.execute(text(
+            "SELECT setval(pg_get_serial_sequence('user_movies', 'id'),"
+            " COALESCE(MAX(id), 0) + 1, false) FROM user_movies"))
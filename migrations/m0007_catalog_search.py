@@ -0,0 +1,95 @@
+"""
+Full-text search on the catalog schema of migration 0006. The metadata of a movie is
+indexed once per catalog entry, not once per collection it is in. Only what a user
+wrote themselves (title and comment) is indexed per collection entry.
+SQLite: external content FTS5 tables kept in sync by triggers, like migration 0003.
+PostgreSQL: generated tsvector columns with GIN indexes, like migration 0004.
+"""
+
+from sqlalchemy import text
+
+
+DESCRIPTION = "catalog full-text search"
+
+SQLITE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE catalog_fts USING fts5("
+    " title, director, writer, actors, genre, plot,"
+    " content='catalog', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+    "CREATE TRIGGER catalog_fts_insert AFTER INSERT ON catalog BEGIN"
+    " INSERT INTO catalog_fts (rowid, title, director, writer, actors, genre, plot)"
+    " VALUES (new.id, new.title, new.director, new.writer, new.actors, new.genre,"
+    " new.plot);"
+    " END",
+
+    "CREATE TRIGGER catalog_fts_delete AFTER DELETE ON catalog BEGIN"
+    " INSERT INTO catalog_fts (catalog_fts, rowid, title, director, writer, actors, genre,"
+    " plot)"
+    " VALUES ('delete', old.id, old.title, old.director, old.writer, old.actors,"
+    " old.genre, old.plot);"
+    " END",
+
+    "CREATE TRIGGER catalog_fts_update AFTER UPDATE OF title, director, writer, actors,"
+    " genre, plot ON catalog BEGIN"
+    " INSERT INTO catalog_fts (catalog_fts, rowid, title, director, writer, actors, genre,"
+    " plot)"
+    " VALUES ('delete', old.id, old.title, old.director, old.writer, old.actors,"
+    " old.genre, old.plot);"
+    " INSERT INTO catalog_fts (rowid, title, director, writer, actors, genre, plot)"
+    " VALUES (new.id, new.title, new.director, new.writer, new.actors, new.genre,"
+    " new.plot);"
+    " END",
+
+    "CREATE VIRTUAL TABLE user_movies_fts USING fts5("
+    " title, comment,"
+    " content='user_movies', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+    "CREATE TRIGGER user_movies_fts_insert AFTER INSERT ON user_movies BEGIN"
+    " INSERT INTO user_movies_fts (rowid, title, comment)"
+    " VALUES (new.id, new.title, new.comment);"
+    " END",
+
+    "CREATE TRIGGER user_movies_fts_delete AFTER DELETE ON user_movies BEGIN"
+    " INSERT INTO user_movies_fts (user_movies_fts, rowid, title, comment)"
+    " VALUES ('delete', old.id, old.title, old.comment);"
+    " END",
+
+    "CREATE TRIGGER user_movies_fts_update AFTER UPDATE OF title, comment ON user_movies"
+    " BEGIN"
+    " INSERT INTO user_movies_fts (user_movies_fts, rowid, title, comment)"
+    " VALUES ('delete', old.id, old.title, old.comment);"
+    " INSERT INTO user_movies_fts (rowid, title, comment)"
+    " VALUES (new.id, new.title, new.comment);"
+    " END",
+
+    # index what migration 0006 moved over
+    "INSERT INTO catalog_fts (catalog_fts) VALUES ('rebuild')",
+    "INSERT INTO user_movies_fts (user_movies_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_STATEMENTS = [
+    "ALTER TABLE catalog ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    " setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||"
+    " setweight(to_tsvector('simple', coalesce(director, '') || ' ' ||"
+    " coalesce(actors, '')), 'B') ||"
+    " setweight(to_tsvector('simple', coalesce(writer, '') || ' ' ||"
+    " coalesce(genre, '')), 'C') ||"
+    " setweight(to_tsvector('simple', coalesce(plot, '')), 'D')) STORED",
+
+    "CREATE INDEX ix_catalog_search ON catalog USING gin (search_vector)",
+
+    "ALTER TABLE user_movies ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    " setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||"
+    " setweight(to_tsvector('simple', coalesce(comment, '')), 'D')) STORED",
+
+    "CREATE INDEX ix_user_movies_search ON user_movies USING gin (search_vector)",
+]
+
+
+def upgrade(connection):
+    statements = {'sqlite': SQLITE_STATEMENTS,
+                  'postgresql': POSTGRES_STATEMENTS}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
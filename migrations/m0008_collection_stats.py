@@ -0,0 +1,110 @@
+"""
+Precomputed collection statistics (see collection_stats): totals per user and the
+number of movies per genre, decade and director. The statistics of the existing
+collections are computed here, from then on every write keeps them up to date.
+The parsing of runtime, genres, directors and decades is a frozen copy of
+collection_stats as it was released with this migration.
+"""
+
+from collections import Counter
+import re
+
+from sqlalchemy import bindparam, Column, Float, Integer, MetaData, String, Table, text
+
+
+DESCRIPTION = "collection statistics"
+
+# users whose statistics are computed per statement
+BACKFILL_BATCH = 500
+
+metadata = MetaData()
+
+stats = Table(
+    "collection_stats", metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("movie_count", Integer, nullable=False),
+    Column("rated_count", Integer, nullable=False),
+    Column("rating_sum", Float, nullable=False),
+    Column("runtime_count", Integer, nullable=False),
+    Column("runtime_sum", Integer, nullable=False),
+)
+
+stat_counts = Table(
+    "collection_stat_counts", metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("kind", String, primary_key=True),
+    Column("name", String, primary_key=True),
+    Column("movie_count", Integer, nullable=False),
+)
+
+
+RUNTIME_PART = re.compile(r"(\d+)\s*(h|hr|hrs|hours?|m|min|mins|minutes?)?\b", re.IGNORECASE)
+
+
+def parse_runtime(runtime):
+    """Minutes of a runtime like "148 min", "2h 28min" or "90", None without one."""
+    if runtime is None:
+        return None
+    minutes = None
+    for number, unit in RUNTIME_PART.findall(str(runtime)):
+        factor = 60 if unit and unit[0].lower() == 'h' else 1
+        minutes = (minutes or 0) + int(number) * factor
+    return minutes or None
+
+
+def split_names(value):
+    """Names of a comma separated field like genre or director."""
+    if not value:
+        return []
+    names = (name.strip() for name in str(value).split(','))
+    return [name for name in dict.fromkeys(names) if name and name != 'N/A']
+
+
+def decade(year):
+    return f"{int(year) // 10 * 10}s" if year else None
+
+
+def backfill(connection, user_ids):
+    """Compute the statistics of users from their movies (the tables are still empty)."""
+    totals = {user_id: Counter() for user_id in user_ids}
+    counts = Counter()
+    rows = connection.execute(text(
+        "SELECT user_movies.user_id, user_movies.rating, catalog.year, catalog.genre,"
+        " catalog.director, catalog.runtime"
+        " FROM user_movies JOIN catalog ON catalog.id = user_movies.catalog_id"
+        " WHERE user_movies.user_id IN :user_ids"
+    ).bindparams(bindparam('user_ids', expanding=True)), {'user_ids': user_ids})
+    for row in rows:
+        user_totals = totals[row.user_id]
+        user_totals['movie_count'] += 1
+        if row.rating is not None:
+            user_totals['rated_count'] += 1
+            user_totals['rating_sum'] += row.rating
+        minutes = parse_runtime(row.runtime)
+        if minutes is not None:
+            user_totals['runtime_count'] += 1
+            user_totals['runtime_sum'] += minutes
+        for kind, names in (('genre', split_names(row.genre)),
+                            ('decade', [decade(row.year)] if row.year else []),
+                            ('director', split_names(row.director))):
+            for name in names:
+                counts[(row.user_id, kind, name)] += 1
+    connection.execute(stats.insert(), [
+        {'user_id': user_id, 'movie_count': changes['movie_count'],
+         'rated_count': changes['rated_count'], 'rating_sum': changes['rating_sum'],
+         'runtime_count': changes['runtime_count'], 'runtime_sum': changes['runtime_sum']}
+        for user_id, changes in totals.items()])
+    if counts:
+        connection.execute(stat_counts.insert(), [
+            {'user_id': user_id, 'kind': kind, 'name': name, 'movie_count': count}
+            for (user_id, kind, name), count in counts.items()])
+
+
+def upgrade(connection):
+    metadata.create_all(connection)
+    connection.execute(text(
+        "CREATE INDEX ix_collection_stat_counts_top"
+        " ON collection_stat_counts (user_id, kind, movie_count DESC, name)"))
+    user_ids = connection.execute(text("SELECT id FROM users ORDER BY id")).scalars().all()
+    for start in range(0, len(user_ids), BACKFILL_BATCH):
+        backfill(connection, user_ids[start:start + BACKFILL_BATCH])
@@ -0,0 +1,100 @@
+"""
+Normalized titles (see titles.normalize_title) for the duplicate check and the similar
+title hints of the add movie form. user_movies and catalog get a normalized_title
+column, computed here for the existing rows, and an index on it. The catalog index on
+lower(title) of migration 0006 is replaced by the one on the normalized title.
+Similar titles are looked up in a trigram index of the normalized catalog titles:
+SQLite: an external content FTS5 table with the trigram tokenizer, kept in sync by
+triggers like the full-text indexes of migration 0007.
+PostgreSQL: a GIN index with the trigram operators of the pg_trgm extension.
+The normalizer is a frozen copy of titles.normalize_title as it was released with this
+migration, a later change to titles needs a new migration that recomputes the column.
+"""
+
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, text
+
+
+DESCRIPTION = "normalized titles"
+
+# rows whose normalized title is computed per statement
+BACKFILL_BATCH = 1000
+
+TRAILING_YEAR = re.compile(r"\s*[(\[]\s*(\d{4})\s*[)\]]\s*$")
+LEADING_ARTICLE = re.compile(r"^(?:the|a|an)\s+(?=\S)")
+TRAILING_ARTICLE = re.compile(r",\s*(?:the|a|an)$")
+JOINERS = re.compile(r"['’ʼ`\-‐‑–.]")
+SEPARATORS = re.compile(r"[\W_]+")
+MIN_YEAR, MAX_YEAR = 1870, 2100
+
+SQLITE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE catalog_trigram_fts USING fts5("
+    " normalized_title, content='catalog', content_rowid='id', tokenize='trigram')",
+
+    "CREATE TRIGGER catalog_trigram_fts_insert AFTER INSERT ON catalog BEGIN"
+    " INSERT INTO catalog_trigram_fts (rowid, normalized_title)"
+    " VALUES (new.id, new.normalized_title);"
+    " END",
+
+    "CREATE TRIGGER catalog_trigram_fts_delete AFTER DELETE ON catalog BEGIN"
+    " INSERT INTO catalog_trigram_fts (catalog_trigram_fts, rowid, normalized_title)"
+    " VALUES ('delete', old.id, old.normalized_title);"
+    " END",
+
+    "CREATE TRIGGER catalog_trigram_fts_update AFTER UPDATE OF normalized_title ON catalog"
+    " BEGIN"
+    " INSERT INTO catalog_trigram_fts (catalog_trigram_fts, rowid, normalized_title)"
+    " VALUES ('delete', old.id, old.normalized_title);"
+    " INSERT INTO catalog_trigram_fts (rowid, normalized_title)"
+    " VALUES (new.id, new.normalized_title);"
+    " END",
+
+    "INSERT INTO catalog_trigram_fts (catalog_trigram_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ix_catalog_normalized_trigrams"
+    " ON catalog USING gin (normalized_title gin_trgm_ops)",
+]
+
+
+def normalize_title(title):
+    """Frozen copy of titles.normalize_title (with split_year)."""
+    title = (title or "").strip()
+    match = TRAILING_YEAR.search(title)
+    if match and MIN_YEAR <= int(match.group(1)) <= MAX_YEAR:
+        title = title[:match.start()].strip()
+    folded = unicodedata.normalize("NFKD", title)
+    folded = "".join(char for char in folded if not unicodedata.combining(char)).casefold()
+    folded = TRAILING_ARTICLE.sub("", folded)
+    folded = SEPARATORS.sub(" ", JOINERS.sub("", folded)).strip()
+    return LEADING_ARTICLE.sub("", folded) or " ".join(title.split()).casefold()
+
+
+def backfill(connection, table):
+    """Compute the normalized title of every row of a table."""
+    rows = connection.execute(text(f"SELECT id, title FROM {table} ORDER BY id")).all()
+    update = text(f"UPDATE {table} SET normalized_title = :normalized WHERE id = :row_id"
+                  ).bindparams(bindparam('row_id'), bindparam('normalized'))
+    for start in range(0, len(rows), BACKFILL_BATCH):
+        connection.execute(update, [{'row_id': row_id, 'normalized': normalize_title(title)}
+                                    for row_id, title in rows[start:start + BACKFILL_BATCH]])
+
+
+def upgrade(connection):
+    for table in ("user_movies", "catalog"):
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN normalized_title VARCHAR NOT NULL DEFAULT ''"))
+        backfill(connection, table)
+    connection.execute(text("DROP INDEX ix_catalog_title"))
+    connection.execute(text(
+        "CREATE INDEX ix_user_movies_user_normalized"
+        " ON user_movies (user_id, normalized_title)"))
+    connection.execute(text("CREATE INDEX ix_catalog_normalized ON catalog (normalized_title)"))
+    statements = {'sqlite': SQLITE_STATEMENTS,
+                  'postgresql': POSTGRES_STATEMENTS}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
@@ -0,0 +1,15 @@
+"""
+Claims of the background OMDb enrichments. Every process of the app resumes the
+unfinished jobs when it starts its enrichment worker, a job is run by the process that
+claims it. claimed_at is the unix time of the claim or of the last attempt, a running
+job whose claim is older than the lease is taken over (its process is gone).
+"""
+
+from sqlalchemy import text
+
+
+DESCRIPTION = "enrichment claims"
+
+
+def upgrade(connection):
+    connection.execute(text("ALTER TABLE enrichment_jobs ADD COLUMN claimed_at FLOAT"))
@@ -1,14 +1,24 @@
 """
 Database Models for Movie Web Application
-Defines SQLAlchemy ORM models for users and movies with their relationships.
+Defines SQLAlchemy ORM models for users, the shared movie catalog and the movie
+collections of the users with their relationships.
 """
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import CheckConstraint, Column, Integer, String, ForeignKey, Float, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import (Boolean, CheckConstraint, Column, Integer, String, ForeignKey, Float,
+                        func, Index, literal_column, Text)
+from sqlalchemy.orm import relationship, validates
+
+from titles import normalize_title
 
 Base = declarative_base()
 
+
+def _normalized_default(context):
+    """normalized_title of rows inserted without one (Core inserts)."""
+    return normalize_title(context.get_current_parameters()['title'])
+
+
 class User(Base):
     """The user model represents registrated application users"""
     __tablename__ = "users"
@@ -18,21 +28,193 @@ class User(Base):
     movies = relationship("Movie", back_populates="user")
 
 
-class Movie(Base):
-    """Movie model that represenst movies and coordinated data in the users collection."""
-    __tablename__ = "movies"
+class CatalogEntry(Base):
+    """Movie metadata (as OMDb knows it) in the catalog that all users share.
+    Entries with an IMDb ID come from OMDb and are shared by every collection that has
+    the movie. Entries without one hold data a user typed in themselves."""
+    __tablename__ = "catalog"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    imdb_id = Column(String, unique=True)
     title = Column(String, nullable=False)
+    # titles.normalize_title(title), matches a typed title with the OMDb entry
+    normalized_title = Column(String, nullable=False, default=_normalized_default)
     director = Column(String)
     writer = Column(String)
     actors = Column(String)
     year = Column(Integer)
-    rating = Column(Float, CheckConstraint('rating >= 0 AND rating <= 10'))
     genre = Column(String)
     runtime = Column(String)
     plot = Column(Text)
+    imdb_rating = Column(Float)
+
+    @validates('title')
+    def _normalize(self, key, title):
+        self.normalized_title = normalize_title(title)
+        return title
+
+    movies = relationship("Movie", back_populates="catalog")
+
+
+# Fields of a movie that are stored in its catalog entry
+CATALOG_FIELDS = ('director', 'writer', 'actors', 'year', 'genre', 'runtime', 'plot')
+# range of the CheckConstraint of user_movies.rating
+MIN_RATING, MAX_RATING = 0, 10
+
+
+def check_rating(rating):
+    """Check a rating before it is written, like the CheckConstraint of the database.
+        Args: rating: Number, numeric string or None
+        Returns: float: The rating or None
+        Raises: ValueError if it isn't a number between MIN_RATING and MAX_RATING
+    """
+    if rating is None:
+        return None
+    try:
+        rating = float(rating)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid rating {rating!r}")
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f"rating {rating} is not between {MIN_RATING} and {MAX_RATING}")
+    return rating
+
+
+def _catalog_field(name):
+    """Read-only view of a catalog field, changes go through update_user_movie."""
+    return property(lambda movie: getattr(movie.catalog, name) if movie.catalog else None,
+                    doc=f"{name} of the catalog entry")
+
+
+class Movie(Base):
+    """Movie model that represenst a movie in the collection of a user: the user's own
+    title, rating and comment on an entry of the shared catalog."""
+    __tablename__ = "user_movies"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    catalog_id = Column(Integer, ForeignKey("catalog.id"), nullable=False)
+    title = Column(String, nullable=False)
+    # titles.normalize_title(title), the duplicate check of movie_exists
+    normalized_title = Column(String, nullable=False, default=_normalized_default)
+    rating = Column(Float, CheckConstraint(f'rating >= {MIN_RATING} AND rating <= {MAX_RATING}'))
     comment = Column(Text)
 
     user = relationship("User", back_populates="movies")
+    # always loaded in the same query, every page shows catalog fields
+    catalog = relationship("CatalogEntry", back_populates="movies", lazy="joined",
+                           innerjoin=True)
+    enrichment = relationship("EnrichmentJob", uselist=False, back_populates="movie",
+                              cascade="all, delete-orphan")
+
+    director = _catalog_field('director')
+    writer = _catalog_field('writer')
+    actors = _catalog_field('actors')
+    year = _catalog_field('year')
+    genre = _catalog_field('genre')
+    runtime = _catalog_field('runtime')
+    plot = _catalog_field('plot')
+
+    @validates('title')
+    def _normalize(self, key, title):
+        self.normalized_title = normalize_title(title)
+        return title
+
+    @property
+    def is_enriching(self):
+        """True while OMDb data for this movie is still being fetched in the background."""
+        return self.enrichment is not None and self.enrichment.status in ("pending", "running")
+
+
+# Sort keys of the paginated movie list (see SQLiteDataManager.get_user_movies_page).
+# NULL years/ratings are sorted as 0/-1, so the keyset comparison stays well defined.
+# The defaults are literals (no bind parameters), otherwise SQLite can't match the
+# expressions of the queries with the indexes below. The year is a catalog field, that
+# sort joins the catalog and sorts the (small) collection of the user.
+MOVIE_SORT_EXPRESSIONS = {
+    'title': [func.lower(Movie.title), Movie.id],
+    'year': [func.coalesce(CatalogEntry.year, literal_column("0")), Movie.id],
+    'rating': [func.coalesce(Movie.rating, literal_column("-1.0")), Movie.id],
+    'id': [Movie.id],
+}
+
+# A composite index for the title, rating and id sort orders, so those pages are a
+# single index range scan. The year sort has none, it sorts the collection of the
+# user (see above). The unique title index keeps exact duplicates out, movie_exists
+# looks up the normalized title. The indexes are created by the migrations package,
+# keep both in sync.
+Index("ux_user_movies_user_title", Movie.user_id, func.lower(Movie.title), unique=True)
+Index("ix_user_movies_user_rating", Movie.user_id, *MOVIE_SORT_EXPRESSIONS['rating'])
+Index("ix_user_movies_user_id", Movie.user_id, Movie.id)
+Index("ix_user_movies_catalog", Movie.catalog_id)
+Index("ix_user_movies_user_normalized", Movie.user_id, Movie.normalized_title)
+Index("ix_catalog_normalized", CatalogEntry.normalized_title)
+
+
+class EnrichmentJob(Base):
+    """Status of the background OMDb lookup that fills the empty fields of a movie."""
+    __tablename__ = "enrichment_jobs"
+
+    movie_id = Column(Integer, ForeignKey("user_movies.id"), primary_key=True)
+    status = Column(String, nullable=False, default="pending",
+                    index=True)  # pending/running/done/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    # unix time of the claim or the last attempt of the process running the job
+    claimed_at = Column(Float)
+
+    movie = relationship("Movie", back_populates="enrichment")
+
+
+class FunFact(Base):
+    """Pre-generated movie fun fact, waiting in the pool of its theme."""
+    __tablename__ = "funfacts"
+
+    id = Column(Integer, primary_key=True)
+    theme = Column(String, nullable=False, index=True)
+    fact = Column(Text, nullable=False)
+    served = Column(Boolean, nullable=False, default=False)
+
+
+Index("ix_funfacts_served", FunFact.served, FunFact.id)
+
+
+# collection_versions row that counts the changes of the user list itself
+ALL_USERS = 0
+
+
+class CollectionVersion(Base):
+    """Change counter of the movie collection of a user, bumped by every write to it.
+    It validates the cached pages of the collection (ETag/Last-Modified, see page_cache)."""
+    __tablename__ = "collection_versions"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)  # or ALL_USERS
+    version = Column(Integer, nullable=False, default=1)
+    modified_at = Column(Float, nullable=False)  # unix time of the last change
+
+
+class CollectionStats(Base):
+    """Totals of the movie collection of a user, kept up to date by every write to it
+    (see collection_stats), so the statistics page doesn't read the movies."""
+    __tablename__ = "collection_stats"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    movie_count = Column(Integer, nullable=False, default=0)
+    rated_count = Column(Integer, nullable=False, default=0)  # movies with a rating
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    runtime_count = Column(Integer, nullable=False, default=0)  # movies with a runtime
+    runtime_sum = Column(Integer, nullable=False, default=0)  # minutes
+
+
+class CollectionStatCount(Base):
+    """Number of movies per genre, decade or director in the collection of a user."""
+    __tablename__ = "collection_stat_counts"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    kind = Column(String, primary_key=True)  # genre, decade or director
+    name = Column(String, primary_key=True)
+    movie_count = Column(Integer, nullable=False)
+
+
+# the top genres/directors of a user are the first rows of this index
+Index("ix_collection_stat_counts_top", CollectionStatCount.user_id, CollectionStatCount.kind,
+      CollectionStatCount.movie_count.desc(), CollectionStatCount.name)
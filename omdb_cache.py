@@ -0,0 +1,208 @@
+"""
+OMDb response cache for the MovieWeb application.
+Keeps recently requested OMDb answers in memory (LRU) and persists them in a small
+SQLite file next to the movie database, so the same title is only fetched once per
+TTL - also when OMDb answered that the movie does not exist.
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+DEFAULT_TTL = 7 * 24 * 60 * 60          # positive answers: one week
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60     # "Movie not found!" answers: one day
+# writes between the evictions of the SQLite tier, it can exceed its limit by that many
+EVICT_EVERY = 100
+
+
+def normalize_title(title):
+    """Build the cache key for a movie title.
+        Args: title (str): Title as typed by the user
+        Returns: str: Unicode normalized, case folded title with collapsed whitespace
+    """
+    title = unicodedata.normalize("NFKC", title or "")
+    return " ".join(title.split()).casefold()
+
+
+def is_negative_response(payload):
+    """Check if an OMDb payload is a cacheable 'not found' answer.
+    Other errors (invalid key, request limit reached ...) must not be cached.
+    """
+    return (payload.get('Response') == 'False'
+            and payload.get('Error', '').lower().startswith('movie not found'))
+
+
+class OMDbCache:
+    """Two tier cache (memory + SQLite) for raw OMDb API payloads."""
+    def __init__(self, db_path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_memory_entries=512, max_db_entries=50000, evict_every=EVICT_EVERY):
+        """
+        Args:
+            db_path (str): Path of the SQLite cache file (created if missing)
+            ttl (int): Seconds a found movie stays cached
+            negative_ttl (int): Seconds a 'Movie not found!' answer stays cached
+            max_memory_entries (int): Size of the in-process LRU
+            max_db_entries (int): Row limit of the persistent tier
+            evict_every (int): Writes of this process between two evictions
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_db_entries = max_db_entries
+        self.evict_every = evict_every
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._writes = 0
+
+    def _connect(self):
+        """Open the SQLite tier lazily, so importing the app never touches the disk."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, timeout=5,
+                                               check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS omdb_cache ("
+                " key TEXT PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " negative INTEGER NOT NULL DEFAULT 0,"
+                " expires_at REAL NOT NULL)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_omdb_cache_expires_at"
+                " ON omdb_cache (expires_at)")
+            self._connection.commit()
+        return self._connection
+
+    def _remember(self, key, expires_at, payload):
+        """Put an entry into the memory tier and evict the least recently used ones."""
+        self._memory[key] = (expires_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, title):
+        """Look up the cached OMDb payload for a title.
+            Args: title (str): Movie title
+            Returns: dict: The raw OMDb payload or None on a cache miss
+        """
+        key = normalize_title(title)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            try:
+                row = self._connect().execute(
+                    "SELECT payload, expires_at FROM omdb_cache"
+                    " WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            except sqlite3.Error as e:
+                logging.error("Error reading OMDb cache: %s", e)
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            payload = json.loads(row[0])
+            self._remember(key, row[1], payload)
+            self.disk_hits += 1
+            return payload
+
+    def set(self, title, payload):
+        """Store an OMDb payload. Errors other than 'not found' are ignored.
+            Args: title (str): Movie title that was requested
+                  payload (dict): Raw OMDb JSON answer
+        """
+        if not isinstance(payload, dict):
+            return
+        negative = is_negative_response(payload)
+        if payload.get('Response') == 'False' and not negative:
+            return
+
+        key = normalize_title(title)
+        expires_at = time.time() + (self.negative_ttl if negative else self.ttl)
+        with self._lock:
+            self._remember(key, expires_at, payload)
+            try:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO omdb_cache (key, payload, negative, expires_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(payload), int(negative), expires_at))
+                self._writes += 1
+                if self._writes % self.evict_every == 0:
+                    self._evict(connection)
+                connection.commit()
+            except sqlite3.Error as e:
+                logging.error("Error writing OMDb cache: %s", e)
+
+    def _evict(self, connection):
+        """Drop expired rows and keep the persistent tier below max_db_entries. Counting
+        the rows reads the whole table, so this runs every evict_every writes only."""
+        connection.execute("DELETE FROM omdb_cache WHERE expires_at <= ?", (time.time(),))
+        overflow = connection.execute("SELECT COUNT(*) FROM omdb_cache").fetchone()[0] \
+            - self.max_db_entries
+        if overflow > 0:
+            connection.execute(
+                "DELETE FROM omdb_cache WHERE key IN ("
+                " SELECT key FROM omdb_cache ORDER BY expires_at LIMIT ?)", (overflow,))
+
+    def titles(self, after=0.0):
+        """Titles of the movies OMDb found, e.g. for autocompletion.
+            Args: after (float): Only entries stored since, by their expiry time
+            Returns: List[tuple]: (title, year or None, expires_at), oldest first
+        """
+        with self._lock:
+            try:
+                rows = self._connect().execute(
+                    "SELECT payload, expires_at FROM omdb_cache"
+                    " WHERE negative = 0 AND expires_at > ? ORDER BY expires_at",
+                    (max(after, time.time()),)).fetchall()
+            except sqlite3.Error as e:
+                logging.error("Error reading OMDb cache: %s", e)
+                return []
+        titles = []
+        for payload, expires_at in rows:
+            data = json.loads(payload)
+            if data.get('Title'):
+                year = str(data.get('Year', ''))[:4]  # series have "2008–2013"
+                titles.append((data['Title'], int(year) if year.isdigit() else None,
+                               expires_at))
+        return titles
+
+    def clear(self):
+        """Remove all entries from both tiers and reset the counters."""
+        with self._lock:
+            self._memory.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+            try:
+                connection = self._connect()
+                connection.execute("DELETE FROM omdb_cache")
+                connection.commit()
+            except sqlite3.Error as e:
+                logging.error("Error clearing OMDb cache: %s", e)
+
+    def stats(self):
+        """Returns: dict: hit/miss counters and the current size of the memory tier"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
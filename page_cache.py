@@ -0,0 +1,92 @@
+"""
+HTTP caching of the collection pages for the MovieWeb application.
+Every collection has a version that each write to it bumps (see
+SQLAlchemyDataManager.get_collection_version). A page's ETag is derived from that
+version, the URL and the templates. So a client that already has the page gets a 304
+after one primary key lookup, without loading the movies or rendering anything. Pages
+rendered for other clients are kept in a small in-process LRU under the same ETag.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+import hashlib
+import os
+import threading
+
+
+def templates_digest(app):
+    """Hash of the template sources, so a deploy with changed templates gets new ETags.
+        Args: app (Flask): App whose template folder is hashed
+        Returns: str: Hex digest
+    """
+    digest = hashlib.sha1()
+    folder = os.path.join(app.root_path, app.template_folder)
+    for root, dirs, files in sorted(os.walk(folder)):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.html'):
+                digest.update(name.encode())
+                with open(os.path.join(root, name), 'rb') as template:
+                    digest.update(template.read())
+    return digest.hexdigest()
+
+
+def make_etag(salt, version, url):
+    """Strong ETag of a page.
+        Args: salt (str): templates_digest() of the app
+              version (int): Version of the collection shown on the page
+              url (str): Path and query string of the page
+        Returns: str: ETag value (without quotes)
+    """
+    return hashlib.sha1(f"{salt}|{version}|{url}".encode()).hexdigest()
+
+
+def last_modified(modified_at):
+    """Last-Modified date of a collection, HTTP dates have whole seconds."""
+    return datetime.fromtimestamp(int(modified_at), timezone.utc)
+
+
+class PageCache:
+    """Thread safe LRU of rendered pages ((body, mimetype) tuples), keyed by their ETag."""
+    def __init__(self, salt, max_entries=256):
+        """
+        Args:
+            salt (str): Part of every ETag, see templates_digest
+            max_entries (int): Pages kept in memory, 0 turns the cache off
+        """
+        self.salt = salt
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self, version, url):
+        return make_etag(self.salt, version, url)
+
+    def get(self, etag):
+        """Get a rendered page.
+            Returns: tuple: (body, mimetype) of the page or None on a cache miss
+        """
+        with self._lock:
+            page = self._pages.get(etag)
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(etag)
+            self.hits += 1
+            return page
+
+    def set(self, etag, page):
+        """Store a rendered page and evict the least recently used ones."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._pages[etag] = page
+            self._pages.move_to_end(etag)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._pages)}
@@ -0,0 +1,204 @@
+"""
+Rate limiting and admission control for the MovieWeb application.
+Routes that can cost us upstream calls (OMDb quota, DeepSeek budget) are limited per
+client IP and per user with token buckets: a bucket holds up to burst tokens, refills
+at a steady rate and every request takes one (bulk requests one per OMDb lookup). The
+buckets live in a small SQLite file next to the movie database, so all worker processes
+share them. Every take is one atomic UPSERT, a request that finds its bucket empty gets
+a 429 with Retry-After.
+On top of that an AdmissionGate caps the upstream calls in flight in this process.
+Callers beyond the cap wait in a bounded queue, when the queue is full or the wait
+times out they are shed with a 503, before a worker thread is tied up by a slow API.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+RATE = re.compile(r"^\s*(\d+)\s*/\s*(?:(\d+)\s*)?(second|minute|hour|day)s?\s*$")
+# buckets unused for this long are full again and deleted
+MAX_IDLE = 86400
+# takes between the deletes of idle buckets
+PRUNE_EVERY = 1000
+
+# one statement refills the bucket and takes the tokens if there are enough, so
+# concurrent processes never both get the last token
+TAKE = (
+    "INSERT INTO buckets (key, tokens, updated_at) VALUES (:key, :burst - :cost, :now)"
+    " ON CONFLICT (key) DO UPDATE"
+    " SET tokens = min(:burst, tokens + (:now - updated_at) * :rate) - :cost,"
+    " updated_at = :now"
+    " WHERE min(:burst, tokens + (:now - updated_at) * :rate) >= :cost"
+    " RETURNING tokens")
+
+RATE_LIMITED = REGISTRY.counter(
+    "movieweb_rate_limited_total", "Requests rejected by a rate limit", ("rule",))
+ADMISSION_REJECTED = REGISTRY.counter(
+    "movieweb_admission_rejected_total", "Upstream calls shed by the admission gate",
+    ("reason",))
+
+
+def parse_rate(value):
+    """Parse a limit like "30/minute" or "100/5 minutes".
+        Args: value (str): Requests per period, empty for no limit
+        Returns: tuple: (tokens per second, burst) or None for no limit
+        Raises: ValueError for an invalid limit
+    """
+    if not value or not value.strip():
+        return None
+    match = RATE.match(value)
+    if not match or int(match.group(1)) < 1:
+        raise ValueError(f"Invalid rate limit {value!r}, expected e.g. '30/minute'")
+    count, periods, period = match.groups()
+    seconds = int(periods or 1) * PERIODS[period]
+    return int(count) / seconds, int(count)
+
+
+class RateLimited(Exception):
+    """A request exceeded a rate limit."""
+    def __init__(self, rule, retry_after):
+        super().__init__(f"Rate limit {rule} exceeded, retry in {retry_after:.0f}s")
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """Too many upstream calls are in flight or waiting."""
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Too many upstream calls ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token buckets of named rules in a SQLite file shared by the processes."""
+    def __init__(self, db_path, rules):
+        """
+        Args:
+            db_path (str): Path of the SQLite file (created if missing), ':memory:'
+                keeps the buckets in this process
+            rules (dict): rule name -> (tokens per second, burst) or None for no limit,
+                see parse_rate
+        """
+        self.db_path = db_path
+        self.rules = rules
+        self._connection = None
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def _connect(self):
+        """Open the file lazily, so importing the app never touches the disk."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, timeout=5,
+                                               check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=OFF")  # losing a bucket is fine
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL)")
+        return self._connection
+
+    def hit(self, rule, identity, cost=1):
+        """Take tokens from the bucket of a rule and a client.
+            Args: rule (str): Name of the rule
+                  identity: Client the bucket belongs to, e.g. an IP or a user id
+                  cost (int): Tokens the request takes, at most the burst (a bucket
+                      never holds more)
+            Raises: RateLimited if the bucket doesn't have enough tokens
+        """
+        limit = self.rules.get(rule)
+        if limit is None:
+            return
+        rate, burst = limit
+        cost = min(cost, burst)
+        key = f"{rule}:{identity}"
+        now = time.time()
+        with self._lock:
+            try:
+                connection = self._connect()
+                taken = connection.execute(TAKE, {'key': key, 'rate': rate, 'burst': burst,
+                                                  'cost': cost, 'now': now}).fetchone()
+                if taken is None:
+                    tokens, updated_at = connection.execute(
+                        "SELECT tokens, updated_at FROM buckets WHERE key = ?",
+                        (key,)).fetchone()
+                self._takes += 1
+                if self._takes % PRUNE_EVERY == 0:
+                    connection.execute("DELETE FROM buckets WHERE updated_at < ?",
+                                       (now - MAX_IDLE,))
+            except sqlite3.Error as e:
+                # the limits protect the upstreams, an unreadable file must not take
+                # the app down with it
+                logging.error("Error reading the rate limits: %s", e)
+                return
+        if taken is None:
+            RATE_LIMITED.inc(rule=rule)
+            refilled = min(burst, tokens + (now - updated_at) * rate)
+            raise RateLimited(rule, max((cost - refilled) / rate, 1.0))
+
+    def reset(self):
+        """Forget all buckets, e.g. between tests."""
+        with self._lock:
+            self._connect().execute("DELETE FROM buckets")
+
+
+class AdmissionGate:
+    """Caps the upstream calls in flight in this process, with a bounded queue."""
+    def __init__(self, max_in_flight=8, max_queue=16, queue_timeout=2.0):
+        """
+        Args:
+            max_in_flight (int): Calls made at the same time, 0 for no cap
+            max_queue (int): Callers waiting for a slot, more are shed at once
+            queue_timeout (float): Seconds a caller waits before it is shed
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def admit(self):
+        """Hold a slot while the block runs.
+            Raises: Overloaded if the queue is full or no slot got free in time
+        """
+        if self.max_in_flight <= 0:
+            yield
+            return
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queue:
+                    ADMISSION_REJECTED.inc(reason="queue_full")
+                    raise Overloaded("queue full", self.queue_timeout)
+                self.queued += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.in_flight < self.max_in_flight, self.queue_timeout)
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    ADMISSION_REJECTED.inc(reason="timeout")
+                    raise Overloaded("queue timeout", self.queue_timeout)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def stats(self):
+        """Returns: dict: in_flight and queued, e.g. for /metrics"""
+        with self._condition:
+            return {'in_flight': self.in_flight, 'queued': self.queued}
@@ -0,0 +1,337 @@
+"""
+Recommendations ("movies you might like") for the MovieWeb application.
+Two catalog entries are similar if they are in the same collections: the builder
+streams all collections (grouped by user), sums the rating weighted co-occurrences
+of every pair of entries and keeps the most similar entries of every entry (cosine
+similarity, damped for entries only a few users have).
+The result is one file in a CSR layout: the sorted entry ids, the offsets of their
+neighbor lists, the neighbor positions and the scores, as native arrays. Every process
+memory maps it, so looking up the neighbors of an entry is a binary search and a
+slice, nothing is loaded or unpickled. Collections that are too large for one pass are
+built in several passes over ranges of entries, each keeping at most max_pairs
+co-occurrence sums in memory.
+The Recommender rebuilds the file in a background thread after the collections
+changed. Only one process builds it (file lock), the others reopen the new file.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+import heapq
+import logging
+import math
+import mmap
+from operator import itemgetter
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, every process builds on its own there
+    fcntl = None
+
+
+MAGIC = b"MWREC001"
+# magic, entries, neighbor slots, neighbors per entry, build time (native byte order)
+HEADER = struct.Struct("=8sQQQd")
+DEFAULT_NEIGHBORS = 50
+# larger collections only contribute their highest rated movies
+MAX_COLLECTION = 200
+# the highest rated movies of a collection that recommendations are based on
+MAX_SEEDS = 30
+# added to the norms, so a pair seen in a single collection doesn't score 1.0
+SHRINK = 2.0
+
+
+def rating_weight(rating):
+    """Weight of a movie in a collection, unrated movies count like a 5 out of 10."""
+    if rating is None:
+        return 0.6
+    return 0.2 + 0.08 * rating
+
+
+def collections(rows, max_collection=MAX_COLLECTION):
+    """Group movie rows into collections.
+        Args: rows: Iterable of (user_id, catalog_id, rating), ordered by user_id
+              max_collection (int): Movies kept of a collection, the highest rated
+        Yields: List[tuple]: (catalog_id, weight) of the movies of one user
+    """
+    current, movies = None, {}
+    for user_id, catalog_id, rating in rows:
+        if user_id != current:
+            if movies:
+                yield _highest(movies, max_collection)
+            current, movies = user_id, {}
+        movies[catalog_id] = max(rating_weight(rating), movies.get(catalog_id, 0.0))
+    if movies:
+        yield _highest(movies, max_collection)
+
+
+def _highest(movies, limit):
+    if len(movies) <= limit:
+        return list(movies.items())
+    return heapq.nlargest(limit, movies.items(), key=itemgetter(1))
+
+
+def _ranges(pair_counts, max_pairs):
+    """Split the entry positions into ranges with at most max_pairs co-occurrences."""
+    start, pairs = 0, 0
+    for position, count in enumerate(pair_counts):
+        if pairs and pairs + count > max_pairs:
+            yield start, position
+            start, pairs = position, 0
+        pairs += count
+    yield start, len(pair_counts)
+
+
+def _most_similar(row, norms, norm, limit):
+    """The limit entries of a row of co-occurrence sums with the highest cosine.
+        Returns: List[tuple]: (score, position), the most similar first
+    """
+    scores = [total / (norm * norms[b] + SHRINK) for b, total in row.items()]
+    if len(scores) > limit:
+        # a heap of plain floats finds the cut-off, tuples are only built for the winners
+        cut = heapq.nlargest(limit, scores)[-1]
+        best = [(score, b) for score, b in zip(scores, row) if score >= cut]
+    else:
+        best = list(zip(scores, row))
+    best.sort(reverse=True)
+    return best[:limit]
+
+
+def build_index(rows, path, neighbors=DEFAULT_NEIGHBORS, max_pairs=5_000_000,
+                max_collection=MAX_COLLECTION):
+    """Build the index file from all collections.
+        Args: rows (callable): Returns a new iterable of (user_id, catalog_id, rating)
+                  rows ordered by user_id, it is called once per pass
+              path (str): Index file, replaced atomically
+              neighbors (int): Most similar entries kept per entry
+              max_pairs (int): Co-occurrence sums kept in memory per pass
+              max_collection (int): Movies used of a collection, the highest rated
+        Returns: int: Number of entries in the index
+    """
+    built_at = time.time()
+    # first pass: the entries, their norms and the number of pairs they are in
+    squares, pairs = defaultdict(float), defaultdict(int)
+    for collection in collections(rows(), max_collection):
+        for catalog_id, weight in collection:
+            squares[catalog_id] += weight * weight
+            pairs[catalog_id] += len(collection) - 1
+    ids = array('q', sorted(squares))
+    position = {catalog_id: index for index, catalog_id in enumerate(ids)}
+    norms = [math.sqrt(squares[catalog_id]) for catalog_id in ids]
+    pair_counts = [pairs[catalog_id] for catalog_id in ids]
+    del squares, pairs
+
+    offsets = array('q', [0])
+    directory = os.path.dirname(os.path.abspath(path))
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with tempfile.TemporaryFile(dir=directory) as neighbor_file, \
+                tempfile.TemporaryFile(dir=directory) as score_file:
+            for start, end in _ranges(pair_counts, max_pairs):
+                sums = [{} for _ in range(start, end)]
+                if any(pair_counts[start:end]):
+                    for collection in collections(rows(), max_collection):
+                        # movies added after the first pass have no position, they
+                        # are left for the next build
+                        movies = [(position[catalog_id], weight)
+                                  for catalog_id, weight in collection
+                                  if catalog_id in position]
+                        if len(movies) < 2:
+                            continue
+                        for a, weight_a in movies:
+                            if start <= a < end:
+                                row = sums[a - start]
+                                for b, weight_b in movies:
+                                    if b != a:
+                                        row[b] = row.get(b, 0.0) + weight_a * weight_b
+                for a, row in enumerate(sums, start):
+                    best = _most_similar(row, norms, norms[a], neighbors)
+                    array('i', [b for _, b in best]).tofile(neighbor_file)
+                    array('f', [score for score, _ in best]).tofile(score_file)
+                    offsets.append(offsets[-1] + len(best))
+
+            with open(temporary, 'wb') as index_file:
+                index_file.write(HEADER.pack(MAGIC, len(ids), offsets[-1], neighbors,
+                                             built_at))
+                ids.tofile(index_file)
+                offsets.tofile(index_file)
+                for part in (neighbor_file, score_file):
+                    part.seek(0)
+                    shutil.copyfileobj(part, index_file)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return len(ids)
+
+
+class RecommendationIndex:
+    """Read-only, memory mapped index file (see build_index)."""
+    def __init__(self, path):
+        """
+        Args: path (str): Index file
+        Raises: OSError if the file can't be read, ValueError if it isn't an index
+        """
+        with open(path, 'rb') as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, slots, self.neighbors, self.built_at = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a recommendation index")
+        view = memoryview(self._map)
+        position = HEADER.size
+        parts = []
+        for item_format, length in (('q', count), ('q', count + 1), ('i', slots),
+                                    ('f', slots)):
+            size = struct.calcsize(item_format) * length
+            parts.append(view[position:position + size].cast(item_format))
+            position += size
+        self.ids, self._offsets, self._neighbors, self._scores = parts
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _position(self, catalog_id):
+        index = bisect_left(self.ids, catalog_id)
+        if index < len(self.ids) and self.ids[index] == catalog_id:
+            return index
+        return None
+
+    def _neighbor_slice(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return zip(self._neighbors[start:end].tolist(), self._scores[start:end].tolist())
+
+    def similar(self, catalog_id):
+        """Most similar entries of an entry.
+            Returns: List[tuple]: (catalog_id, score), the most similar first
+        """
+        index = self._position(catalog_id)
+        if index is None:
+            return []
+        return [(self.ids[neighbor], score) for neighbor, score in self._neighbor_slice(index)]
+
+    def recommend(self, seeds, k=10, max_seeds=MAX_SEEDS):
+        """Entries similar to a collection that aren't in it.
+            Args: seeds: Iterable of (catalog_id, rating) of the movies of the collection
+                  k (int): Number of recommendations
+                  max_seeds (int): Movies of the collection used, the highest rated
+            Returns: List[tuple]: (catalog_id, score), the best first
+        """
+        owned, weighted = set(), []
+        for catalog_id, rating in seeds:
+            index = self._position(catalog_id)
+            if index is not None and index not in owned:
+                owned.add(index)
+                weighted.append((rating_weight(rating), index))
+        scores = {}
+        get = scores.get
+        for weight, index in heapq.nlargest(max_seeds, weighted):
+            for neighbor, score in self._neighbor_slice(index):
+                scores[neighbor] = get(neighbor, 0.0) + weight * score
+        for index in owned:
+            scores.pop(index, None)
+        best = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        return [(self.ids[neighbor], score) for neighbor, score in best]
+
+
+class Recommender:
+    """Serves recommendations from the index file and rebuilds it in the background
+    once the collections changed."""
+    def __init__(self, data_manager, path, refresh_interval=600,
+                 neighbors=DEFAULT_NEIGHBORS, max_pairs=5_000_000):
+        """
+        Args:
+            data_manager: Data manager the collections are read from
+            path (str): Index file, shared by all processes of the app
+            refresh_interval (int): Seconds between checks for changed collections
+            neighbors (int): Most similar entries kept per entry
+            max_pairs (int): Co-occurrence sums kept in memory per build pass
+        """
+        self.data_manager = data_manager
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.neighbors = neighbors
+        self.max_pairs = max_pairs
+        self._index = None
+        self._file_id = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def index(self):
+        """The current index, reopened if another process replaced the file.
+            Returns: RecommendationIndex or None if there is no index yet
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        file_id = (stat.st_ino, stat.st_mtime_ns)
+        if file_id != self._file_id:
+            with self._lock:
+                if file_id != self._file_id:
+                    # readers of the old index keep their map until they are done
+                    self._index = RecommendationIndex(self.path)
+                    self._file_id = file_id
+        return self._index
+
+    def recommend(self, user_id, k=10):
+        """Recommendations for a user.
+            Returns: List[tuple]: (catalog_id, score), empty if there is no index yet
+        """
+        index = self.index()
+        if index is None:
+            return []
+        seeds = self.data_manager.iter_movies(['catalog_id', 'rating'], user_id=user_id)
+        return index.recommend(seeds, k=k)
+
+    def refresh(self, force=False):
+        """Rebuild the index if a collection changed since it was built.
+            Args: force (bool): Rebuild even if nothing changed
+            Returns: bool: True if this call rebuilt the index
+        """
+        index = self.index()
+        if not force and index is not None:
+            last_change = self.data_manager.get_last_collection_change()
+            if last_change is None or last_change < index.built_at:
+                return False
+        with open(f"{self.path}.lock", 'a') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False  # another process is building it
+            started = time.monotonic()
+            count = build_index(self._rows, self.path, neighbors=self.neighbors,
+                                max_pairs=self.max_pairs)
+        logging.info("Built the recommendation index of %d movies in %.1fs",
+                     count, time.monotonic() - started)
+        self.index()
+        return True
+
+    def _rows(self):
+        return self.data_manager.iter_movies(['user_id', 'catalog_id', 'rating'],
+                                             by_user=True)
+
+    def start(self):
+        """Start the background refresher (once per process)."""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._refresh_loop,
+                                                    name="recommendations", daemon=True)
+                    self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error("Recommendation refresh failed: %s", e)
+            finally:
+                self.data_manager.remove_session()
+            time.sleep(self.refresh_interval)
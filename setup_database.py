@@ -1,8 +1,9 @@
 """ Run this file to setup a totally new and empty database after installing the
-app or resetting all data."""
+app or resetting all data. Running it against an existing database applies all
+pending schema migrations without touching the stored data."""
 import os
 from sqlalchemy import create_engine
-from models import Base  # <- dein Base kommt aus models.py
+from migrations import current_version, upgrade
 
 # Path to database
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -10,12 +11,13 @@ DB_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DB_DIR, exist_ok=True)
 
 DB_PATH = os.path.join(DB_DIR, "movies.db")
-DB_URI = f"sqlite:///{DB_PATH}"
+DB_URI = os.getenv('DATABASE_URL', f"sqlite:///{DB_PATH}")
 
 # create an engine
 engine = create_engine(DB_URI)
 
-# create the tables
-Base.metadata.create_all(engine)
+# create the tables or migrate them to the latest schema version
+applied = upgrade(engine)
 
-print(f"SQLAlchemy-based database created at {DB_PATH}")
+print(f"SQLAlchemy-based database at {engine.url!r} is at schema version "
+      f"{current_version(engine)} (applied now: {applied or 'nothing'})")
@@ -24,7 +24,8 @@ def browser():
 def test_app():
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RATE_LIMIT_PATH': ':memory:'
     })
     yield app
 
@@ -0,0 +1,75 @@
+"""Shared helpers for the test suite."""
+
+from contextlib import contextmanager
+import shutil
+import socket
+import subprocess
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Collects the SQL statements an engine executes."""
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+
+@contextmanager
+def count_queries(engine):
+    """Count the statements executed inside the with block.
+        Args: engine: SQLAlchemy engine to watch
+        Yields: QueryCounter
+    """
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+@contextmanager
+def assert_num_queries(engine, expected):
+    """Fail if the with block executes another number of statements than expected.
+        Args: engine: SQLAlchemy engine to watch
+              expected (int): Expected number of SQL statements
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    assert counter.count == expected, (
+        f"expected {expected} queries, got {counter.count}:\n" + "\n".join(counter.statements))
+
+
+@contextmanager
+def throwaway_postgres(tmp_path):
+    """Run a temporary PostgreSQL server with initdb/pg_ctl (removed afterwards).
+        Args: tmp_path: Directory for the data files and the socket
+        Yields: str: Database URL, None if the server binaries aren't installed
+    """
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if not (initdb and pg_ctl):
+        yield None
+        return
+    data = tmp_path / "pgdata"
+    subprocess.run([initdb, "-D", str(data), "-U", "postgres", "--auth=trust"],
+                   check=True, capture_output=True)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    subprocess.run([pg_ctl, "-D", str(data), "-w", "-l", str(tmp_path / "postgres.log"),
+                    "-o", f"-p {port} -k {tmp_path} -c listen_addresses=127.0.0.1",
+                    "start"], check=True, capture_output=True)
+    try:
+        yield f"postgresql+psycopg://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", str(data), "-m", "immediate", "stop"],
+                       capture_output=True)
@@ -0,0 +1,169 @@
+import pytest
+
+from app import create_app, get_enrichment_worker
+from benchmarks.fake_servers import FakeOMDbServer
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from tests.helpers import assert_num_queries
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    yield dm
+    dm.remove_session()
+
+
+@pytest.fixture
+def app(dm, tmp_path):
+    return create_app({'DATA_MANAGER': dm, 'FUNFACT_GENERATOR': 'local',
+                       'OMDB_CACHE_PATH': str(tmp_path / 'omdb_cache.db'),
+                       'AUTOCOMPLETE_REFRESH_INTERVAL': 0, 'RATE_LIMIT_PATH': ':memory:'})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user_id(dm):
+    user_id = dm.add_user("test_user")
+    dm.add_movie(title="Inception", year=2010, plot="A thief ...", user_id=user_id)
+    dm.add_movie(title="Alien", year=1979, user_id=user_id)
+    return user_id
+
+
+def test_users_and_movies(client, user_id):
+    response = client.get("/api/v1/users")
+    assert response.mimetype == "application/json"
+    assert response.json['users'] == [{'id': user_id, 'username': "test_user"}]
+
+    movies = client.get(f"/api/v1/users/{user_id}/movies?sort=-year").json['movies']
+    assert [movie['title'] for movie in movies] == ["Inception", "Alien"]
+    assert 'plot' not in movies[0]
+    assert movies[0]['enrichment'] is None
+
+
+def test_fields_select_what_is_loaded(client, user_id):
+    response = client.get(f"/api/v1/users/{user_id}/movies?fields=title,plot")
+    assert response.json['movies'][1] == {'title': "Inception", 'plot': "A thief ..."}
+
+    response = client.get(f"/api/v1/users/{user_id}/movies?fields=title,password")
+    assert response.status_code == 400
+    assert "password" in response.json['message']
+
+
+def test_reads_are_cached(client, dm, user_id):
+    first = client.get(f"/api/v1/users/{user_id}/movies")
+    with assert_num_queries(dm.engine, 1):  # only the version lookup
+        response = client.get(f"/api/v1/users/{user_id}/movies",
+                              headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+    with assert_num_queries(dm.engine, 1):
+        response = client.get(f"/api/v1/users/{user_id}/movies")
+    assert response.data == first.data
+    assert response.mimetype == "application/json"
+
+    movie_id = dm.add_movie(title="Heat", user_id=user_id)
+    assert client.get(f"/api/v1/movies/{movie_id}").json['title'] == "Heat"
+    response = client.get("/api/v1/movies/999")
+    assert response.status_code == 404
+    assert response.json['error'] == "Not Found"
+
+
+def test_search(client, user_id):
+    response = client.get("/api/v1/search?q=ali&fields=id,title")
+    assert [movie['title'] for movie in response.json['movies']] == ["Alien"]
+
+
+def test_bulk_create(client, dm, user_id):
+    response = client.post(f"/api/v1/users/{user_id}/movies", json=[
+        {'title': "Heat", 'year': 1995, 'director': "Michael Mann", 'rating': 8.3,
+         'plot': "...", 'writer': "Michael Mann", 'actors': "Al Pacino",
+         'genre': "Crime", 'runtime': "170 min"},
+        {'title': "inception"},
+        {'title': "HEAT"},
+        {'year': 2001},
+        "Alien",
+    ])
+    assert response.status_code == 201
+    assert [movie['title'] for movie in response.json['created']] == ["Heat"]
+    assert response.json['duplicates'] == ["HEAT", "inception"]
+    assert [error['index'] for error in response.json['errors']] == [3, 4]
+    assert dm.movie_exists(user_id, "heat")
+
+    assert client.post("/api/v1/users/999/movies", json=[]).status_code == 404
+    assert client.post(f"/api/v1/users/{user_id}/movies", json={}).status_code == 400
+
+
+def test_bulk_create_enriches_in_the_background(app, client, dm, user_id):
+    with FakeOMDbServer(latency=0) as omdb:
+        app.config['OMDB_API_URL'] = omdb.url
+        response = client.post(f"/api/v1/users/{user_id}/movies",
+                               json={'movies': [{'title': "Heat"}], 'enrich': True})
+        assert response.status_code == 202
+        created = response.json['created'][0]
+        assert created['enrichment'] == "pending"
+        with app.app_context():
+            get_enrichment_worker().shutdown()
+    dm.remove_session()
+    assert dm.get_movie_by_id(created['id']).director.startswith("Director ")
+
+
+def test_stats(client, dm, user_id):
+    dm.add_movie(title="Heat", year=1995, genre="Crime, Drama", rating=8.0,
+                 runtime="170 min", user_id=user_id)
+    stats = client.get(f"/api/v1/users/{user_id}/stats").json
+    assert stats['movie_count'] == 3
+    assert stats['genres'][0] == {'name': "Crime", 'movie_count': 1}
+    assert [d['name'] for d in stats['decades']] == ["1970s", "1990s", "2010s"]
+    assert client.get("/api/v1/users/999/stats").status_code == 404
+
+    page = client.get(f"/user/{user_id}/stats")
+    assert b"2 h 50 min" in page.data
+
+
+def test_similar_titles(client, dm, user_id):
+    dm.add_movie(title="Interstellar", year=2014)
+    titles = client.get(f"/api/v1/titles/similar?q=the+incepton&user_id={user_id}").json['titles']
+    assert titles[0]['title'] == "Inception"
+    assert titles[0]['in_collection']
+    assert client.get("/api/v1/titles/similar?q=interstel").json['titles'][0] == {
+        'title': "Interstellar", 'year': 2014, 'imdb_id': None, 'score': 0.643,
+        'in_collection': False}
+    assert client.get("/api/v1/titles/similar?q=").json['titles'] == []
+
+
+def test_autocomplete(app, client, dm, user_id):
+    dm.add_movie(title="Alien", year=1979, user_id=dm.add_user("another_user"))
+    response = client.get("/api/v1/autocomplete?q=al&limit=1")
+    assert response.json['titles'] == [{'title': "Alien", 'year': 1979, 'popularity': 2}]
+    assert response.cache_control.max_age == 60
+    assert client.get("/api/v1/autocomplete?q=").json['titles'] == []
+
+
+def test_batch_changes(client, dm, user_id):
+    alien, inception = [movie.id for movie in dm.get_user_movies(user_id)]
+    other = dm.add_movie(title="Heat", user_id=dm.add_user("another_user"))
+    response = client.post(f"/api/v1/users/{user_id}/movies/batch", json={
+        'update': [{'id': inception, 'rating': 9, 'comment': "again"},
+                   {'id': other, 'rating': 1}, {'id': alien, 'rating': 12}, {'rating': 5}],
+        'delete': [alien, "Heat"],
+    })
+    assert response.status_code == 200
+    assert response.json == {
+        'updated': [{'id': inception, 'result': "updated"},
+                    {'id': other, 'result': "not found"},
+                    {'id': alien, 'result': "rating 12.0 is not between 0 and 10"}],
+        'deleted': [{'id': alien, 'result': "deleted"}],
+        'errors': [{'update': 3, 'error': "expected an object with an id"},
+                   {'delete': 1, 'error': "expected a movie id"}],
+    }
+    dm.remove_session()
+    assert [(movie.title, movie.rating) for movie in dm.get_user_movies(user_id)] == [
+        ("Inception", 9.0)]
+    assert dm.get_movie_by_id(other).rating is None
+
+    assert client.post(f"/api/v1/users/{user_id}/movies/batch", json=[]).status_code == 400
+    assert client.post(f"/api/v1/users/{user_id}/movies/batch",
+                       json={'delete': list(range(1001))}).status_code == 413
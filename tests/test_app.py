@@ -0,0 +1,58 @@
+from app import create_app, get_data_manager
+
+
+def test_create_app_connects_lazily(tmp_path):
+    db_path = tmp_path / "movies.db"
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{db_path}",
+                      'FUNFACT_GENERATOR': 'local'})
+    assert not db_path.exists()
+
+    assert app.test_client().get("/metrics").status_code == 200
+    assert not db_path.exists()  # no database work needed for this route
+
+    assert app.test_client().get("/users").status_code == 200
+    assert db_path.exists()
+
+
+def test_config_data_manager_is_used(test_client, init_db):
+    response = test_client.get("/user/1")
+    assert response.status_code == 200
+    assert b"test_user" in response.data
+
+
+def test_services_are_rebuilt_after_fork(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}"})
+    with app.app_context():
+        first = get_data_manager()
+        assert get_data_manager() is first
+
+        app.extensions['movieweb']._pid = -1  # as if this were a forked child
+        second = get_data_manager()
+        assert second is not first
+        assert get_data_manager() is second
+
+
+def test_batch_edit_movies(test_client, init_db, test_app):
+    dm = test_app.config['DATA_MANAGER']
+    ids = [dm.add_movie(title=title, user_id=1) for title in ("Heat", "Alien", "Dune")]
+    response = test_client.post("/user/1/movies/batch",
+                                data={'movie_id': ids[:2], 'action': "rate", 'rating': "8"})
+    assert response.status_code == 302
+    response = test_client.post("/user/1/movies/batch",
+                                data={'movie_id': ids[1:], 'action': "delete"})
+    assert response.status_code == 302
+    dm.remove_session()
+    assert [(movie.title, movie.rating) for movie in dm.get_user_movies(1)] == [("Heat", 8.0)]
+    assert b'name="movie_id"' in test_client.get("/user/1").data
+
+
+def test_page_links_keep_the_page_size(test_client, init_db, test_app):
+    dm = test_app.config['DATA_MANAGER']
+    for title in ("Alien", "Dune", "Heat"):
+        dm.add_movie(title=title, user_id=1)
+    page = test_client.get("/user/1?per_page=2").get_data(as_text=True)
+    next_link = next(link.split('"', 1)[0] for link in page.split('href="/user/1?')
+                     if "cursor=" in link.split('"', 1)[0])
+    assert "per_page=2" in next_link
+    second = test_client.get("/user/1?" + next_link.replace("&amp;", "&"))
+    assert b"Heat" in second.data and b"Alien" not in second.data
@@ -0,0 +1,70 @@
+import pytest
+
+from autocomplete import Autocomplete, MAX_SUGGESTIONS, TitleIndex
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from omdb_cache import OMDbCache
+from tests.helpers import assert_num_queries
+
+
+# (title, year, popularity, canonical)
+TITLES = [("The Matrix", 1999, 5, True), ("Matrix Reloaded", 2003, 2, True),
+          ("the matrix", 1999, 3, False), ("Mad Max", 1979, 1, True),
+          ("Memento", 2000, 4, True), ("M", 1931, 0, True)]
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    yield dm
+    dm.remove_session()
+
+
+def titles(suggestions):
+    return [suggestion['title'] for suggestion in suggestions]
+
+
+def test_prefixes_rank_by_popularity():
+    index = TitleIndex(TITLES)
+    assert index.suggest("the matr") == [
+        {'title': "The Matrix", 'year': 1999, 'popularity': 8},
+        {'title': "Matrix Reloaded", 'year': 2003, 'popularity': 2}]
+    assert titles(index.suggest("m")) == ["The Matrix", "Memento", "Matrix Reloaded",
+                                          "Mad Max", "M"]
+    assert titles(index.suggest("ma", limit=2)) == ["The Matrix", "Matrix Reloaded"]
+    assert index.suggest("x") == [] and index.suggest("") == []
+
+
+def test_added_titles_update_the_known_prefixes():
+    index = TitleIndex(TITLES)
+    index.suggest("mem")  # computed and kept
+    index.add("Memento", 2000, popularity=5)
+    index.add("Melancholia", 2011, popularity=2)
+    assert titles(index.suggest("m"))[:2] == ["Memento", "The Matrix"]
+    assert titles(index.suggest("me")) == ["Memento", "Melancholia"]
+    assert titles(index.suggest("mem")) == ["Memento"]
+
+    for number in range(MAX_SUGGESTIONS + 5):
+        index.add(f"Mad Movie {number}", popularity=0)
+    assert len(index.suggest("ma")) == MAX_SUGGESTIONS
+
+
+def test_autocomplete_follows_the_catalog_and_the_omdb_cache(dm, tmp_path):
+    omdb_cache = OMDbCache(str(tmp_path / "omdb_cache.db"))
+    omdb_cache.set("inception", {'Response': 'True', 'Title': "Inception", 'Year': "2010"})
+    first, second = dm.add_user("first"), dm.add_user("second")
+    dm.add_movie(title="Heat", year=1995, user_id=first, imdb_id="tt0113277")
+    autocomplete = Autocomplete(dm, omdb_cache)
+    assert titles(autocomplete.suggest("he")) == ["Heat"]
+    assert autocomplete.suggest("inc")[0] == {'title': "Inception", 'year': 2010,
+                                              'popularity': 0}
+
+    dm.add_movie(title="heat", year=1995, user_id=second, imdb_id="tt0113277")
+    dm.add_movie(title="Hereditary", user_id=second)
+    omdb_cache.set("ronin", {'Response': 'True', 'Title': "Ronin", 'Year': "1998"})
+    autocomplete.refresh()
+    assert autocomplete.suggest("he") == [
+        {'title': "Heat", 'year': 1995, 'popularity': 2},
+        {'title': "Hereditary", 'year': None, 'popularity': 1}]
+    assert titles(autocomplete.suggest("ron")) == ["Ronin"]
+    with assert_num_queries(dm.engine, 0):
+        autocomplete.suggest("her")
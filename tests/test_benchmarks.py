@@ -0,0 +1,72 @@
+import random
+
+import requests
+
+from benchmarks.compare import compare
+from benchmarks.concurrency import run_profile
+from benchmarks.fake_servers import FakeDeepSeekServer, FakeOMDbServer
+from benchmarks.run import data_manager_scenarios, measure, percentile, public_methods
+from benchmarks.seed import seed_database
+
+
+def test_seed_is_reproducible(tmp_path):
+    first = seed_database(f"sqlite:///{tmp_path / 'a.db'}", users=3, movies=30, seed=1)
+    second = seed_database(f"sqlite:///{tmp_path / 'b.db'}", users=3, movies=30, seed=1)
+
+    titles = [m.title for m in first.get_user_movies(2)]
+    assert len(titles) == 10
+    assert titles == [m.title for m in second.get_user_movies(2)]
+
+
+def test_every_data_manager_method_has_a_scenario(tmp_path):
+    dm = seed_database(f"sqlite:///{tmp_path / 'movies.db'}", users=2, movies=20)
+    scenarios = data_manager_scenarios(dm, 2, 20, random.Random(0))
+    assert public_methods(dm) <= set(scenarios)
+
+
+def test_fake_servers_answer_like_the_apis():
+    with FakeOMDbServer(latency=0, not_found_ratio=0) as omdb, \
+            FakeDeepSeekServer(latency=0) as deepseek:
+        movie = requests.get(omdb.url, params={'t': 'Inception'}, timeout=5).json()
+        again = requests.get(omdb.url, params={'t': 'Inception'}, timeout=5).json()
+        other = requests.get(omdb.url, params={'t': 'Heat'}, timeout=5).json()
+        fact = requests.post(deepseek.url, json={'messages': []}, timeout=5).json()
+    assert movie['Title'] == 'Inception' and movie['Response'] == 'True'
+    assert movie == again  # every title is its own movie, always the same one
+    assert other['imdbID'] != movie['imdbID']
+    assert fact['choices'][0]['message']['content'].startswith('Synthetic fun fact')
+    assert omdb.requests == 3 and deepseek.requests == 1
+
+
+def test_measure_counts_calls_and_errors():
+    def operation(number):
+        if number % 5 == 0:
+            raise RuntimeError("boom")
+        return "ok"
+
+    result = measure(operation, iterations=20, concurrency=4, warmup=0)
+    assert result['count'] == 20
+    assert result['errors'] == 4
+    assert result['p50'] <= result['p95'] <= result['p99'] <= result['max']
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) is None
+
+
+def test_compare_flags_only_real_slowdowns():
+    baseline = {'routes': {'home': {'p95': 0.010}, 'search': {'p95': 0.0001}}}
+    current = {'routes': {'home': {'p95': 0.020}, 'search': {'p95': 0.0003}}}
+    rows = {row['name']: row for row in compare(baseline, current, threshold=0.2)}
+    assert rows['home']['regression']
+    assert not rows['search']['regression']  # 3x, but below min_delta
+
+
+def test_concurrency_benchmark_reads_while_writing(tmp_path):
+    results = run_profile('tuned', readers=1, writers=1, users=2, movies=50,
+                          duration=0.3, workdir=str(tmp_path))
+    assert results['reads']['count'] > 0 and results['writes']['count'] > 0
+    assert results['reads']['errors'] == 0 and results['writes']['errors'] == 0
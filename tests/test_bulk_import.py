@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+
+from bulk_import import import_movies
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from tests.helpers import count_queries
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    yield dm
+    dm.remove_session()
+
+
+def test_csv_import_dedupes_and_validates(dm):
+    user_id = dm.add_user("importer")
+    dm.add_movie(title="Heat", user_id=user_id)
+    csv_file = io.BytesIO(
+        "title,year,rating\n"
+        "Inception,2010,8.8\n"
+        "heat,1995,\n"
+        "INCEPTION,,\n"
+        ",2000,\n"
+        "Alien,nineteen,\n"
+        "Brazil,1985,11\n"
+        "Amélie,2001,8.3\n".encode("utf-8"))
+
+    report = import_movies(dm, user_id, csv_file, "csv", batch_size=3)
+
+    assert (report.rows, report.inserted, report.duplicates, report.failed) == (7, 2, 2, 3)
+    assert report.errors == ["row 5: title is missing", "row 6: invalid year 'nineteen'",
+                             "row 7: rating 11.0 is not between 0 and 10"]
+    assert sorted(m.title for m in dm.get_user_movies(user_id)) == \
+        ["Amélie", "Heat", "Inception"]
+
+
+def test_jsonl_import_is_batched_and_enriched(dm):
+    user_id = dm.add_user("importer")
+    lines = [json.dumps({"title": f"Movie {i}", "comment": "from backup"}) for i in range(10)]
+    jsonl = io.StringIO("\n".join(lines + ["not json"]) + "\n")
+    looked_up = []
+
+    def fetch(title):
+        looked_up.append(title)
+        return {"director": "Someone", "year": 1999}
+
+    with count_queries(dm.engine) as counter:
+        report = import_movies(dm, user_id, jsonl, "jsonl", fetch=fetch, batch_size=5)
+
+    assert (report.inserted, report.failed) == (10, 1)
+    assert len(looked_up) == 10
+    # per batch: one duplicate check, one multi-row insert of the catalog entries and
+    # the movies each and one update of the collection statistics, independent of its size
+    inserts = [s for s in counter.statements if s.startswith("INSERT INTO user_movies")]
+    assert len(inserts) == 2 and len(counter.statements) < 18
+    movie = dm.get_user_movies_page(user_id, sort="title").items[0]
+    assert (movie.title, movie.director, movie.year, movie.comment) == \
+        ("Movie 0", "Someone", 1999, "from backup")
@@ -0,0 +1,32 @@
+from collection_stats import decade, parse_runtime, split_names, StatsDelta
+
+
+def test_parse_runtime():
+    assert parse_runtime("148 min") == 148
+    assert parse_runtime("2h 28min") == 148
+    assert parse_runtime("1 hour 30 minutes") == 90
+    assert parse_runtime("90") == 90
+    assert parse_runtime("N/A") is None
+    assert parse_runtime(None) is None
+
+
+def test_split_names_and_decade():
+    assert split_names("Action, Sci-Fi,  Action,") == ["Action", "Sci-Fi"]
+    assert split_names("N/A") == []
+    assert split_names(None) == []
+    assert decade(1999) == "1990s"
+    assert decade(None) is None
+
+
+def test_removing_a_movie_cancels_adding_it():
+    movie = {'rating': 7.5, 'year': 2010, 'genre': "Drama", 'director': "Nolan",
+             'runtime': "148 min"}
+    delta = StatsDelta()
+    delta.add(1, movie)
+    assert delta.totals[1]['runtime_sum'] == 148
+    assert delta.counts[(1, 'decade', "2010s")] == 1
+    delta.remove(1, movie)
+    assert not any(delta.totals[1].values())
+    assert not any(delta.counts.values())
+    delta.add(None, movie)  # not in a collection
+    assert None not in delta.totals
@@ -0,0 +1,343 @@
+"""
+The same behaviour is expected from every DataManagerInterface backend.
+PostgreSQL runs against TEST_POSTGRES_URL or a throwaway server started with initdb and
+pg_ctl, and is skipped if neither (or no driver) is available.
+"""
+
+import io
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from bulk_import import import_movies
+from data_manager.data_manager_interface import DataManagerInterface
+from data_manager.postgres_data_manager import PostgresDataManager
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from tests.helpers import throwaway_postgres
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    with throwaway_postgres(tmp_path_factory.mktemp("postgres")) as url:
+        yield url
+
+
+def reset_postgres(url):
+    engine = create_engine(url)
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("DROP SCHEMA public CASCADE"))
+            connection.execute(text("CREATE SCHEMA public"))
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def dm(request, tmp_path):
+    if request.param == "sqlite":
+        dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    else:
+        url = request.getfixturevalue("postgres_url")
+        if url is None:
+            pytest.skip("set TEST_POSTGRES_URL or install PostgreSQL (initdb, pg_ctl)")
+        try:
+            reset_postgres(url)
+        except ImportError as e:
+            pytest.skip(f"no PostgreSQL driver: {e}")
+        dm = PostgresDataManager(url, pool_size=2)
+    yield dm
+    dm.remove_session()
+    dm.engine.dispose()
+
+
+@pytest.fixture
+def user_id(dm):
+    return dm.add_user("test_user")
+
+
+def test_implements_the_interface(dm):
+    assert isinstance(dm, DataManagerInterface)
+
+
+def test_users(dm, user_id):
+    assert user_id is not None
+    assert dm.add_user("test_user") is None  # usernames are unique
+    other_id = dm.add_user("another_user")
+
+    assert dm.get_user_by_username("test_user").id == user_id
+    assert dm.get_user_by_id(other_id).username == "another_user"
+    assert dm.get_user_by_id(-1) is None
+    page = dm.get_users_page(page_size=1)
+    assert [user.username for user in page.items] == ["another_user"]
+    assert [user.username for user in dm.get_users_page(page.next_cursor).items] == \
+        ["test_user"]
+
+
+def test_duplicate_titles_are_rejected(dm, user_id):
+    assert dm.add_movie(title="Inception", user_id=user_id) is not None
+    assert dm.add_movie(title="INCEPTION", user_id=user_id) is None
+    assert dm.movie_exists(user_id, "inception")
+    assert not dm.movie_exists(user_id, "Alien")
+    assert dm.get_existing_titles(user_id, ["Inception", "Alien"]) == {"inception"}
+
+    other_id = dm.add_user("another_user")
+    assert dm.add_movie(title="Inception", user_id=other_id) is not None
+
+
+def test_duplicates_are_found_by_the_normalized_title(dm, user_id):
+    movie_id = dm.add_movie(title="The Matrix", year=1999, user_id=user_id, imdb_id="tt0133093")
+    for title in ("the matrix ", "Matrix, The", "The Matrix (1999)", "THE MATRIX"):
+        assert dm.movie_exists(user_id, title)
+    assert not dm.movie_exists(user_id, "The Matrix (2030)")  # another release
+    assert not dm.movie_exists(user_id, "Matrix", year=2030)
+    assert dm.get_existing_titles(user_id, ["Matrix (1999)", "Matrix Reloaded"]) == \
+        {"matrix (1999)"}
+    # the OMDb entry is found however the title is typed
+    assert dm.find_catalog_entry("matrix (1999)").imdb_id == "tt0133093"
+    assert dm.find_catalog_entry("The Matrix (2030)") is None
+
+    assert dm.update_user_movie(movie_id, {'title': "Matrix Revolutions"})
+    assert dm.movie_exists(user_id, "matrix revolutions")
+    assert not dm.movie_exists(user_id, "The Matrix")
+
+
+def test_similar_titles(dm, user_id):
+    dm.add_movies_bulk([{'title': title, 'user_id': user_id}
+                        for title in ("Inception", "Interstellar", "Alien")])
+    dm.add_movie(title="Inception", user_id=dm.add_user("another_user"), imdb_id="tt1375666")
+
+    hints = dm.find_similar_titles("incepton", user_id=user_id)
+    assert [hint['title'] for hint in hints] == ["Inception"]  # once, the OMDb entry
+    assert hints[0]['imdb_id'] == "tt1375666"
+    assert hints[0]['in_collection']
+    assert [hint['title'] for hint in dm.find_similar_titles("inter")] == ["Interstellar"]
+    assert dm.find_similar_titles("zzz") == []
+
+
+def test_title_counts(dm, user_id):
+    first = dm.add_movie(title="Heat", user_id=user_id, imdb_id="tt0113277")
+    dm.add_movie(title="Heat", user_id=dm.add_user("another_user"), imdb_id="tt0113277")
+    dm.add_movie(title="Alien", user_id=user_id)
+    counts = {row.title: (row.movie_count, row.imdb_id) for row in dm.get_title_counts()}
+    assert counts == {"Heat": (2, "tt0113277"), "Alien": (1, None)}
+    assert {row.title: row.movie_count for row in dm.get_title_counts(first)} == \
+        {"Heat": 1, "Alien": 1}
+
+
+def test_bulk_insert_and_import(dm, user_id):
+    assert dm.add_movies_bulk([]) == 0
+    assert dm.add_movies_bulk([{'title': f"Movie {number}", 'user_id': user_id}
+                               for number in range(3)]) == 3
+
+    source = io.StringIO("title,year\nMovie 1,2001\nNew Movie,2002\nnew movie,2003\n")
+    report = import_movies(dm, user_id, source, 'csv')
+    assert (report.inserted, report.duplicates, report.failed) == (1, 2, 0)
+    assert len(dm.get_user_movies(user_id)) == 4
+
+
+def test_movie_pages_are_sorted(dm, user_id):
+    for title, rating in (("Heat", 7.5), ("Alien", None), ("Inception", 8.8)):
+        dm.add_movie(title=title, rating=rating, user_id=user_id)
+    page = dm.get_user_movies_page(user_id, sort='-rating', page_size=2)
+    assert [movie.title for movie in page.items] == ["Inception", "Heat"]
+    page = dm.get_user_movies_page(user_id, sort='-rating', cursor=page.next_cursor)
+    assert [movie.title for movie in page.items] == ["Alien"]
+
+
+def test_update_and_delete(dm, user_id):
+    movie_id = dm.add_movie(title="Inception", user_id=user_id)
+    assert dm.update_user_movie(movie_id, {'rating': 9.0, 'comment': "again"})
+    assert not dm.update_user_movie(-1, {'rating': 9.0})
+    dm.remove_session()
+
+    movie = dm.get_movie_with_user(movie_id)
+    assert (movie.rating, movie.comment, movie.user.username) == (9.0, "again", "test_user")
+    assert dm.get_movie_by_id(movie_id).title == "Inception"
+    assert dm.delete_movie(movie_id)
+    assert not dm.delete_movie(movie_id)
+    assert dm.get_movie_by_id(movie_id) is None
+
+
+def test_bulk_update_and_delete(dm, user_id):
+    other_id = dm.add_user("another_user")
+    heat = dm.add_movie(title="Heat", year=1995, rating=8.0, runtime="170 min",
+                        user_id=user_id)
+    alien = dm.add_movie(title="Alien", year=1979, user_id=user_id)
+    dune = dm.add_movie(title="Dune", user_id=user_id)
+    foreign = dm.add_movie(title="Heat", user_id=other_id)
+    dm.create_enrichment_job(dune)
+
+    results = dm.bulk_update_movies({heat: {'rating': 6}, alien: {'rating': "7.5"},
+                                     dune: {'rating': 11}, foreign: {'rating': 5},
+                                     -1: {'comment': "lost"}}, user_id=user_id)
+    assert results == {heat: "updated", alien: "updated",
+                       dune: "rating 11.0 is not between 0 and 10",
+                       foreign: "not found", -1: "not found"}
+    assert dm.bulk_update_movies({heat: {'title': "Heat 2"}})[heat].startswith("can't change")
+    assert dm.bulk_update_movies({heat: {'comment': "again"}, foreign: {'rating': None}}) == {
+        heat: "updated", foreign: "updated"}
+    dm.remove_session()
+    assert [(m.rating, m.comment) for m in (dm.get_movie_by_id(heat), dm.get_movie_by_id(alien))
+            ] == [(6.0, "again"), (7.5, None)]
+    assert dm.get_collection_stats(user_id)['average_rating'] == 6.75
+
+    assert dm.bulk_delete_movies([dune, foreign, alien, dune], user_id=user_id) == {
+        dune: "deleted", foreign: "not found", alien: "deleted"}
+    dm.remove_session()
+    assert [movie.id for movie in dm.get_user_movies(user_id)] == [heat]
+    with dm.engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM enrichment_jobs")).scalar() == 0
+    assert catalog_size(dm) == 2  # the entries no movie uses anymore are pruned
+    stats = dm.get_collection_stats(user_id)
+    assert dm.rebuild_collection_stats(user_id) == 1
+    dm.remove_session()
+    assert dm.get_collection_stats(user_id) == stats
+
+
+def test_iter_movies_streams_rows(dm, user_id):
+    ids = [dm.add_movie(title=f"Movie {number}", year=2000 + number, user_id=user_id)
+           for number in range(5)]
+    rows = list(dm.iter_movies(['id', 'year'], user_id=user_id, batch_size=2))
+    assert [tuple(row) for row in rows] == [(id, 2000 + n) for n, id in enumerate(ids)]
+
+
+def test_search_ranks_title_matches_first(dm, user_id):
+    dm.add_movie(title="Moon", plot="An alien visits the moon base", user_id=user_id)
+    dm.add_movie(title="Alien", director="Ridley Scott", user_id=user_id)
+    other_id = dm.add_user("another_user")
+    dm.add_movie(title="Aliens", user_id=other_id)
+
+    page = dm.search_movies("ali", user_id=user_id)
+    assert [movie.title for movie in page.items] == ["Alien", "Moon"]
+    assert [movie.title for movie in dm.search_movies("ridley sc").items] == ["Alien"]
+    assert dm.search_movies("  ").items == []
+
+
+def test_enrichment_jobs(dm, user_id):
+    movie_id = dm.add_movie(title="Inception", user_id=user_id)
+    assert dm.create_enrichment_job(movie_id)
+    assert [tuple(job) for job in dm.get_unfinished_enrichment_jobs()] == \
+        [(movie_id, "Inception")]
+    assert dm.claim_enrichment_job(movie_id, lease=60)
+    assert not dm.claim_enrichment_job(movie_id, lease=60)  # another process has it
+    time.sleep(0.01)
+    assert dm.claim_enrichment_job(movie_id, lease=0)  # the claim ran out
+    assert dm.update_enrichment_job(movie_id, "done", attempts=1)
+    assert dm.get_unfinished_enrichment_jobs() == []
+    assert not dm.claim_enrichment_job(movie_id, lease=0)
+    assert dm.delete_movie(movie_id)
+
+
+def test_funfacts(dm):
+    ids = dm.add_funfacts("oscars", ["one", "two", "three"])
+    assert len(ids) == 3
+    dm.mark_funfacts_served(ids[:2], keep_per_theme=1)
+    assert [fact for _, _, fact in dm.get_funfacts()] == ["three"]
+    assert [fact for _, _, fact in dm.get_funfacts(served=True)] == ["two"]
+
+    dm.add_funfacts("oscars", ["four"])
+    dm.add_funfacts("oscars", ["streamed"], served=True)
+    assert dm.count_funfacts() == {"oscars": 2}
+    assert dm.take_funfact("oscars")[1:] == ("three", 1)
+    assert dm.take_funfact("oscars")[1:] == ("four", 0)
+    assert dm.take_funfact("oscars") is None
+    assert dm.take_funfact("props") is None
+
+
+def test_writes_bump_the_collection_version(dm, user_id):
+    version = dm.get_collection_version(user_id)[0]
+    movie_id = dm.add_movie(title="Inception", user_id=user_id)
+    assert dm.add_movie(title="inception", user_id=user_id) is None
+    assert dm.get_collection_version(user_id)[0] == version + 1
+    assert dm.get_movie_collection_version(movie_id)[0] == version + 1
+
+    dm.update_user_movie(movie_id, {'rating': 9.0})
+    dm.add_movies_bulk([{'title': "Alien", 'user_id': user_id}])
+    dm.delete_movie(movie_id)
+    assert dm.get_collection_version(user_id)[0] == version + 4
+    assert dm.get_collection_version(-1) is None
+    assert dm.get_movie_collection_version(movie_id) is None
+
+
+def catalog_size(dm):
+    with dm.engine.connect() as connection:
+        return connection.execute(text("SELECT COUNT(*) FROM catalog")).scalar()
+
+
+def test_movies_share_the_catalog_entry_of_an_imdb_id(dm, user_id):
+    other_id = dm.add_user("another_user")
+    first = dm.add_movie(title="Inception", director="Christopher Nolan", rating=9.0,
+                         user_id=user_id, imdb_id="tt1375666", imdb_rating=8.8)
+    second = dm.add_movie(title="inception", user_id=other_id, imdb_id="tt1375666")
+    assert dm.add_movies_bulk([{'title': "Inception", 'user_id': dm.add_user("third"),
+                                'imdb_id': "tt1375666"}]) == 1
+    assert catalog_size(dm) == 1
+    assert dm.get_movie_by_id(second).director == "Christopher Nolan"
+    assert dm.get_movie_by_id(second).rating is None  # ratings stay per user
+    assert dm.find_catalog_entry("INCEPTION").imdb_rating == 8.8
+    assert dm.find_catalog_entry("Alien") is None
+
+    # changing a shared entry copies it, the other collections keep theirs
+    assert dm.update_user_movie(first, {'director': "Nolan", 'comment': "again"})
+    dm.remove_session()
+    assert dm.get_movie_by_id(first).director == "Nolan"
+    assert dm.get_movie_by_id(second).director == "Christopher Nolan"
+    assert catalog_size(dm) == 2
+    dm.delete_movie(first)
+    dm.delete_movie(second)
+    assert catalog_size(dm) == 1  # the OMDb entry is kept for the next user
+
+
+def test_enrichment_links_empty_movies_to_the_catalog(dm, user_id):
+    omdb_data = {'title': "Inception", 'director': "Christopher Nolan", 'year': 2010,
+                 'rating': 8.8, 'imdb_id': "tt1375666"}
+    empty = dm.add_movie(title="Inception", user_id=user_id)
+    own = dm.add_movie(title="Inception", plot="My own summary",
+                       user_id=dm.add_user("another_user"))
+    assert dm.enrich_movie(empty, omdb_data)
+    assert dm.enrich_movie(own, omdb_data)
+    assert not dm.enrich_movie(-1, omdb_data)
+    dm.remove_session()
+
+    movie = dm.get_movie_by_id(empty)
+    assert (movie.director, movie.year, movie.rating) == ("Christopher Nolan", 2010, 8.8)
+    movie = dm.get_movie_by_id(own)
+    assert (movie.director, movie.plot) == ("Christopher Nolan", "My own summary")
+    assert catalog_size(dm) == 2  # the empty entry was replaced by the shared one
+
+
+def test_writes_keep_the_collection_stats_up_to_date(dm, user_id):
+    assert dm.get_collection_stats(user_id)['movie_count'] == 0
+    assert dm.get_collection_stats(-1) is None
+
+    heat = dm.add_movie(title="Heat", director="Michael Mann", year=1995, rating=8.0,
+                        genre="Crime, Drama", runtime="170 min", user_id=user_id)
+    dm.add_movies_bulk([
+        {'title': "Collateral", 'director': "Michael Mann", 'year': 2004, 'rating': 7.0,
+         'genre': "Crime", 'runtime': "2h", 'user_id': user_id},
+        {'title': "Alien", 'year': 1979, 'user_id': user_id},
+    ])
+    alien = next(iter(dm.get_user_movies_page(user_id, sort='year'))).id
+    dm.update_user_movie(alien, {'genre': "Horror, Sci-Fi", 'rating': 9.0})
+    dm.enrich_movie(alien, {'director': "Ridley Scott", 'runtime': "117 min"})
+    dm.delete_movie(heat)
+    dm.remove_session()
+
+    stats = dm.get_collection_stats(user_id)
+    assert stats == {
+        'movie_count': 2, 'average_rating': 8.0, 'total_runtime': 237,
+        'average_runtime': 118,
+        'genres': [("Crime", 1), ("Horror", 1), ("Sci-Fi", 1)],
+        'decades': [("1970s", 1), ("2000s", 1)],
+        'directors': [("Michael Mann", 1), ("Ridley Scott", 1)],
+    }
+    # a rebuild from the movies comes to the same result
+    assert dm.rebuild_collection_stats() == 1
+    dm.remove_session()
+    assert dm.get_collection_stats(user_id) == stats
@@ -0,0 +1,100 @@
+import requests
+
+from app import create_app, get_enrichment_worker
+from benchmarks.fake_servers import FakeOMDbServer
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from enrichment import EnrichmentWorker
+
+
+OMDB_INCEPTION = {'director': 'Christopher Nolan', 'year': 2010, 'rating': 8.8,
+                  'plot': 'A thief who steals corporate secrets ...'}
+
+
+def make_data_manager(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    user_id = dm.add_user("test_user")
+    return dm, user_id
+
+
+def test_fills_only_empty_fields(tmp_path):
+    dm, user_id = make_data_manager(tmp_path)
+    movie_id = dm.add_movie(title="Inception", user_id=user_id, plot="My own summary")
+
+    worker = EnrichmentWorker(dm, lambda title: OMDB_INCEPTION)
+    worker.submit(movie_id, "Inception").result(timeout=5)
+    worker.shutdown()
+    dm.remove_session()  # like a new request
+
+    movie = dm.get_movie_by_id(movie_id)
+    assert movie.director == 'Christopher Nolan'
+    assert movie.rating == 8.8
+    assert movie.plot == "My own summary"
+    assert [m.is_enriching for m in dm.get_user_movies(user_id)] == [False]
+
+
+def test_retries_with_backoff_then_fails(tmp_path):
+    dm, user_id = make_data_manager(tmp_path)
+    movie_id = dm.add_movie(title="Inception", user_id=user_id)
+    calls = []
+
+    def unreachable(title):
+        calls.append(title)
+        raise requests.exceptions.ConnectionError("OMDb down")
+
+    worker = EnrichmentWorker(dm, unreachable, max_attempts=3, backoff=0.01)
+    dm.create_enrichment_job(movie_id)
+    assert dm.get_user_movies(user_id)[0].is_enriching
+    assert worker.run(movie_id, "Inception") == "failed"
+
+    assert len(calls) == 3
+    movie = dm.get_user_movies(user_id)[0]
+    assert not movie.is_enriching
+    assert movie.enrichment.last_error == "OMDb down"
+    assert dm.get_unfinished_enrichment_jobs() == []
+
+
+def test_processes_resume_each_job_once(tmp_path):
+    dm, user_id = make_data_manager(tmp_path)
+    movie_ids = [dm.add_movie(title=f"Movie {n}", user_id=user_id) for n in range(10)]
+    for movie_id in movie_ids:
+        dm.create_enrichment_job(movie_id)
+    dm.remove_session()
+    lookups = []
+
+    def fetch(title):
+        lookups.append(title)
+        return OMDB_INCEPTION
+
+    # like two forked workers starting after a restart
+    workers = [EnrichmentWorker(SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}"),
+                                fetch, lease=60) for _ in range(2)]
+    claimed = [future.result(timeout=5) for future in
+               [worker.resume_unfinished() for worker in workers]]
+    for worker in workers:
+        worker.shutdown()
+
+    assert sum(claimed) == 10
+    assert sorted(lookups) == sorted(f"Movie {n}" for n in range(10))
+    assert dm.get_unfinished_enrichment_jobs() == []
+
+
+def test_app_resumes_unfinished_jobs_with_its_first_request(tmp_path):
+    dm, user_id = make_data_manager(tmp_path)
+    pending = dm.add_movie(title="Heat", user_id=user_id)
+    stale = dm.add_movie(title="Alien", user_id=user_id)
+    dm.create_enrichment_job(pending)
+    dm.create_enrichment_job(stale)
+    dm.update_enrichment_job(stale, "running", attempts=1)  # its process is gone
+    dm.remove_session()
+
+    with FakeOMDbServer(latency=0) as omdb:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}",
+                          'OMDB_API_URL': omdb.url, 'OMDB_API_KEY': "test",
+                          'OMDB_CACHE_PATH': str(tmp_path / 'omdb.db'),
+                          'OMDB_ENRICHMENT_MODE': 'async', 'OMDB_ENRICHMENT_LEASE': 0,
+                          'FUNFACT_GENERATOR': 'local', 'RATE_LIMIT_PATH': ':memory:'})
+        app.test_client().get("/users")
+        get_enrichment_worker(app).shutdown()
+
+    assert dm.get_unfinished_enrichment_jobs() == []
+    assert all(dm.get_movie_by_id(movie_id).director for movie_id in (pending, stale))
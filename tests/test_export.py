@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+
+import pytest
+
+import export
+from data_manager.sqlite_data_manager import SQLiteDataManager
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    alice = dm.add_user("alice")
+    bob = dm.add_user("bob")
+    for i in range(25):
+        dm.add_movie(title=f"Movie {i}", user_id=alice, year=2000 + i, rating=i % 10,
+                     comment="line one\nline two, \"quoted\"")
+    dm.add_movie(title="Other", user_id=bob)
+    yield dm
+    dm.remove_session()
+
+
+def test_csv_streams_in_chunks(dm, monkeypatch):
+    monkeypatch.setattr(export, "ROWS_PER_CHUNK", 10)
+    chunks = list(export.export_movies(dm.iter_movies(export.EXPORT_FIELDS, user_id=1), "csv"))
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(rows) == 25
+    assert rows[3]["title"] == "Movie 3" and rows[3]["comment"] == "line one\nline two, \"quoted\""
+
+
+def test_jsonl_whole_database(dm):
+    lines = "".join(export.export_movies(dm.iter_movies(export.EXPORT_FIELDS), "jsonl"))
+    movies = [json.loads(line) for line in lines.splitlines()]
+    assert len(movies) == 26
+    assert movies[-1] == dict.fromkeys(export.EXPORT_FIELDS) | {
+        "id": 26, "user_id": 2, "title": "Other"}
+
+
+def test_parquet_row_groups(dm):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    rows = dm.iter_movies(export.EXPORT_FIELDS, user_id=1)
+    data = b"".join(export.export_parquet(rows, row_group_size=10))
+    table = parquet.ParquetFile(io.BytesIO(data))
+    assert table.metadata.num_row_groups == 3
+    assert table.read().column("year").to_pylist()[:2] == [2000, 2001]
+
+
+def test_unknown_format(dm):
+    with pytest.raises(export.ExportError):
+        export.export_movies(iter(()), "xml")
@@ -0,0 +1,114 @@
+import json
+
+from app import create_app, get_funfact_pool
+from benchmarks.fake_servers import FakeDeepSeekServer
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from funfact_pool import DEFAULT_FACT, DeepSeekFactGenerator, FunFactPool, LocalFactGenerator
+
+
+THEMES = {'props': "Craziest movie props ever used", 'oscars': "Shocking Oscar wins"}
+
+
+def make_pool(tmp_path, generator, **kwargs):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    pool = FunFactPool(dm, THEMES, generator, size=4, low_watermark=2, **kwargs)
+    pool.start = lambda: None  # the tests refill, not a background thread
+    return pool, dm
+
+
+def test_refill_and_take(tmp_path):
+    pool, dm = make_pool(tmp_path, LocalFactGenerator())
+    assert pool.refill() == 8
+    assert pool.available('props') == 4
+
+    fact = pool.take('props')
+    assert "craziest movie props" in fact
+    assert pool.available('props') == 3
+
+    # facts survive a restart, the shown one moves to the fallback facts
+    other, _ = make_pool(tmp_path, LocalFactGenerator())
+    other._load()
+    assert other.available('props') == 3
+    assert list(other._fallback['props']) == [fact]
+
+
+def test_refill_below_low_watermark_only(tmp_path):
+    pool, dm = make_pool(tmp_path, LocalFactGenerator())
+    pool.refill()
+    pool.take('props')
+    pool.take('props')
+    assert not pool._refill_needed.is_set()  # at the watermark, not below
+    assert pool.refill() == 0
+    pool.take('props')
+    assert pool._refill_needed.is_set()
+    assert pool.refill() == 3
+    assert pool.available('props') == 4
+
+
+def test_processes_never_show_the_same_fact(tmp_path):
+    pool, dm = make_pool(tmp_path, LocalFactGenerator())
+    pool.refill()
+    other, _ = make_pool(tmp_path, LocalFactGenerator())  # e.g. another gunicorn worker
+    other._load()
+    facts = [process.take('props', fallback=False) for process in (pool, other) * 2]
+    assert len(set(facts)) == 4
+    assert pool.take('props', fallback=False) is None
+    assert other.take('props') in facts
+
+
+def test_upstream_down_falls_back_to_shown_fact(tmp_path):
+    calls = []
+
+    def broken(description):
+        calls.append(description)
+        raise ConnectionError("DeepSeek down")
+
+    pool, dm = make_pool(tmp_path, broken)
+    assert pool.refill() == 0
+    assert len(calls) == 8
+    assert pool.take('props') == DEFAULT_FACT
+
+    pool._fallback['oscars'].append("An earlier fact")
+    assert pool.take('props') == "An earlier fact"
+
+
+def test_deepseek_answers_are_streamed(tmp_path):
+    with FakeDeepSeekServer(latency=0, token_delay=0) as server:
+        generator = DeepSeekFactGenerator("key", url=server.url)
+        pieces = list(generator.stream(THEMES['props']))
+    assert pieces == ["Synthetic", " fun", " fact", " number", " 1."]
+
+
+def test_streamed_facts_are_kept_as_shown(tmp_path):
+    pool, dm = make_pool(tmp_path, LocalFactGenerator())
+    fact = "".join(pool.stream('props'))
+    assert fact.endswith("about craziest movie props ever used.")
+    assert fact in pool._fallback['props']
+    stored = dm.get_funfacts(served=False) + dm.get_funfacts(served=True)
+    assert fact in [row.fact for row in stored]
+
+
+def test_route_streams_when_the_pool_is_empty(tmp_path):
+    with FakeDeepSeekServer(latency=0, token_delay=0) as server:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}",
+                          'FUNFACT_GENERATOR': 'deepseek', 'DEEPSEEK_API_URL': server.url,
+                          'RATE_LIMIT_PATH': ':memory:'})
+        client = app.test_client()
+        page = client.get("/funfact/props")
+        assert b'/funfact/props/stream' in page.data
+
+        response = client.get("/funfact/props/stream")
+        assert response.mimetype == "text/event-stream"
+        events = response.get_data(as_text=True).split("\n\n")
+        text = "".join(json.loads(event[len("data: "):])['text']
+                       for event in events if event.startswith("data: "))
+        assert text.startswith("Synthetic fun fact number")
+        assert events[-2] == "event: done\ndata: {}"
+
+    def broken(description):
+        raise ConnectionError("DeepSeek down")
+
+    get_funfact_pool(app).generator = broken  # the stream ends with another fact
+    event = client.get("/funfact/props/stream").get_data(as_text=True)
+    assert event.startswith("event: error\ndata: ")
+    assert json.loads(event.split("data: ", 1)[1])['fact']
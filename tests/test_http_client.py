@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+import requests
+
+from benchmarks.fake_servers import FakeServer
+from http_client import CircuitOpenError, HTTPClient, UpstreamBusyError
+
+
+class ScriptedServer(FakeServer):
+    """Answers with the given statuses in turn, then with 200."""
+    def __init__(self, statuses=(), latency=0.0):
+        super().__init__(latency=latency)
+        self.statuses = list(statuses)
+
+    def respond(self, handler, body):
+        with self._lock:
+            status = self.statuses.pop(0) if self.statuses else 200
+        return status, {"status": status}
+
+
+@pytest.fixture
+def server():
+    with ScriptedServer() as server:
+        yield server
+
+
+def test_connections_are_kept_alive(server):
+    client = HTTPClient()
+    for _ in range(3):
+        assert client.get(server.url, upstream="fake").status_code == 200
+    stats = client.stats()["fake"]
+    assert (stats["idle_connections"], stats["in_flight"], stats["circuit"]) == \
+        (1, 0, "closed")
+
+
+def test_idempotent_calls_are_retried(server):
+    client = HTTPClient(retries=2, backoff=0.001)
+    server.statuses = [503, 502]
+    assert client.get(server.url).status_code == 200
+    assert server.requests == 3
+
+    server.statuses = [503]
+    assert client.post(server.url, json={}).status_code == 503
+    assert server.requests == 4
+
+
+def test_timeouts_are_retried(server):
+    server.latency = 0.2
+    client = HTTPClient(read_timeout=0.05, retries=1, backoff=0.001)
+    with pytest.raises(requests.exceptions.Timeout):
+        client.get(server.url)
+    assert server.requests == 2
+
+
+def test_breaker_fails_fast_and_recovers(server):
+    client = HTTPClient(retries=0, failure_threshold=2, reset_timeout=0.1)
+    server.statuses = [500, 500]
+    client.get(server.url, upstream="fake")
+    client.get(server.url, upstream="fake")
+    assert client.stats()["fake"]["circuit"] == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get(server.url, upstream="fake")
+    assert server.requests == 2
+
+    threading.Event().wait(0.15)
+    assert client.stats()["fake"]["circuit"] == "half_open"
+    assert client.get(server.url, upstream="fake").status_code == 200
+    assert client.stats()["fake"]["circuit"] == "closed"
+
+
+def test_unexpected_errors_release_the_trial_call(server, monkeypatch):
+    client = HTTPClient(retries=0, failure_threshold=1, reset_timeout=0.05)
+    server.statuses = [500]
+    client.get(server.url, upstream="fake")
+    threading.Event().wait(0.1)  # half open, the next call is the trial
+
+    def broken(*args, **kwargs):
+        raise ValueError("not a requests error")
+
+    monkeypatch.setattr(client.session, "request", broken)
+    with pytest.raises(ValueError):
+        client.get(server.url, upstream="fake")
+    assert client.stats()["fake"]["circuit"] == "open"
+
+    monkeypatch.undo()
+    threading.Event().wait(0.1)
+    assert client.get(server.url, upstream="fake").status_code == 200
+    assert client.stats()["fake"]["circuit"] == "closed"
+
+
+def test_concurrency_is_limited_per_upstream(server):
+    server.latency = 0.3
+    client = HTTPClient(max_concurrency=1, acquire_timeout=0.05)
+    slow = threading.Thread(target=client.get, args=(server.url,))
+    slow.start()
+    threading.Event().wait(0.1)
+    with pytest.raises(UpstreamBusyError):
+        client.get(server.url)
+    slow.join()
+    assert client.get(server.url).status_code == 200
@@ -0,0 +1,114 @@
+import gc
+import logging
+import weakref
+
+from flask import Flask
+import pytest
+import requests
+
+from app import create_app, get_admission_gate
+from data_manager.sqlite_data_manager import SQLiteDataManager
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram("test_seconds", "Test latency", ("route",),
+                                   buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(3, route="/a")
+
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{route="/a"} 3' in text
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    registry.counter("test_total", "Test", ("name",)).inc(name='say "hi"\n')
+    assert 'test_total{name="say \\"hi\\"\\n"} 1' in registry.render()
+
+
+def test_routes_are_timed_by_endpoint():
+    app = Flask(__name__)
+    metrics.instrument_app(app)
+
+    @app.route("/movie/<int:movie_id>")
+    def movie(movie_id):
+        return "ok"
+
+    client = app.test_client()
+    client.get("/movie/1")
+    client.get("/movie/2")
+
+    text = metrics.REGISTRY.render()
+    assert ('movieweb_http_request_duration_seconds_count'
+            '{endpoint="movie",method="GET",status="200"}') in text
+
+
+def test_data_manager_and_sql_are_timed(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    metrics.instrument_engine(dm.engine)
+    metrics.instrument_data_manager(dm)
+    before = metrics.SQL_STATEMENTS.samples()
+
+    user_id = dm.add_user("test_user")
+    dm.add_movie(title="Inception", user_id=user_id)
+    assert [m.title for m in dm.get_user_movies(user_id)] == ["Inception"]
+    list(dm.iter_movies(['title'], user_id=user_id))
+
+    text = metrics.REGISTRY.render()
+    for method in ("add_user", "get_user_movies", "iter_movies"):
+        assert (f'movieweb_data_manager_duration_seconds_count'
+                f'{{method="{method}",outcome="ok"}}') in text
+    assert metrics.SQL_STATEMENTS.samples() != before
+    assert 'movieweb_sql_statements_total{operation="INSERT"}' in text
+
+
+def test_upstream_timeouts_are_counted():
+    with pytest.raises(requests.exceptions.Timeout):
+        with metrics.track_upstream("test_api"):
+            raise requests.exceptions.Timeout()
+    with metrics.track_upstream("test_api") as call:
+        call.status = 200
+
+    text = metrics.REGISTRY.render()
+    assert 'movieweb_upstream_requests_total{upstream="test_api",outcome="timeout"} 1' in text
+    assert 'movieweb_upstream_requests_total{upstream="test_api",outcome="200"} 1' in text
+
+
+def test_log_sampled_respects_rate(caplog):
+    logger = logging.getLogger("test.sampled")
+    with caplog.at_level(logging.INFO, logger="test.sampled"):
+        for _ in range(50):
+            metrics.log_sampled(logger, 0, "never")
+        metrics.log_sampled(logger, 1, "always", title="Inception")
+    assert [record.getMessage() for record in caplog.records] == \
+        ['{"event": "always", "title": "Inception"}']
+
+
+def test_service_gauges_read_the_scraped_app(tmp_path):
+    def build(name):
+        return create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / name}",
+                           'FUNFACT_GENERATOR': 'local', 'RATE_LIMIT_PATH': ':memory:'})
+
+    first = build("first.db")
+    with get_admission_gate(first).admit():
+        text = first.test_client().get("/metrics").get_data(as_text=True)
+    assert 'movieweb_admission_upstream_calls{state="in_flight"} 1' in text
+
+    second = build("second.db")  # doesn't take over the gauges of the first app
+    with get_admission_gate(first).admit():
+        text = first.test_client().get("/metrics").get_data(as_text=True)
+    assert 'movieweb_admission_upstream_calls{state="in_flight"} 1' in text
+    text = second.test_client().get("/metrics").get_data(as_text=True)
+    assert 'movieweb_admission_upstream_calls{state="in_flight"} 0' in text
+
+    released = weakref.ref(second)
+    del second, text
+    gc.collect()
+    assert released() is None
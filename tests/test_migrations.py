@@ -0,0 +1,125 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, inspect
+
+import collection_stats
+from migrations import current_version, LATEST_VERSION, MigrationError, upgrade
+from models import Base
+
+
+PRODUCTION_DB = os.path.join(os.path.dirname(__file__), "..", "data", "movies.db")
+# the columns of the old movies table, joined from user_movies and catalog
+MOVIE_COLUMNS = ("user_movies.id, user_id, user_movies.title, director, writer, actors, year,"
+                 " rating, genre, runtime, plot, comment")
+MOVIE_EXISTS = "SELECT id FROM {} WHERE user_id = 1 AND lower(title) = lower('Heat')"
+
+
+def index_names(engine, table):
+    with engine.connect() as connection:
+        return {row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?"
+            " AND sql IS NOT NULL", (table,))}
+
+
+def query_plan(engine, sql):
+    with engine.connect() as connection:
+        return " ".join(row[3] for row in
+                        connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql))
+
+
+def stats_rows(connection):
+    return (connection.execute("SELECT user_id, movie_count, rated_count, round(rating_sum, 6),"
+                               " runtime_count, runtime_sum FROM collection_stats"
+                               " ORDER BY user_id").fetchall(),
+            connection.execute("SELECT * FROM collection_stat_counts"
+                               " ORDER BY user_id, kind, name").fetchall())
+
+
+def test_fresh_database_matches_models(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'movies.db'}")
+    assert upgrade(engine) == list(range(1, LATEST_VERSION + 1))
+    assert upgrade(engine) == []
+    assert current_version(engine) == LATEST_VERSION
+
+    tables = {name for name in inspect(engine).get_table_names() if "_fts" not in name}
+    assert tables == set(Base.metadata.tables) | {"schema_version"}
+    for table in Base.metadata.sorted_tables:
+        assert index_names(engine, table.name) == {index.name for index in table.indexes}
+
+
+def test_current_database_is_checked_without_a_write_lock(tmp_path):
+    path = tmp_path / "movies.db"
+    upgrade(create_engine(f"sqlite:///{path}"))
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")  # another process is writing
+    try:
+        engine = create_engine(f"sqlite:///{path}", connect_args={'timeout': 0.1})
+        assert upgrade(engine) == []
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_existing_database_keeps_its_data(tmp_path):
+    path = tmp_path / "movies.db"
+    shutil.copy(PRODUCTION_DB, path)
+    with sqlite3.connect(path) as connection:
+        before = connection.execute("SELECT * FROM movies ORDER BY id").fetchall()
+
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade(engine)
+
+    with sqlite3.connect(path) as connection:
+        after = connection.execute(
+            f"SELECT {MOVIE_COLUMNS} FROM user_movies JOIN catalog"
+            " ON catalog.id = user_movies.catalog_id ORDER BY user_movies.id").fetchall()
+        assert after == before
+        # movies with the same metadata share one catalog entry
+        assert connection.execute("SELECT COUNT(*) FROM catalog").fetchone()[0] <= len(before)
+        # the statistics of the existing collections are computed by the migration
+        assert connection.execute(
+            "SELECT SUM(movie_count) FROM collection_stats").fetchone()[0] == len(before)
+        migrated = stats_rows(connection)
+        user_ids = [row[0] for row in connection.execute("SELECT id FROM users")]
+    # the frozen copy in the migration computes what the app computes today
+    with engine.begin() as connection:
+        collection_stats.rebuild(connection, user_ids)
+    with sqlite3.connect(path) as connection:
+        assert stats_rows(connection) == migrated
+        # the normalized titles of the existing movies are computed as well
+        assert connection.execute(
+            "SELECT COUNT(*) FROM user_movies WHERE normalized_title = ''").fetchone()[0] == 0
+        normalized = connection.execute("SELECT normalized_title FROM catalog").fetchone()[0]
+        assert connection.execute(
+            "SELECT COUNT(*) FROM catalog_trigram_fts WHERE catalog_trigram_fts MATCH ?",
+            (f'"{normalized}"',)).fetchone()[0] >= 1
+
+
+def test_explain_query_plan_before_and_after(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'movies.db'}")
+    upgrade(engine, target=1)
+    assert "SCAN movies" in query_plan(engine, MOVIE_EXISTS.format("movies"))
+
+    upgrade(engine, target=2)
+    assert "SEARCH movies USING INDEX ux_movies_user_title" in \
+        query_plan(engine, MOVIE_EXISTS.format("movies"))
+    upgrade(engine)
+    assert "SEARCH user_movies USING INDEX ux_user_movies_user_title" in \
+        query_plan(engine, MOVIE_EXISTS.format("user_movies"))
+
+
+def test_duplicates_abort_without_changes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'movies.db'}")
+    upgrade(engine, target=1)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO users (id, username) VALUES (1, 'a')")
+        connection.exec_driver_sql(
+            "INSERT INTO movies (user_id, title) VALUES (1, 'Heat'), (1, 'heat')")
+
+    with pytest.raises(MigrationError, match="heat"):
+        upgrade(engine)
+    assert current_version(engine) == 1
+    assert index_names(engine, "movies") == set()
@@ -0,0 +1,58 @@
+import time
+
+from omdb_cache import OMDbCache, normalize_title
+
+
+FOUND = {'Response': 'True', 'Title': 'Inception', 'Year': '2010'}
+NOT_FOUND = {'Response': 'False', 'Error': 'Movie not found!'}
+
+
+def make_cache(tmp_path, **kwargs):
+    return OMDbCache(str(tmp_path / "omdb_cache.db"), **kwargs)
+
+
+def test_normalize_title():
+    assert normalize_title("  Inception ") == normalize_title("INCEPTION")
+    assert normalize_title("The  Matrix") == "the matrix"
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("Inception") is None
+    cache.set("Inception", FOUND)
+    assert cache.get(" inception ") == FOUND
+
+    # a fresh instance (e.g. another worker) is served from the SQLite tier
+    other = make_cache(tmp_path)
+    assert other.get("Inception") == FOUND
+    assert other.stats()['disk_hits'] == 1
+    assert cache.stats() == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1,
+                             'hit_ratio': 0.5, 'memory_entries': 1}
+
+
+def test_negative_caching_only_for_not_found(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("Nope", NOT_FOUND)
+    cache.set("Limit", {'Response': 'False', 'Error': 'Request limit reached!'})
+    assert cache.get("nope") == NOT_FOUND
+    assert cache.get("limit") is None
+
+
+def test_ttl_expiry(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.05)
+    cache.set("Inception", FOUND)
+    time.sleep(0.1)
+    assert cache.get("Inception") is None
+
+
+def test_size_bounded_eviction(tmp_path):
+    cache = make_cache(tmp_path, max_memory_entries=2, max_db_entries=3, evict_every=5)
+    count = "SELECT COUNT(*) FROM omdb_cache"
+    for i in range(5):
+        cache.set(f"Movie {i}", dict(FOUND, Title=f"Movie {i}"))
+        if i == 3:  # not evicted before the fifth write
+            assert cache._connect().execute(count).fetchone()[0] == 4
+    assert cache.stats()['memory_entries'] == 2
+    assert cache._connect().execute(count).fetchone()[0] == 3
+    assert cache.get("Movie 0") is None
+    assert cache.get("Movie 4")['Title'] == "Movie 4"
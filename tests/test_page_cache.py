@@ -0,0 +1,90 @@
+import pytest
+
+from app import create_app
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from tests.helpers import assert_num_queries
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    yield dm
+    dm.remove_session()
+
+
+@pytest.fixture
+def client(dm):
+    app = create_app({'DATA_MANAGER': dm, 'FUNFACT_GENERATOR': 'local'})
+    return app.test_client()
+
+
+@pytest.fixture
+def user_id(dm):
+    user_id = dm.add_user("test_user")
+    dm.add_movie(title="Inception", user_id=user_id)
+    return user_id
+
+
+def test_unchanged_collection_is_not_modified(client, dm, user_id):
+    first = client.get(f"/user/{user_id}")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "no-cache"
+    etag = first.headers["ETag"]
+
+    with assert_num_queries(dm.engine, 1):  # only the version lookup
+        response = client.get(f"/user/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    response = client.get(f"/user/{user_id}",
+                          headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert response.status_code == 304
+
+
+def test_writes_change_the_etag(client, dm, user_id):
+    etag = client.get(f"/user/{user_id}").headers["ETag"]
+    movie_id = dm.add_movie(title="Alien", user_id=user_id)
+    response = client.get(f"/user/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"Alien" in response.data
+
+    etag = response.headers["ETag"]
+    dm.update_user_movie(movie_id, {'title': "Aliens"})
+    assert client.get(f"/user/{user_id}", headers={"If-None-Match": etag}).status_code == 200
+    etag = client.get(f"/user/{user_id}").headers["ETag"]
+    dm.delete_movie(movie_id)
+    assert client.get(f"/user/{user_id}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_rendered_pages_are_shared(client, dm, user_id):
+    first = client.get(f"/user/{user_id}?sort=-year")
+    with assert_num_queries(dm.engine, 1):
+        second = client.get(f"/user/{user_id}?sort=-year")
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert client.get(f"/user/{user_id}").headers["ETag"] != first.headers["ETag"]
+
+
+def test_movie_details_and_user_list(client, dm, user_id):
+    movie_id = dm.get_user_movies(user_id)[0].id
+    etag = client.get(f"/movie/{movie_id}").headers["ETag"]
+    assert client.get(f"/movie/{movie_id}",
+                      headers={"If-None-Match": etag}).status_code == 304
+    dm.update_user_movie(movie_id, {'comment': "again"})
+    assert client.get(f"/movie/{movie_id}",
+                      headers={"If-None-Match": etag}).status_code == 200
+
+    etag = client.get("/users").headers["ETag"]
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 304
+    dm.add_user("another_user")
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_pages_with_flashed_messages_are_rendered(client, user_id):
+    etag = client.get(f"/user/{user_id}").headers["ETag"]
+    with client.session_transaction() as session:
+        session['_flashes'] = [("success", "Movie updated successfully!")]
+    response = client.get(f"/user/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"Movie updated successfully!" in response.data
+    assert "ETag" not in response.headers
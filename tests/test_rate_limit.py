@@ -0,0 +1,155 @@
+import io
+import threading
+import time
+
+import pytest
+
+from app import create_app, get_admission_gate, get_data_manager, get_enrichment_worker
+from benchmarks.fake_servers import FakeOMDbServer
+from rate_limit import AdmissionGate, Overloaded, parse_rate, RateLimited, RateLimiter
+
+
+def test_parse_rate():
+    assert parse_rate("30/minute") == (0.5, 30)
+    assert parse_rate("100 / 5 minutes") == (100 / 300, 100)
+    assert parse_rate("") is None
+    with pytest.raises(ValueError):
+        parse_rate("often")
+
+
+def test_buckets_are_shared_and_refill(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("rate_limit.time.time", lambda: now[0])
+    path = str(tmp_path / "rate_limits.db")
+    rules = {'pages': parse_rate("2/minute")}
+    first, second = RateLimiter(path, rules), RateLimiter(path, rules)  # two processes
+
+    first.hit('pages', "1.2.3.4")
+    second.hit('pages', "1.2.3.4")
+    with pytest.raises(RateLimited) as error:
+        first.hit('pages', "1.2.3.4")
+    assert error.value.retry_after == 30
+    second.hit('pages', "5.6.7.8")  # every client has its own bucket
+    first.hit('unlimited', "1.2.3.4")
+
+    now[0] += 30
+    second.hit('pages', "1.2.3.4")
+    with pytest.raises(RateLimited):
+        first.hit('pages', "1.2.3.4")
+
+    first.hit('pages', "9.9.9.9", cost=5)  # more than a bucket holds takes all of it
+    with pytest.raises(RateLimited):
+        first.hit('pages', "9.9.9.9")
+
+
+def test_gate_queues_and_sheds():
+    gate = AdmissionGate(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    with gate.admit():
+        with pytest.raises(Overloaded, match="queue timeout"):
+            with gate.admit():
+                pass
+        gate.queued = 1  # as if another caller were waiting already
+        with pytest.raises(Overloaded, match="queue full"):
+            with gate.admit():
+                pass
+        gate.queued = 0
+
+    # a queued caller gets the slot as soon as it is free
+    gate.queue_timeout = 5
+    entered = threading.Event()
+
+    def hold():
+        with gate.admit():
+            entered.set()
+            time.sleep(0.05)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait()
+    with gate.admit():
+        assert gate.stats() == {'in_flight': 1, 'queued': 0}
+    holder.join()
+
+
+def test_routes_answer_429_and_503(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}",
+                      'FUNFACT_GENERATOR': 'local', 'RATE_LIMIT_PATH': ':memory:',
+                      'RATE_LIMIT_FUNFACT_IP': '1/minute', 'UPSTREAM_MAX_IN_FLIGHT': 1,
+                      'UPSTREAM_MAX_QUEUE': 0, 'OMDB_CACHE_PATH': str(tmp_path / 'omdb.db')})
+    client = app.test_client()
+    assert client.get("/funfact/props").status_code == 200
+    response = client.get("/")
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == "60"
+
+    user_id = get_data_manager(app).add_user("test_user")
+    with get_admission_gate(app).admit():  # the one upstream slot is taken
+        response = client.post(f"/add_movie/{user_id}", data={'title': "Heat"})
+    assert response.status_code == 503
+    assert not get_data_manager(app).movie_exists(user_id, "Heat")
+
+
+@pytest.mark.parametrize("trusted_proxies, limited", [(0, True), (1, False)])
+def test_clients_behind_a_proxy_have_own_buckets(tmp_path, trusted_proxies, limited):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}",
+                      'FUNFACT_GENERATOR': 'local', 'RATE_LIMIT_PATH': ':memory:',
+                      'RATE_LIMIT_FUNFACT_IP': '1/minute', 'TRUSTED_PROXIES': trusted_proxies})
+    client = app.test_client()
+    proxy = {'REMOTE_ADDR': "10.0.0.1"}
+    assert client.get("/", headers={'X-Forwarded-For': "1.2.3.4"},
+                      environ_base=proxy).status_code == 200
+    response = client.get("/", headers={'X-Forwarded-For': "5.6.7.8"}, environ_base=proxy)
+    assert (response.status_code == 429) == limited
+
+
+def test_bulk_enrichment_takes_a_token_per_movie(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}",
+                      'FUNFACT_GENERATOR': 'local', 'RATE_LIMIT_PATH': ':memory:',
+                      'RATE_LIMIT_ENRICH_USER': '3/minute', 'AUTOCOMPLETE_REFRESH_INTERVAL': 0,
+                      'OMDB_CACHE_PATH': str(tmp_path / 'omdb.db')})
+    client = app.test_client()
+    user_id = get_data_manager(app).add_user("test_user")
+    url = f"/api/v1/users/{user_id}/movies?enrich=1"
+    with FakeOMDbServer(latency=0) as omdb:
+        app.config['OMDB_API_URL'] = omdb.url
+        assert client.post(url, json=[{'title': "Heat"}, {'title': "Alien"}]).status_code == 202
+        response = client.post(url, json=[{'title': "Ronin"}, {'title': "Thief"}])
+        assert response.status_code == 429
+        assert response.json['error'] == "Too Many Requests"
+        assert response.headers['Retry-After'] == "20"
+        assert not get_data_manager(app).movie_exists(user_id, "Ronin")
+        assert client.post(url, json=[{'title': "Thief"}]).status_code == 202
+        assert client.post(url, json=[{'title': "Collateral"}]).status_code == 429
+        # nothing to look up, nothing to pay
+        assert client.post(url, json=[{'title': "Ronin", 'director': "John Frankenheimer",
+                                       'year': 1998, 'genre': "Action", 'plot': "...",
+                                       'writer': "J. D. Zeik", 'actors': "Robert De Niro",
+                                       'runtime': "122 min", 'rating': 7.2}]).status_code == 201
+        with app.app_context():
+            get_enrichment_worker().shutdown()
+
+
+def test_import_lookups_are_limited(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'movies.db'}",
+                      'FUNFACT_GENERATOR': 'local', 'RATE_LIMIT_PATH': ':memory:',
+                      'RATE_LIMIT_ENRICH_IP': '2/minute', 'UPSTREAM_MAX_IN_FLIGHT': 1,
+                      'UPSTREAM_MAX_QUEUE': 0, 'OMDB_CACHE_PATH': str(tmp_path / 'omdb.db')})
+    client = app.test_client()
+    user_id = get_data_manager(app).add_user("test_user")
+
+    def upload(*titles):
+        csv = "title\n" + "".join(f"{title}\n" for title in titles)
+        return client.post(f"/user/{user_id}/import", data={
+            'file': (io.BytesIO(csv.encode()), "movies.csv"), 'enrich': "1"})
+
+    with FakeOMDbServer(latency=0) as omdb:
+        app.config['OMDB_API_URL'] = omdb.url
+        with get_admission_gate(app).admit():  # the one upstream slot is taken
+            assert upload("Heat").status_code == 302
+        assert omdb.requests == 0
+
+        assert upload("Alien", "Ronin", "Thief").status_code == 302
+        # the shed lookup of Heat took a token as well, one is left for the three rows
+        assert omdb.requests == 1
+    movies = get_data_manager(app).get_user_movies(user_id)
+    assert len(movies) == 4 and sum(1 for movie in movies if movie.director) == 1
@@ -0,0 +1,96 @@
+import pytest
+
+from app import create_app, get_recommender
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from recommendations import build_index, collections, RecommendationIndex, Recommender
+
+
+# (user_id, catalog_id, rating) ordered by user: 1 and 2 go together, 3 is on its own
+ROWS = [(1, 1, 9.0), (1, 2, 8.0), (2, 1, 7.0), (2, 2, 9.0), (2, 3, 2.0),
+        (3, 4, None), (4, 1, 10.0), (4, 3, 5.0), (5, 1, 8.0)]
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    yield dm
+    dm.remove_session()
+
+
+def test_collections_are_grouped_and_capped():
+    grouped = list(collections(iter(ROWS), max_collection=2))
+    assert [[catalog_id for catalog_id, _ in movies] for movies in grouped] == \
+        [[1, 2], [2, 1], [4], [1, 3], [1]]
+
+
+def test_build_and_lookup(tmp_path):
+    path = tmp_path / "recommendations.idx"
+    assert build_index(lambda: iter(ROWS), path) == 4
+    index = RecommendationIndex(path)
+    assert [catalog_id for catalog_id, _ in index.similar(1)] == [2, 3]
+    assert index.similar(4) == [] and index.similar(99) == []
+
+    assert [catalog_id for catalog_id, _ in index.recommend([(1, 10.0)])] == [2, 3]
+    assert [catalog_id for catalog_id, _ in index.recommend([(1, 10.0), (2, None)])] == [3]
+    assert index.recommend([(99, 5.0)]) == []
+
+
+def test_passes_over_entry_ranges_build_the_same_index(tmp_path):
+    build_index(lambda: iter(ROWS), tmp_path / "one.idx")
+    build_index(lambda: iter(ROWS), tmp_path / "many.idx", max_pairs=1)
+    assert (tmp_path / "one.idx").read_bytes()[40:] == (tmp_path / "many.idx").read_bytes()[40:]
+
+
+def test_movies_added_between_passes_are_left_out(tmp_path):
+    passes = []
+
+    def rows():
+        passes.append(True)
+        # a new movie in a collection and a new collection after the first pass
+        added = [] if len(passes) == 1 else [(5, 7, 6.0), (6, 8, 7.0), (6, 9, 8.0)]
+        return iter(ROWS + added)
+
+    path = tmp_path / "recommendations.idx"
+    assert build_index(rows, path) == 4 and len(passes) > 1
+    build_index(lambda: iter(ROWS), tmp_path / "expected.idx")
+    assert path.read_bytes()[40:] == (tmp_path / "expected.idx").read_bytes()[40:]
+
+
+def test_recommender_rebuilds_after_changes(dm, tmp_path):
+    first, second = dm.add_user("first"), dm.add_user("second")
+    for user_id in (first, second):
+        dm.add_movie(title="Heat", user_id=user_id, imdb_id="tt0113277")
+    dm.add_movie(title="Collateral", user_id=second, imdb_id="tt0369339", rating=9.0)
+    recommender = Recommender(dm, str(tmp_path / "recommendations.idx"))
+    assert recommender.recommend(first) == []  # no index yet
+
+    assert recommender.refresh()
+    assert not recommender.refresh()  # nothing changed
+    (catalog_id, _), = recommender.recommend(first)
+    assert [entry.title for entry in dm.get_catalog_entries([catalog_id, -1])] == ["Collateral"]
+
+    dm.add_movie(title="Thief", user_id=second, imdb_id="tt0083190")
+    assert recommender.refresh()
+    assert len(recommender.recommend(first)) == 2
+
+
+def test_recommendations_page(dm, tmp_path):
+    first, second = dm.add_user("first"), dm.add_user("second")
+    dm.add_movie(title="Heat", user_id=first, imdb_id="tt0113277")
+    dm.add_movies_bulk([{'title': "Heat", 'user_id': second, 'imdb_id': "tt0113277"},
+                        {'title': "Collateral", 'user_id': second, 'imdb_id': "tt0369339"}])
+    dm.add_movie(title="collateral", director="Mann", user_id=dm.add_user("third"))
+    app = create_app({'DATA_MANAGER': dm, 'FUNFACT_GENERATOR': 'local',
+                      'RECOMMENDATIONS_PATH': str(tmp_path / "recommendations.idx"),
+                      'RECOMMENDATIONS_REFRESH_INTERVAL': 0})
+    client = app.test_client()
+    assert b"being computed" in client.get(f"/user/{first}/recommendations").data
+
+    get_recommender(app).refresh()
+    page = client.get(f"/user/{first}/recommendations")
+    assert b"Collateral" in page.data
+    assert client.get(f"/user/{first}/recommendations",
+                      headers={"If-None-Match": page.headers["ETag"]}).status_code == 304
+    # already in the collection under a title of its own
+    dm.add_movie(title="COLLATERAL", user_id=first)
+    assert b"Collateral" not in client.get(f"/user/{first}/recommendations").data
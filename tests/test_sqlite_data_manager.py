@@ -0,0 +1,116 @@
+import pytest
+
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from tests.helpers import assert_num_queries, count_queries
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    yield dm
+    dm.remove_session()
+
+
+@pytest.fixture
+def user_id(dm):
+    user_id = dm.add_user("test_user")
+    for title in ("Inception", "Alien", "Heat"):
+        dm.add_movie(title=title, user_id=user_id, rating=8.0)
+    dm.remove_session()
+    return user_id
+
+
+def test_user_with_movies_is_one_round_trip(dm, user_id):
+    with assert_num_queries(dm.engine, 1):
+        user = dm.get_user_with_movies(user_id)
+        # everything movie_list.html touches
+        rows = [(m.title, m.director, m.year, m.rating, m.is_enriching) for m in user.movies]
+    assert user.username == "test_user"
+    assert sorted(row[0] for row in rows) == ["Alien", "Heat", "Inception"]
+
+
+def test_movie_with_user_is_one_round_trip(dm, user_id):
+    movie_id = dm.get_user_movies(user_id)[0].id
+    dm.remove_session()
+    with assert_num_queries(dm.engine, 1):
+        movie = dm.get_movie_with_user(movie_id)
+        assert movie.user.username == "test_user"
+
+
+def test_objects_stay_attached_after_commit(dm, user_id):
+    movie = dm.get_user_movies(user_id)[0]
+    assert dm.update_user_movie(movie.id, {"comment": "great"})
+    with assert_num_queries(dm.engine, 0):
+        assert movie.comment == "great"
+    # no DetachedInstanceError for relationships that were not loaded eagerly
+    with assert_num_queries(dm.engine, 1):
+        assert movie.user.username == "test_user"
+
+
+def test_keyset_pagination_walks_forward_and_back(dm):
+    user_id = dm.add_user("collector")
+    for i in range(7):
+        dm.add_movie(title=f"Movie {i}", user_id=user_id, year=2000 + i % 3,
+                     rating=None if i == 0 else float(i))
+
+    first = dm.get_user_movies_page(user_id, sort="-year", page_size=3)
+    second = dm.get_user_movies_page(user_id, sort="-year", page_size=3,
+                                     cursor=first.next_cursor)
+    third = dm.get_user_movies_page(user_id, sort="-year", page_size=3,
+                                    cursor=second.next_cursor)
+    seen = [m.title for page in (first, second, third) for m in page]
+    assert seen == ["Movie 5", "Movie 2", "Movie 4", "Movie 1",
+                    "Movie 6", "Movie 3", "Movie 0"]
+    assert first.prev_cursor is None and third.next_cursor is None
+
+    back = dm.get_user_movies_page(user_id, sort="-year", page_size=3,
+                                   cursor=third.prev_cursor)
+    assert [m.title for m in back] == [m.title for m in second]
+
+    ratings = dm.get_user_movies_page(user_id, sort="rating", page_size=100)
+    assert [m.title for m in ratings][0] == "Movie 0"  # NULL ratings first
+
+
+def test_pagination_rejects_bad_input(dm, user_id):
+    with pytest.raises(ValueError):
+        dm.get_user_movies_page(user_id, sort="director")
+    with pytest.raises(ValueError):
+        dm.get_users_page(cursor="not-a-cursor")
+    assert len(dm.get_users_page(page_size=10_000).items) == 1
+
+
+def test_pages_are_index_range_scans(dm, user_id):
+    page = dm.get_user_movies_page(user_id, sort="title", page_size=1)
+    with count_queries(dm.engine) as counter:
+        dm.get_user_movies_page(user_id, sort="title", page_size=1, cursor=page.next_cursor)
+    with dm.engine.connect() as connection:
+        plan = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + counter.statements[0],
+                                          counter.parameters[0]).fetchall()
+    assert "SEARCH user_movies USING INDEX ux_user_movies_user_title (user_id=? AND <expr>>?)" \
+        in [row[3] for row in plan]
+
+
+def test_search_is_ranked_prefix_match_kept_in_sync(dm):
+    alice = dm.add_user("alice")
+    bob = dm.add_user("bob")
+    dm.add_movie(title="Inception", director="Christopher Nolan", user_id=alice)
+    dm.add_movie(title="Dream Team", plot="The inception of a team", user_id=bob)
+    heat = dm.add_movie(title="Heat", director="Michael Mann", user_id=alice)
+
+    assert [m.title for m in dm.search_movies("incep")] == ["Inception", "Dream Team"]
+    assert [m.title for m in dm.search_movies("incep", user_id=bob)] == ["Dream Team"]
+    assert dm.search_movies('"; DROP TABLE movies; --').items == []
+
+    dm.update_user_movie(heat, {"comment": "Best shootout ever"})
+    assert [m.title for m in dm.search_movies("shoot")] == ["Heat"]
+    dm.delete_movie(heat)
+    assert dm.search_movies("shoot").items == []
+
+
+def test_search_pages(dm, user_id):
+    first = dm.search_movies("", page_size=1)
+    assert first.items == []
+    for title in ("Alien", "Aliens", "Alien 3"):
+        dm.add_movie(title=title + " Night", user_id=user_id)
+    page = dm.search_movies("night", page=2, page_size=2)
+    assert len(page) == 1 and page.prev_cursor == 1 and page.next_cursor is None
@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+
+from sqlalchemy import text
+
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from data_manager.sqlite_engine import parse_pragmas
+
+
+def pragma(dm, name):
+    with dm.engine.connect() as connection:
+        return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_profile_is_applied(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}")
+    assert pragma(dm, "journal_mode") == "wal"
+    assert pragma(dm, "synchronous") == 1  # NORMAL
+    assert pragma(dm, "temp_store") == 2  # MEMORY
+    assert pragma(dm, "busy_timeout") == 5000
+    assert pragma(dm, "cache_size") == -32000
+
+
+def test_profile_overrides(tmp_path):
+    dm = SQLiteDataManager(f"sqlite:///{tmp_path / 'movies.db'}",
+                           pragmas=parse_pragmas("journal_mode=DELETE, cache_size=-1000"))
+    assert pragma(dm, "journal_mode") == "delete"
+    assert pragma(dm, "cache_size") == -1000
+
+
+def test_memory_database_skips_file_pragmas():
+    dm = SQLiteDataManager("sqlite:///:memory:")
+    assert pragma(dm, "journal_mode") == "memory"
+    assert dm.add_user("test_user")
+
+
+def test_memory_database_is_shared_by_threads():
+    dm = SQLiteDataManager("sqlite:///:memory:")
+    dm.add_user("test_user")
+    users = []
+    thread = threading.Thread(target=lambda: users.extend(dm.get_all_users()))
+    thread.start()
+    thread.join()
+    assert [user.username for user in users] == ["test_user"]
+
+
+def lock_database(path):
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute("BEGIN IMMEDIATE")
+    return connection
+
+
+def test_write_is_retried_until_the_lock_is_gone(tmp_path):
+    path = tmp_path / 'movies.db'
+    dm = SQLiteDataManager(f"sqlite:///{path}", pragmas={'busy_timeout': 10},
+                           lock_retries=8, lock_backoff=0.02)
+    user_id = dm.add_user("test_user")
+
+    locker = lock_database(path)
+    threading.Timer(0.15, locker.rollback).start()
+    assert dm.add_movie(title="Inception", user_id=user_id) is not None
+    locker.close()
+
+
+def test_write_gives_up_after_the_retries(tmp_path, caplog):
+    path = tmp_path / 'movies.db'
+    dm = SQLiteDataManager(f"sqlite:///{path}", pragmas={'busy_timeout': 10},
+                           lock_retries=2, lock_backoff=0.01)
+    user_id = dm.add_user("test_user")
+
+    locker = lock_database(path)
+    try:
+        assert dm.add_movie(title="Inception", user_id=user_id) is None
+    finally:
+        locker.rollback()
+        locker.close()
+    assert "still locked after 3 attempts" in caplog.text
+    assert dm.add_movie(title="Inception", user_id=user_id) is not None
@@ -0,0 +1,40 @@
+import pytest
+
+from titles import normalize_title, same_release, similarity, split_year
+
+
+@pytest.mark.parametrize("title, normalized", [
+    ("Inception", "inception"),
+    ("  inception ", "inception"),
+    ("Inception (2010)", "inception"),
+    ("Heat [1995]", "heat"),
+    ("The Matrix", "matrix"),
+    ("Matrix, The", "matrix"),
+    ("Amélie", "amelie"),
+    ("ＡＬＩＥＮ", "alien"),
+    ("Spider-Man: No Way Home", "spiderman no way home"),
+    ("Schindler’s List", "schindlers list"),
+    ("A", "a"),
+    ("1917", "1917"),
+    ("!!!", "!!!"),
+])
+def test_normalize_title(title, normalized):
+    assert normalize_title(title) == normalized
+
+
+def test_split_year():
+    assert split_year("Heat (1995)") == ("Heat", 1995)
+    assert split_year("1917") == ("1917", None)
+    assert split_year("Room (101)") == ("Room (101)", None)
+
+
+def test_same_release():
+    assert same_release(None, 1984)
+    assert same_release(2021, 2021)
+    assert not same_release(1984, 2021)
+
+
+def test_similarity():
+    assert similarity("inception", "inception") == 1.0
+    assert similarity("inception", "inceptoin") > similarity("inception", "interstellar")
+    assert similarity("alien", "heat") == 0.0
@@ -0,0 +1,84 @@
+"""
+Title normalization for the MovieWeb application, used to find duplicates and similar
+titles. "Inception", "inception ", "Inception (2010)" and "The Matrix"/"Matrix, The"
+are the same movie to a user, so every title is stored with a normalized form
+(user_movies.normalized_title and catalog.normalized_title, both indexed) and a
+duplicate check is one index lookup of normalize_title(title).
+Changing normalize_title changes the stored keys: add a migration that recomputes the
+normalized_title columns with it.
+Similar titles are found with trigrams (the three character substrings of the
+normalized title), see find_similar_titles of the data managers.
+"""
+
+import re
+import unicodedata
+
+
+# a release year at the end: "Heat (1995)", "Heat [1995]"
+TRAILING_YEAR = re.compile(r"\s*[(\[]\s*(\d{4})\s*[)\]]\s*$")
+LEADING_ARTICLE = re.compile(r"^(?:the|a|an)\s+(?=\S)")
+# library style "Matrix, The"
+TRAILING_ARTICLE = re.compile(r",\s*(?:the|a|an)$")
+# removed, so "Schindler's List", "Spider-Man" and "Spiderman" match
+JOINERS = re.compile(r"['’ʼ`\-‐‑–.]")
+SEPARATORS = re.compile(r"[\W_]+")
+
+MIN_YEAR, MAX_YEAR = 1870, 2100
+
+
+def split_year(title):
+    """Split a release year off the end of a title.
+        Args: title (str): Title as typed, e.g. "Heat (1995)"
+        Returns: tuple: (title without the year, year as int or None)
+    """
+    match = TRAILING_YEAR.search(title or "")
+    if match and MIN_YEAR <= int(match.group(1)) <= MAX_YEAR:
+        return title[:match.start()].strip(), int(match.group(1))
+    return (title or "").strip(), None
+
+
+def normalize_title(title):
+    """Normalized form of a title: without diacritics, case folded, without the release
+    year, leading or trailing article and punctuation, whitespace collapsed.
+        Args: title (str): Title as typed
+        Returns: str: e.g. "matrix" for "The Matrix (1999)", "" for an empty title
+    """
+    title, _ = split_year(title)
+    folded = unicodedata.normalize("NFKD", title)
+    folded = "".join(char for char in folded if not unicodedata.combining(char)).casefold()
+    folded = TRAILING_ARTICLE.sub("", folded)
+    folded = SEPARATORS.sub(" ", JOINERS.sub("", folded)).strip()
+    # a title of only punctuation keeps its characters
+    return LEADING_ARTICLE.sub("", folded) or " ".join(title.split()).casefold()
+
+
+def same_release(year, other_year):
+    """True unless both years are known and differ ("Dune (1984)" isn't "Dune (2021)")."""
+    return year is None or other_year is None or year == other_year
+
+
+def trigrams(normalized, padded=False):
+    """Three character substrings of a normalized title.
+        Args: normalized (str): Result of normalize_title
+              padded (bool): Pad the words with spaces like PostgreSQL's pg_trgm, so
+                  matching word beginnings count more (for ranking, not for the index)
+        Returns: Set[str]
+    """
+    if padded:
+        return {gram for word in normalized.split()
+                for gram in _grams(f"  {word} ")}
+    return _grams(normalized)
+
+
+def _grams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(a, b):
+    """Share of the trigrams of two normalized titles that they have in common.
+        Returns: float: 0.0 (nothing in common) to 1.0 (same title)
+    """
+    grams_a, grams_b = trigrams(a, padded=True), trigrams(b, padded=True)
+    if not grams_a or not grams_b:
+        return 1.0 if a == b else 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)